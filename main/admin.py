@@ -17,10 +17,10 @@ admin.site.register(Exam_Model)
 
 @admin.register(ReferenceAnswer)
 class ReferenceAnswerAdmin(admin.ModelAdmin):
-    list_display = ['question', 'professor', 'has_text_answer', 'has_image_answer', 'has_ocr_text', 'created_at']
-    list_filter = ['professor', 'created_at']
+    list_display = ['question', 'professor', 'has_text_answer', 'has_image_answer', 'has_ocr_text', 'analysis_status', 'created_at']
+    list_filter = ['professor', 'analysis_status', 'created_at']
     search_fields = ['question__question', 'professor__username']
-    readonly_fields = ['ocr_text', 'tfidf_vector', 'created_at', 'updated_at']
+    readonly_fields = ['ocr_text', 'tfidf_vector', 'analysis', 'analysis_status', 'image_sha256', 'text_sha256', 'created_at', 'updated_at']
     
     def has_text_answer(self, obj):
         return bool(obj.text_answer)
@@ -42,10 +42,10 @@ class ReferenceAnswerAdmin(admin.ModelAdmin):
             'fields': ('question', 'professor')
         }),
         ('Answer Content', {
-            'fields': ('text_answer', 'image_answer')
+            'fields': ('text_answer', 'image_answer', 'key_phrases')
         }),
         ('OCR & Analysis', {
-            'fields': ('ocr_text', 'tfidf_vector'),
+            'fields': ('analysis_status', 'ocr_text', 'tfidf_vector', 'analysis', 'image_sha256', 'text_sha256'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
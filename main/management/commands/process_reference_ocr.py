@@ -1,40 +1,165 @@
+"""
+Management command to OCR reference answer images across a process pool
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import logging
+import os
+
+import django
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections
+
 from main.models.reference_answer import ReferenceAnswer
+from student.utils import file_sha256
+
+logger = logging.getLogger(__name__)
+
+# Kept with other OCR state under MEDIA_ROOT (ignored by git) unless REFERENCE_OCR_CHECKPOINT says otherwise
+DEFAULT_CHECKPOINT = getattr(
+    settings,
+    'REFERENCE_OCR_CHECKPOINT',
+    os.path.join(settings.MEDIA_ROOT, 'ocr_state', 'process_reference_ocr.checkpoint.json')
+)
+
+
+def _init_worker():
+    """
+    Make Django usable in a pool worker. Each worker is already one of
+    --workers processes, so its OCR configs run inline instead of in a
+    nested OCR pool per worker.
+    """
+    django.setup()
+    from student.ocr import pool
+    pool.OCR_POOL_WORKERS = 0
+
+
+def ocr_reference(ref_id):
+    """
+    OCR the image of one reference answer without saving it.
+    Returns: (ref_id, ocr_text, error)
+    """
+    from student.utils import extract_text_from_image
+
+    ref_answer = ReferenceAnswer.objects.get(pk=ref_id) # type: ignore
+    ocr_text, error = extract_text_from_image(ref_answer.image_answer, source='reference_answer')
+    return ref_id, ocr_text, error
+
 
 class Command(BaseCommand):
-    help = 'Process OCR for all reference answers that have images but no OCR text'
+    help = 'Process OCR for reference answers with images, once per image, resuming from a checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of OCR processes (default: all cores, 1 runs inline)'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Consider every reference answer with an image, not only those without OCR text'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=DEFAULT_CHECKPOINT,
+            help=f'File recording the image hash of every processed answer (default: {DEFAULT_CHECKPOINT})'
+        )
+        parser.add_argument('--force', action='store_true', help='OCR images even if unchanged since the last run')
 
     def handle(self, *args, **options):
         self.stdout.write('Processing OCR for reference answers...')
-        
-        # Get all reference answers with images but no OCR text
-        reference_answers = ReferenceAnswer.objects.filter( # type: ignore
-            image_answer__isnull=False,
-            ocr_text__isnull=True
-        )
-        
-        self.stdout.write(f'Found {reference_answers.count()} reference answers to process')
-        
+        force = options['force']
+        checkpoint = {} if force else self.load_checkpoint(options['checkpoint'])
+
+        reference_answers = ReferenceAnswer.objects.exclude(image_answer='').exclude(image_answer__isnull=True) # type: ignore
+        if not options['all']:
+            reference_answers = reference_answers.filter(ocr_text__isnull=True)
+
+        # Hash every image up front: images unchanged since their OCR text was read
+        # and answers finished by an interrupted run are skipped
+        hashes = {}
+        skipped = 0
+        for ref_answer in reference_answers.order_by('pk'):
+            try:
+                sha256 = file_sha256(ref_answer.image_answer)
+            except OSError as e:
+                self.stdout.write(self.style.ERROR(f'Cannot read image of reference answer {ref_answer.pk}: {e}')) # type: ignore
+                continue
+            unchanged = sha256 in (checkpoint.get(str(ref_answer.pk)), ref_answer.image_sha256)
+            if unchanged and ref_answer.ocr_text and not force:
+                skipped += 1
+                continue
+            hashes[ref_answer.pk] = sha256
+
+        self.stdout.write(f'Found {len(hashes)} reference answers to process ({skipped} unchanged since the last run)')
+
         processed_count = 0
         failed_count = 0
-        
-        for ref_answer in reference_answers:
-            self.stdout.write(f'Processing reference answer {ref_answer.pk}...')
-            
-            if ref_answer.process_ocr():
-                ref_answer.save()
+        for ref_id, ocr_text, error in self.run_ocr(list(hashes), max(1, options['workers'])):
+            if self.save_result(ref_id, ocr_text, error):
                 processed_count += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f'Successfully processed OCR for reference answer {ref_answer.pk}') # type: ignore # type: ignore
-                )
+                checkpoint[str(ref_id)] = hashes[ref_id]
+                self.save_checkpoint(options['checkpoint'], checkpoint)
             else:
                 failed_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'Failed to process OCR for reference answer {ref_answer.pk}') # type: ignore
-                )
-        
+
         self.stdout.write(
             self.style.SUCCESS( # type: ignore
-                f'OCR processing complete! Processed: {processed_count}, Failed: {failed_count}' # type: ignore
+                f'OCR processing complete! Processed: {processed_count}, Failed: {failed_count}, Skipped: {skipped}'
+            )
+        )
+
+    def run_ocr(self, ref_ids, workers):
+        """Yield (ref_id, ocr_text, error) as each image finishes"""
+        if workers == 1 or len(ref_ids) <= 1:
+            for ref_id in ref_ids:
+                self.stdout.write(f'Processing reference answer {ref_id}...')
+                yield ocr_reference(ref_id)
+            return
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = {executor.submit(ocr_reference, ref_id): ref_id for ref_id in ref_ids}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    logger.error(f"Error processing OCR for reference answer {futures[future]}: {e}")
+                    yield futures[future], None, str(e)
+
+    def save_result(self, ref_id, ocr_text, error):
+        """Store OCR text without OCR-ing the image again in save()"""
+        if not ocr_text:
+            self.stdout.write(
+                self.style.ERROR(f'Failed to process OCR for reference answer {ref_id}: {error}') # type: ignore
             )
-        ) 
\ No newline at end of file
+            return False
+        ref_answer = ReferenceAnswer.objects.get(pk=ref_id) # type: ignore
+        ref_answer.ocr_text = ocr_text
+        ref_answer.save(skip_ocr=True)
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully processed OCR for reference answer {ref_id}') # type: ignore
+        )
+        return True
+
+    def load_checkpoint(self, path):
+        try:
+            with open(path) as checkpoint_file:
+                return json.load(checkpoint_file)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            self.stdout.write(self.style.WARNING(f'Ignoring unreadable checkpoint {path}')) # type: ignore
+            return {}
+
+    def save_checkpoint(self, path, checkpoint):
+        """Write the checkpoint atomically so an interrupted run never leaves it half written"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(temporary, path)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_add_database_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='referenceanswer',
+            name='analysis',
+            field=models.JSONField(blank=True, help_text='Compiled reference analysis used by grading', null=True),
+        ),
+    ]
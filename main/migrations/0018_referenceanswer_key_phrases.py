@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_referenceanswer_analysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='referenceanswer',
+            name='key_phrases',
+            field=models.TextField(blank=True, help_text='Key phrases to look for in student answers, one per line', null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_referenceanswer_key_phrases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam_model',
+            name='similarity_backend',
+            field=models.CharField(blank=True, choices=[('', 'Default'), ('tfidf', 'TF-IDF cosine'), ('bm25', 'Okapi BM25'), ('char_ngram', 'Hashed character n-grams'), ('minhash', 'MinHash Jaccard')], default='', help_text='Similarity backend for questions that do not choose one', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='question_db',
+            name='similarity_backend',
+            field=models.CharField(blank=True, choices=[('', 'Default'), ('tfidf', 'TF-IDF cosine'), ('bm25', 'Okapi BM25'), ('char_ngram', 'Hashed character n-grams'), ('minhash', 'MinHash Jaccard')], default='', help_text='Similarity backend used to grade answers to this question', max_length=20),
+        ),
+    ]
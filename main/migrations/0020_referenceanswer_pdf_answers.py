@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:00
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_similarity_backend'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='referenceanswer',
+            name='image_answer',
+            field=models.FileField(blank=True, help_text='Reference handwritten answer image or multi-page PDF', null=True, upload_to='reference_answers/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png', 'gif', 'bmp', 'pdf'])]),
+        ),
+    ]
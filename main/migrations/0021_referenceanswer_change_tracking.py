@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_referenceanswer_pdf_answers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='referenceanswer',
+            name='image_sha256',
+            field=models.CharField(blank=True, help_text='SHA-256 of the image the OCR text was read from', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='referenceanswer',
+            name='text_sha256',
+            field=models.CharField(blank=True, help_text='SHA-256 of the text the TF-IDF vector and analysis were built from', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='referenceanswer',
+            name='analysis_status',
+            field=models.CharField(choices=[('ready', 'Ready'), ('pending', 'Pending analysis'), ('failed', 'Analysis failed')], default='ready', max_length=10),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 22:00
+
+from django.db import migrations, models
+import main.models.question
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_referenceanswer_change_tracking'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exam_model',
+            name='similarity_backend',
+            field=models.CharField(blank=True, choices=main.models.question.similarity_backend_choices, default='', help_text='Similarity backend for questions that do not choose one', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='question_db',
+            name='similarity_backend',
+            field=models.CharField(blank=True, choices=main.models.question.similarity_backend_choices, default='', help_text='Similarity backend used to grade answers to this question', max_length=20),
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from .group import Special_Students
 from .question_paper import Question_Paper
+from .question import similarity_backend_choices
 
 class Exam_Model(models.Model):
     professor = models.ForeignKey(User, limit_choices_to={'groups__name': "Professor"}, on_delete=models.CASCADE)
@@ -14,6 +15,8 @@ class Exam_Model(models.Model):
     student_group = models.ManyToManyField(Special_Students, related_name='exams')
     start_time = models.DateTimeField(default=timezone.now)
     end_time = models.DateTimeField(default=timezone.now)
+    similarity_backend = models.CharField(max_length=20, choices=similarity_backend_choices, blank=True, default='',
+                                          help_text="Similarity backend for questions that do not choose one")
 
     def __str__(self):
         return self.name
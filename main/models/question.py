@@ -2,6 +2,11 @@ from django.db import models
 from django.forms import ModelForm, Textarea, Select
 from django.contrib.auth.models import User
 
+def similarity_backend_choices():
+    """Similarity backends registered by student.grading; blank uses the exam's or the site default"""
+    from student.grading import backend_choices
+    return [('', 'Default')] + backend_choices()
+
 class Question_DB(models.Model):
     # added question number for help in question paper
     professor = models.ForeignKey(User, limit_choices_to={'groups__name': "Professor"}, on_delete=models.PROTECT, null=False)
@@ -9,6 +14,8 @@ class Question_DB(models.Model):
     question = models.TextField(max_length=1000)  # Changed from CharField to TextField for longer questions
     question_type = models.CharField(max_length=20, choices=[('SUBJECTIVE', 'Subjective')], default='SUBJECTIVE')
     question_image = models.ImageField(upload_to='question_images/', null=True, blank=True)
+    similarity_backend = models.CharField(max_length=20, choices=similarity_backend_choices, blank=True, default='',
+                                          help_text="Similarity backend used to grade answers to this question")
 
     def __str__(self):
         question_text = str(self.question)
@@ -37,5 +44,8 @@ class QForm(ModelForm):
             }),
             'question_type': Select(attrs={
                 'class': 'form-control'
+            }),
+            'similarity_backend': Select(attrs={
+                'class': 'form-control'
             })
         }
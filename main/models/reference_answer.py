@@ -1,21 +1,51 @@
+from django.core.validators import FileExtensionValidator
 from django.db import models
 from django.contrib.auth.models import User
 from .question import Question_DB
 
+# Handwritten answers are uploaded as a single image or a multi-page PDF
+ANSWER_FILE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'pdf']
+
 class ReferenceAnswer(models.Model):
+    ANALYSIS_READY = 'ready'
+    ANALYSIS_PENDING = 'pending'
+    ANALYSIS_FAILED = 'failed'
+    ANALYSIS_STATUS_CHOICES = [
+        (ANALYSIS_READY, 'Ready'),
+        (ANALYSIS_PENDING, 'Pending analysis'),
+        (ANALYSIS_FAILED, 'Analysis failed'),
+    ]
+    
     question = models.ForeignKey(Question_DB, on_delete=models.PROTECT, related_name='reference_answers')
     professor = models.ForeignKey(User, limit_choices_to={'groups__name': "Professor"}, on_delete=models.CASCADE)
     
-    # Reference answer can be either text or image
+    # Reference answer can be either text or image (or a multi-page PDF)
     text_answer = models.TextField(blank=True, null=True, help_text="Reference text answer")
-    image_answer = models.ImageField(upload_to='reference_answers/', blank=True, null=True, help_text="Reference handwritten answer image")
+    image_answer = models.FileField(
+        upload_to='reference_answers/',
+        blank=True,
+        null=True,
+        validators=[FileExtensionValidator(ANSWER_FILE_EXTENSIONS)],
+        help_text="Reference handwritten answer image or multi-page PDF"
+    )
+    
+    # Optional teacher-supplied key phrases (one per line) credited when found in an answer
+    key_phrases = models.TextField(blank=True, null=True, help_text="Key phrases to look for in student answers, one per line")
     
     # OCR extracted text from the image
     ocr_text = models.TextField(blank=True, null=True, help_text="OCR extracted text from reference image")
     
+    # Hashes of the inputs the derived fields were computed from, so saves only redo what changed
+    image_sha256 = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the image the OCR text was read from")
+    text_sha256 = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the text the TF-IDF vector and analysis were built from")
+    analysis_status = models.CharField(max_length=10, choices=ANALYSIS_STATUS_CHOICES, default=ANALYSIS_READY)
+    
     # TF-IDF vector (stored as JSON for similarity comparison)
     tfidf_vector = models.JSONField(blank=True, null=True, help_text="TF-IDF vector for similarity comparison")
     
+    # Compiled grading artifact (n-gram counts, keywords, TF norm, version stamp)
+    analysis = models.JSONField(blank=True, null=True, help_text="Compiled reference analysis used by grading")
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -27,54 +57,129 @@ class ReferenceAnswer(models.Model):
     def __str__(self):
         return f"Reference Answer for Q{self.question.qno} by {self.professor.username}" # type: ignore
     
+    def get_reference_text(self):
+        """Return the text used for grading: typed answer first, then OCR text"""
+        return self.text_answer or self.ocr_text or ""
+    
+    def is_pdf_answer(self):
+        return bool(self.image_answer) and self.image_answer.name.lower().endswith('.pdf')
+    
+    def get_key_phrases(self):
+        """Return the non-empty key phrases, one per line of key_phrases"""
+        return [line.strip() for line in (self.key_phrases or "").splitlines() if line.strip()]
+    
     def process_ocr(self):
         """
         Manually process OCR for this reference answer
         """
         if self.image_answer:
             print(f"Manually processing OCR for reference answer {self.pk}")
-            from student.utils import extract_text_from_image
-            ocr_text, error = extract_text_from_image(self.image_answer)
-            if ocr_text:
-                self.ocr_text = ocr_text
-                print(f"OCR successful: '{ocr_text[:100]}...'")
-                return True
-            else:
-                print(f"OCR failed: {error}")
-                return False
+            from student.utils import file_sha256
+            return self._run_ocr(file_sha256(self.image_answer))
         return False
     
-    def save(self, *args, **kwargs):
-        print(f"ReferenceAnswer.save() called for question {self.question.qno}") # type: ignore
-        print(f"  - Has image: {bool(self.image_answer)}")
-        print(f"  - Has text: {bool(self.text_answer)}")
-        print(f"  - Current OCR text: {self.ocr_text}")
-        
-        # If image is uploaded, always process OCR (even if OCR text exists)
-        if self.image_answer:
-            print(f"  - Processing OCR for image: {self.image_answer}")
-            from student.utils import extract_text_from_image
-            ocr_text, error = extract_text_from_image(self.image_answer)
-            if ocr_text:
-                self.ocr_text = ocr_text
-                print(f"  - OCR successful: '{ocr_text[:100]}...'")
+    def _run_ocr(self, image_sha256):
+        """OCR the image; image_sha256 is recorded only when text was read"""
+        from student.utils import extract_text_from_image
+        ocr_text, error = extract_text_from_image(self.image_answer, source='reference_answer')
+        if ocr_text:
+            self.ocr_text = ocr_text
+            self.image_sha256 = image_sha256
+            print(f"  - OCR successful: '{ocr_text[:100]}...'")
+            return True
+        print(f"  - OCR failed: {error}")
+        # Don't clear existing OCR text if OCR fails
+        if not self.ocr_text:
+            self.ocr_text = f"OCR processing failed: {error}"
+        return False
+    
+    def changed_image_sha256(self):
+        """Hash of the image when it is not the one ocr_text was read from, else None"""
+        if not self.image_answer:
+            return None
+        from student.utils import file_sha256
+        image_sha256 = file_sha256(self.image_answer)
+        return None if image_sha256 == self.image_sha256 else image_sha256
+    
+    def changed_text_sha256(self):
+        """Hash of the reference text when the vector and analysis were not built from it, else None"""
+        from student.utils import is_analysis_current, text_sha256
+        reference_sha256 = text_sha256(self.get_reference_text())
+        if reference_sha256 == self.text_sha256 and is_analysis_current(self.analysis):
+            return None
+        return reference_sha256
+    
+    def pending_changes(self):
+        """(changed image hash, changed text hash), each None when unchanged; reads the image file once"""
+        return self.changed_image_sha256(), self.changed_text_sha256()
+    
+    def needs_analysis(self):
+        return any(sha256 is not None for sha256 in self.pending_changes())
+    
+    def refresh_analysis(self, skip_ocr=False, changes=None):
+        """
+        OCR the image if it changed, then rebuild the TF-IDF vector and the
+        grading analysis if the reference text changed (not saved).
+        changes: pending_changes() when the caller already computed them
+        """
+        image_sha256, reference_sha256 = changes if changes is not None else self.pending_changes()
+        if image_sha256 is not None:
+            if skip_ocr:
+                # The caller already put this image's text in ocr_text
+                self.image_sha256 = image_sha256
             else:
-                print(f"  - OCR failed: {error}")
-                # Don't clear existing OCR text if OCR fails
-                if not self.ocr_text:
-                    self.ocr_text = f"OCR processing failed: {error}"
+                print(f"  - Processing OCR for changed image: {self.image_answer}")
+                self._run_ocr(image_sha256)
+                # The new OCR text may change the reference text
+                reference_sha256 = self.changed_text_sha256()
+        elif self.image_answer:
+            print(f"  - Image unchanged, keeping OCR text")
         
-        # Generate TF-IDF vector for similarity comparison
-        if self.text_answer or self.ocr_text:
+        if reference_sha256 is None:
+            print(f"  - Reference text unchanged, keeping TF-IDF vector and analysis")
+        elif self.text_answer or self.ocr_text:
+            # Generate TF-IDF vector for similarity comparison
             print(f"  - Generating TF-IDF vector")
             from student.utils import generate_tfidf_vector
-            text_content = self.text_answer or self.ocr_text or ""
+            text_content = self.get_reference_text()
             self.tfidf_vector = generate_tfidf_vector(text_content)
             if self.tfidf_vector:
                 print(f"  - TF-IDF vector generated successfully")
             else:
                 print(f"  - TF-IDF vector generation failed")
+            
+            # Compile the grading artifact once so grading never re-analyzes the reference
+            from student.utils import compile_text_analysis
+            self.analysis = compile_text_analysis(text_content)
+            self.text_sha256 = reference_sha256
         else:
             print(f"  - No text content for TF-IDF")
+            self.analysis = None
+            self.text_sha256 = reference_sha256
+        self.analysis_status = self.ANALYSIS_READY
+    
+    def save(self, *args, skip_ocr=False, **kwargs):
+        """
+        Save the reference answer. OCR runs only when the image content
+        changed (never with skip_ocr, when the caller already put fresh text
+        in ocr_text) and vectorization only when the reference text changed.
+        With REFERENCE_ANALYSIS_ASYNC that work runs in the background and
+        the reference stays "pending" until it is done.
+        """
+        print(f"ReferenceAnswer.save() called for question {self.question.qno}") # type: ignore
+        print(f"  - Has image: {bool(self.image_answer)}")
+        print(f"  - Has text: {bool(self.text_answer)}")
+        print(f"  - Current OCR text: {self.ocr_text}")
+        
+        from student.reference_analysis import reference_analysis_async, schedule_reference_analysis
+        # Hash the image and text once for both the deferral check and the refresh
+        changes = self.pending_changes()
+        if reference_analysis_async() and not skip_ocr and any(sha256 is not None for sha256 in changes):
+            print(f"  - Analysis deferred to the background")
+            self.analysis_status = self.ANALYSIS_PENDING
+            super().save(*args, **kwargs)
+            schedule_reference_analysis(self.pk)
+            return
         
-        super().save(*args, **kwargs) 
\ No newline at end of file
+        self.refresh_analysis(skip_ocr=skip_ocr, changes=changes)
+        super().save(*args, **kwargs)
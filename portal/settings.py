@@ -132,6 +132,46 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Automated grading
+GRADING_STEM_CACHE_SIZE = 50000  # Distinct words kept in the shared stem cache
+GRADING_COHORT_MIN_DOCUMENTS = 5  # Answers needed before IDF comes from the question's cohort
+GRADING_CACHE_ALIAS = 'default'  # Cache holding graded results (see CACHES)
+GRADING_CACHE_TIMEOUT = 7 * 24 * 60 * 60  # Seconds a cached grade is kept
+GRADING_AUTOMATON_CACHE_SIZE = 1024  # Compiled reference keyword automata kept per process
+GRADING_SIMILARITY_BACKEND = 'tfidf'  # tfidf, bm25, char_ngram or minhash; questions and exams may override
+
+# Background OCR/grading queue, drained by `python manage.py run_grading_worker`
+GRADING_QUEUE_ENABLED = os.environ.get('GRADING_QUEUE_ENABLED', 'False').lower() == 'true'
+GRADING_JOB_LEASE_SECONDS = 300  # A crashed worker's jobs are reclaimed after this long
+GRADING_JOB_MAX_ATTEMPTS = 3
+REFERENCE_ANALYSIS_ASYNC = False  # Reference answer saves leave OCR and vectorization to a background thread
+
+# OCR
+OCR_ENGINE = 'auto'  # tesserocr (optional, keeps Tesseract loaded), pytesseract (one process per call) or auto
+OCR_POOL_WORKERS = min(5, os.cpu_count() or 1)  # Tesseract processes shared by all requests (0 runs inline)
+OCR_IMAGE_DEADLINE_SECONDS = 30  # Wall-time budget for all OCR attempts on one image
+OCR_NORMALIZE_RESOLUTION = True  # Crop margins and rescale pages to OCR_TARGET_TEXT_HEIGHT before OCR
+OCR_TARGET_TEXT_HEIGHT = 30  # Median letter height in pixels Tesseract is given
+OCR_MAX_DIMENSION = 2500  # Longest side when no text height can be estimated
+OCR_SEGMENT_MIN_BLOCKS = 2  # Pages with this many text blocks are OCR'd block by block in parallel
+OCR_PREPROCESSING_MAX_PASSES = 2  # Preprocessing pipelines tried per page, ordered by past success on similar pages
+OCR_PDF_DPI = 200  # Resolution PDF answer pages are rasterized at, one page at a time
+OCR_PDF_MAX_PAGES = 30
+REFERENCE_OCR_CHECKPOINT = os.path.join(MEDIA_ROOT, 'ocr_state', 'process_reference_ocr.checkpoint.json')  # process_reference_ocr resume state (ignored by git)
+OCR_PDF_MAX_PIXELS = 8_000_000  # Oversized PDF pages are rendered below OCR_PDF_DPI to stay within this many pixels
+OCR_BATCH_THREADS = 4  # Images of batch OCR uploads processed at once per web process (0 runs in the request)
+OCR_BATCH_MAX_IMAGES = 40
+OCR_BATCH_LEASE_SECONDS = 300  # A stalled batch's unfinished images are OCR'd again on the next poll after this long
+OCR_BATCH_MAX_ATTEMPTS = 3
+OCR_BATCH_RETENTION_DAYS = 7  # cleanup_ocr_batches deletes batches and their images after this many days
+OCR_SERVICE_SOCKET = os.environ.get('OCR_SERVICE_SOCKET') or None  # Unix socket of run_ocr_service; unset runs OCR in the web workers; with GRADING_QUEUE_ENABLED exam answers are OCR'd by run_grading_worker instead
+OCR_SERVICE_DEFAULT_SOCKET = os.path.join(BASE_DIR, 'ocr_service.sock')  # Where run_ocr_service listens without OCR_SERVICE_SOCKET (ignored by git)
+OCR_SERVICE_WORKERS = min(4, os.cpu_count() or 1)  # Images the OCR service works on at once
+OCR_SERVICE_QUEUE_SIZE = 16  # Images waiting for an OCR service worker before requests are turned away busy
+OCR_SERVICE_TIMEOUT = 120  # Seconds a web worker waits for the text of an accepted image
+OCR_MIN_MEAN_CONFIDENCE = 70  # Mean word confidence (0-100) that ends the search for a better config
+OCR_MIN_TEXT_DENSITY = 0.6  # Share of non-space characters that must be letters or digits
+
 # Security settings
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
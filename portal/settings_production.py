@@ -120,6 +120,9 @@ LOGGING.update({
 # Performance settings
 CONN_MAX_AGE = 60
 
+# Exam submissions return immediately; OCR and grading run in the worker process (see Procfile)
+GRADING_QUEUE_ENABLED = os.environ.get('GRADING_QUEUE_ENABLED', 'True').lower() == 'true'
+
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
@@ -12,4 +12,5 @@ class ExamForm(forms.ModelForm):
             'question_paper': forms.Select(attrs={'class': 'form-select'}),
             'student_group': forms.SelectMultiple(attrs={'class': 'form-select'}),
             'start_time': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
+            'similarity_backend': forms.Select(attrs={'class': 'form-select'}),
         }
\ No newline at end of file
@@ -4,7 +4,23 @@ from rest_framework import status
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from ..utils import extract_text_from_image, validate_image_file
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.db import transaction
+from django.urls import reverse
+from ..models import OCRBatch
+from ..ocr import ocr_cache_stats
+from ..ocr_service import OCR_SERVICE_RETRY_AFTER_SECONDS, OCRServiceBusy, ocr_service_socket
+from ..ocr_batches import (
+    OCR_BATCH_MAX_IMAGES,
+    batch_etag,
+    batch_status,
+    create_ocr_batch,
+    etag_matches,
+    is_stalled,
+    resume_ocr_batch,
+    start_ocr_batch,
+)
+from ..utils import extract_text_from_image, ingest_image, validate_image_file
 import json
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -22,15 +38,22 @@ class OCRView(APIView):
             
             image_file = request.FILES['image']
             
-            # Validate image file
-            is_valid, error_msg = validate_image_file(image_file)
-            if not is_valid:
+            # Validate and decode the image once; OCR reuses the decoded pixels
+            # (the OCR service decodes it itself, so only validate then)
+            ingested, error_msg = ingest_image(image_file, decode=not ocr_service_socket())
+            if ingested is None:
                 return Response({
                     'error': error_msg
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Extract text using OCR
-            ocr_text, ocr_error = extract_text_from_image(image_file)
+            # Extract text using OCR; a saturated OCR service turns the request away at once
+            try:
+                ocr_text, ocr_error = extract_text_from_image(ingested, source='ocr_api', on_busy='raise')
+            except OCRServiceBusy:
+                return Response({
+                    'error': 'OCR service is busy, please retry shortly',
+                    'text': ''
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(OCR_SERVICE_RETRY_AFTER_SECONDS)})
             
             if ocr_error:
                 return Response({
@@ -47,4 +70,87 @@ class OCRView(APIView):
             return Response({
                 'error': f'Unexpected error: {str(e)}',
                 'text': ''
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR) 
\ No newline at end of file
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class OCRBatchView(APIView):
+    """
+    Accept several images (multipart field 'images') for OCR and return a
+    job ID at once; the images are processed in the background
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        image_files = request.FILES.getlist('images')
+        if not image_files:
+            return Response({
+                'error': 'No image files provided'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(image_files) > OCR_BATCH_MAX_IMAGES:
+            return Response({
+                'error': f'Too many images. At most {OCR_BATCH_MAX_IMAGES} images can be sent at once.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Reject the whole batch if any image is invalid, naming each bad one
+        errors = []
+        for index, image_file in enumerate(image_files):
+            is_valid, error_msg = validate_image_file(image_file)
+            if not is_valid:
+                errors.append({'index': index, 'name': image_file.name, 'error': error_msg})
+        if errors:
+            return Response({
+                'error': 'Invalid image files',
+                'files': errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        batch = create_ocr_batch(image_files, user=request.user)
+        # Background threads must only look for the batch once it is committed
+        transaction.on_commit(lambda: start_ocr_batch(batch))
+        return Response({
+            'job_id': str(batch.job_id),
+            'status': batch.status,
+            'total': len(image_files),
+            'status_url': reverse('student:api:ocr_batch_status', args=[batch.job_id]),
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class OCRBatchStatusView(APIView):
+    """
+    Progress of an OCR batch with the text of each finished image. Responses
+    carry an ETag; a poll with a matching If-None-Match gets 304 Not Modified.
+    Only the uploader (or staff) can see a batch; a poll on a stalled batch
+    resumes its unfinished images.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, job_id):
+        batches = OCRBatch.objects.filter(job_id=job_id) # type: ignore
+        if not request.user.is_staff:
+            batches = batches.filter(user=request.user)
+        row = batches.values_list('version', 'status', 'updated_at').first()
+        if row is None:
+            return Response({
+                'error': 'OCR job not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        version, batch_state, updated_at = row
+        
+        if is_stalled(batch_state, updated_at):
+            resume_ocr_batch(batches.get())
+        
+        etag = batch_etag(job_id, version)
+        if etag_matches(etag, request.headers.get('If-None-Match')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        
+        batch = batches.get()
+        return Response(batch_status(batch), status=status.HTTP_200_OK, headers={'ETag': batch_etag(job_id, batch.version)})
+
+
+class OCRCacheStatsView(APIView):
+    """
+    OCR cache hit/miss counters for this server process and stored entry totals
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return Response(ocr_cache_stats(), status=status.HTTP_200_OK)
@@ -8,4 +8,7 @@ urlpatterns = [
     path('exams/<int:pk>', exams.Exam.as_view(), name='exams'),
     path('results', results.Results.as_view(), name='results'),
     path('ocr', ocr.OCRView.as_view(), name='ocr'),
+    path('ocr/batch', ocr.OCRBatchView.as_view(), name='ocr_batch'),
+    path('ocr/batch/<uuid:job_id>', ocr.OCRBatchStatusView.as_view(), name='ocr_batch_status'),
+    path('ocr/cache-stats', ocr.OCRCacheStatsView.as_view(), name='ocr_cache_stats'),
 ]
@@ -1,6 +1,7 @@
 from django import forms
 from .models import SubjectiveAnswer
-from .utils import extract_text_from_image, validate_image_file
+from .ocr_service import OCRServiceBusy, ocr_service_socket
+from .utils import extract_text_from_image, ingest_image
 
 class SubjectiveAnswerForm(forms.ModelForm):
     class Meta:
@@ -14,7 +15,7 @@ class SubjectiveAnswerForm(forms.ModelForm):
             }),
             'image_answer': forms.FileInput(attrs={
                 'class': 'form-control-file',
-                'accept': 'image/*',
+                'accept': 'image/*,application/pdf',
                 'id': 'image-upload'
             })
         }
@@ -29,13 +30,17 @@ class SubjectiveAnswerForm(forms.ModelForm):
         
         # Process image if uploaded
         if image:
-            # Validate image file
-            is_valid, error_msg = validate_image_file(image)
-            if not is_valid:
+            # Validate and decode the image once; OCR reuses the decoded pixels
+            # (the OCR service decodes it itself, so only validate then)
+            ingested, error_msg = ingest_image(image, decode=not ocr_service_socket())
+            if ingested is None:
                 raise forms.ValidationError(error_msg)
             
             # Extract text from image using OCR
-            ocr_text, ocr_error = extract_text_from_image(image)
+            try:
+                ocr_text, ocr_error = extract_text_from_image(ingested, source='subjective_answer', on_busy='raise')
+            except OCRServiceBusy:
+                raise forms.ValidationError('Image text recognition is busy right now. Please submit your answer again in a minute.')
             if ocr_error:
                 # Don't fail the form if OCR fails, just log it
                 print(f"OCR Error: {ocr_error}")
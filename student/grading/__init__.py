@@ -0,0 +1,17 @@
+"""
+Pluggable similarity backends used by automated grading.
+
+Importing the package registers the built-in backends: TF-IDF cosine
+('tfidf', the default), Okapi BM25 ('bm25'), hashed character n-grams
+('char_ngram') and MinHash-estimated Jaccard ('minhash').
+"""
+from .base import (
+    DEFAULT_SIMILARITY_BACKEND,
+    SimilarityBackend,
+    available_backends,
+    backend_choices,
+    get_backend,
+    register_backend,
+    resolve_backend_name,
+)
+from . import tfidf, bm25, char_ngram, minhash  # noqa: F401  (register built-in backends)
@@ -0,0 +1,78 @@
+"""
+Similarity backend interface and registry
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Backend used when neither the question nor the exam chooses one
+DEFAULT_SIMILARITY_BACKEND = getattr(settings, 'GRADING_SIMILARITY_BACKEND', 'tfidf')
+
+_backends = {}
+
+
+class SimilarityBackend:
+    """
+    Scores a batch of student answers against a question's reference answers.
+    Marks and feedback are derived from the best score per answer in the same
+    way for every backend, so scores must lie in [0, 1].
+    """
+    name = None
+    label = None
+    # Whether the backend weights terms with the question's cohort statistics
+    uses_cohort_stats = False
+
+    def similarity_matrix(self, student_texts, student_analyses, reference_entries, cohort_stats=None):
+        """
+        Score every student text against every reference.
+        student_analyses are the compile_text_analysis artifacts of
+        student_texts; reference_entries are (reference_answer, analysis) pairs.
+        Returns: numpy array of shape (students, references)
+        """
+        raise NotImplementedError
+
+
+def register_backend(backend_class):
+    """Class decorator registering a backend under its name"""
+    _backends[backend_class.name] = backend_class()
+    return backend_class
+
+
+def available_backends():
+    """Return the names of all registered backends"""
+    return sorted(_backends)
+
+
+def backend_choices():
+    """(name, label) of every registered backend, for model and form choices"""
+    return [(name, _backends[name].label) for name in available_backends()]
+
+
+def get_backend(name=None):
+    """
+    Return the registered backend called name, or the default backend when
+    name is empty. Raises KeyError for unknown names.
+    """
+    name = name or DEFAULT_SIMILARITY_BACKEND
+    if name not in _backends:
+        raise KeyError(f"Unknown similarity backend '{name}', expected one of {', '.join(available_backends())}")
+    return _backends[name]
+
+
+def resolve_backend_name(question=None, exam=None):
+    """
+    Pick the backend for grading a question: the question's own choice wins,
+    then the exam's, then GRADING_SIMILARITY_BACKEND. Unknown names are
+    logged and replaced by the default.
+    """
+    for source in (question, exam):
+        name = getattr(source, 'similarity_backend', None)
+        if not name:
+            continue
+        if name in _backends:
+            return name
+        logger.warning(f"Unknown similarity backend '{name}' on {source!r}, using '{DEFAULT_SIMILARITY_BACKEND}'")
+        break
+    return DEFAULT_SIMILARITY_BACKEND
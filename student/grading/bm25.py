@@ -0,0 +1,101 @@
+"""
+Okapi BM25 similarity backend.
+
+Each reference's distinct stemmed words form the query and each student
+answer is a document. The score is normalized by the reference's score
+against itself, so an answer containing the reference scores 1.0.
+"""
+import math
+
+import numpy as np
+from django.conf import settings
+from scipy.sparse import csr_matrix
+
+from .base import SimilarityBackend, register_backend
+
+BM25_K1 = getattr(settings, 'GRADING_BM25_K1', 1.2)
+BM25_B = getattr(settings, 'GRADING_BM25_B', 0.75)
+
+
+def _unigram_count_matrix(analyses, vocabulary):
+    """Raw stemmed-word counts (n-grams of one word only) as a CSR matrix over a shared vocabulary"""
+    indptr = [0]
+    indices = []
+    data = []
+    for analysis in analyses:
+        for term, count in analysis['ngram_counts'].items():
+            if ' ' in term:
+                continue
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            data.append(count)
+        indptr.append(len(indices))
+    return indptr, indices, data
+
+
+def _csr(parts, n_columns):
+    indptr, indices, data = parts
+    return csr_matrix(
+        (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, n_columns)
+    )
+
+
+def _saturate(counts, avg_length, k1, b):
+    """Replace each term count with its BM25 term-frequency component"""
+    lengths = np.asarray(counts.sum(axis=1)).ravel()
+    row_norm = k1 * (1 - b + b * lengths / avg_length)
+    saturated = counts.tocsr(copy=True)
+    row_of_entry = np.repeat(np.arange(saturated.shape[0]), np.diff(saturated.indptr))
+    tf = saturated.data
+    saturated.data = tf * (k1 + 1) / (tf + row_norm[row_of_entry])
+    return saturated
+
+
+def bm25_similarity_matrix(student_analyses, reference_analyses, stats=None, k1=BM25_K1, b=BM25_B):
+    """
+    BM25 score of every student answer for every reference used as a query,
+    divided by the reference's own score. IDF comes from the question's
+    cohort statistics when given, otherwise from the graded batch itself.
+    """
+    vocabulary = {}
+    students = _unigram_count_matrix(student_analyses, vocabulary)
+    references = _unigram_count_matrix(reference_analyses, vocabulary)
+    n_terms = len(vocabulary)
+    shape = (len(student_analyses), len(reference_analyses))
+    if not n_terms:
+        return np.zeros(shape)
+    student_counts = _csr(students, n_terms)
+    reference_counts = _csr(references, n_terms)
+
+    if stats is not None:
+        terms = sorted(vocabulary, key=vocabulary.get)
+        df = np.array([stats.document_frequency.get(term, 0) for term in terms], dtype=np.float64)
+        n_docs = stats.document_count
+    else:
+        df = np.bincount(np.concatenate([student_counts.indices, reference_counts.indices]), minlength=n_terms)
+        n_docs = shape[0] + shape[1]
+    idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    lengths = np.concatenate([
+        np.asarray(student_counts.sum(axis=1)).ravel(),
+        np.asarray(reference_counts.sum(axis=1)).ravel(),
+    ])
+    avg_length = max(lengths.mean(), 1.0)
+    query = (reference_counts > 0).astype(np.float64).multiply(idf.reshape(1, -1)).tocsr()
+    scores = (_saturate(student_counts, avg_length, k1, b) @ query.T).toarray()
+    self_scores = np.asarray(_saturate(reference_counts, avg_length, k1, b).multiply(query).sum(axis=1)).ravel()
+
+    similarity = np.zeros(shape)
+    np.divide(scores, self_scores[None, :], out=similarity, where=self_scores[None, :] > 0)
+    return np.clip(similarity, 0.0, 1.0)
+
+
+@register_backend
+class BM25Backend(SimilarityBackend):
+    name = 'bm25'
+    label = 'Okapi BM25'
+    uses_cohort_stats = True
+
+    def similarity_matrix(self, student_texts, student_analyses, reference_entries, cohort_stats=None):
+        reference_analyses = [analysis for _, analysis in reference_entries]
+        return bm25_similarity_matrix(student_analyses, reference_analyses, stats=cohort_stats)
@@ -0,0 +1,38 @@
+"""
+Hashed character n-gram similarity backend.
+
+Character 3-5 grams inside word boundaries are hashed into a fixed number of
+buckets, so no vocabulary is fitted and spelling or OCR errors only cost the
+n-grams they touch.
+"""
+from django.conf import settings
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from .base import SimilarityBackend, register_backend
+
+CHAR_NGRAM_FEATURES = getattr(settings, 'GRADING_CHAR_NGRAM_FEATURES', 2 ** 18)
+
+_vectorizer = HashingVectorizer(
+    analyzer='char_wb',
+    ngram_range=(3, 5),
+    n_features=CHAR_NGRAM_FEATURES,
+    alternate_sign=False,
+    norm='l2',
+)
+
+
+def char_ngram_similarity_matrix(student_texts, reference_texts):
+    """Cosine similarity of L2-normalized hashed character n-gram vectors"""
+    students = _vectorizer.transform(student_texts)
+    references = _vectorizer.transform(reference_texts)
+    return (students @ references.T).toarray().clip(0.0, 1.0)
+
+
+@register_backend
+class CharNgramBackend(SimilarityBackend):
+    name = 'char_ngram'
+    label = 'Hashed character n-grams'
+
+    def similarity_matrix(self, student_texts, student_analyses, reference_entries, cohort_stats=None):
+        reference_texts = [ref_answer.get_reference_text() for ref_answer, _ in reference_entries]
+        return char_ngram_similarity_matrix(student_texts, reference_texts)
@@ -0,0 +1,55 @@
+"""
+MinHash similarity backend.
+
+Each text becomes the set of its stemmed words and word pairs; the Jaccard
+similarity of two sets is estimated from fixed-size MinHash signatures, so
+comparing a pair costs the same however long the answers are.
+"""
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from .base import SimilarityBackend, register_backend
+
+MINHASH_PERMUTATIONS = getattr(settings, 'GRADING_MINHASH_PERMUTATIONS', 128)
+
+# Universal hash family h(x) = (a * x + b) mod p over 32-bit term hashes;
+# a < 2**32 keeps a * x inside uint64
+_PRIME = np.uint64(4294967311)
+_random = np.random.RandomState(20240601)
+_A = _random.randint(1, 2 ** 32, size=MINHASH_PERMUTATIONS, dtype=np.int64).astype(np.uint64)
+_B = _random.randint(0, 2 ** 32, size=MINHASH_PERMUTATIONS, dtype=np.int64).astype(np.uint64)
+
+
+def minhash_signature(terms):
+    """Return the MinHash signature of a set of terms, or None for an empty set"""
+    if not terms:
+        return None
+    hashes = np.fromiter((zlib.crc32(term.encode('utf-8')) for term in terms), dtype=np.uint64, count=len(terms))
+    permuted = (_A[:, None] * hashes[None, :] % _PRIME + _B[:, None]) % _PRIME
+    return permuted.min(axis=1)
+
+
+def minhash_similarity_matrix(student_analyses, reference_analyses):
+    """Estimated Jaccard similarity of the n-gram sets of every student/reference pair"""
+    similarity = np.zeros((len(student_analyses), len(reference_analyses)))
+    reference_signatures = [minhash_signature(list(analysis['ngram_counts'])) for analysis in reference_analyses]
+    for i, analysis in enumerate(student_analyses):
+        signature = minhash_signature(list(analysis['ngram_counts']))
+        if signature is None:
+            continue
+        for j, reference_signature in enumerate(reference_signatures):
+            if reference_signature is not None:
+                similarity[i, j] = np.count_nonzero(signature == reference_signature) / MINHASH_PERMUTATIONS
+    return similarity
+
+
+@register_backend
+class MinHashBackend(SimilarityBackend):
+    name = 'minhash'
+    label = 'MinHash Jaccard'
+
+    def similarity_matrix(self, student_texts, student_analyses, reference_entries, cohort_stats=None):
+        reference_analyses = [analysis for _, analysis in reference_entries]
+        return minhash_similarity_matrix(student_analyses, reference_analyses)
@@ -0,0 +1,118 @@
+"""
+TF-IDF cosine similarity backend (the default).
+
+Without cohort statistics each student/reference pair is weighted as its own
+two-document corpus, exactly like calculate_similarity_score; with them IDF
+comes from the question's answers.
+"""
+import math
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+from .base import SimilarityBackend, register_backend
+
+# IDF of a term present in only one document of a student/reference pair
+PAIR_UNIQUE_TERM_IDF = math.log(3 / 2) + 1
+
+
+
+def sparse_cosine_similarity(matrix_a, matrix_b):
+    """
+    Cosine similarity between every row of matrix_a and every row of matrix_b
+    computed as a single sparse dot product of L2-normalized rows.
+    Rows with zero norm score 0.0 against everything.
+    """
+    normalized_a = normalize(matrix_a, norm='l2', axis=1, copy=True)
+    normalized_b = normalize(matrix_b, norm='l2', axis=1, copy=True)
+    return (normalized_a @ normalized_b.T).toarray()
+
+
+def _term_frequency_matrix(analyses, vocabulary):
+    """
+    Build a CSR term-frequency matrix (one row per analysis) over a shared
+    vocabulary, adding unseen terms to the vocabulary as they are met
+    """
+    indptr = [0]
+    indices = []
+    data = []
+    for analysis in analyses:
+        total = analysis['ngram_total']
+        for term, count in analysis['ngram_counts'].items():
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            data.append(count / total)
+        indptr.append(len(indices))
+    return indptr, indices, data
+
+
+def _to_csr(indptr, indices, data, n_columns):
+    """Assemble CSR parts into a matrix; binary when data is None"""
+    if data is None:
+        data = np.ones(len(indices), dtype=np.float64)
+    return csr_matrix(
+        (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, n_columns)
+    )
+
+
+def pairwise_similarity_matrix(student_analyses, reference_analyses):
+    """
+    Pairwise TF-IDF cosine similarity of every student against every
+    reference (students x references), each pair scored as its own
+    two-document corpus exactly like calculate_similarity_score.
+
+    Shared terms have IDF 1 and every other term has the same IDF, so the
+    whole matrix follows from three sparse products: the dot product over
+    shared terms and, for each side, the squared TF mass on shared terms.
+    """
+    vocabulary = {}
+    student_parts = _term_frequency_matrix(student_analyses, vocabulary)
+    reference_parts = _term_frequency_matrix(reference_analyses, vocabulary)
+    students = _to_csr(*student_parts, len(vocabulary))
+    references = _to_csr(*reference_parts, len(vocabulary))
+
+    dot = (students @ references.T).toarray()
+    student_shared_square = (students.multiply(students) @ (references > 0).T).toarray()
+    reference_shared_square = ((students > 0) @ references.multiply(references).T).toarray()
+
+    unique_weight = PAIR_UNIQUE_TERM_IDF ** 2
+    student_square = np.array([a['tf_square_sum'] for a in student_analyses], dtype=np.float64)
+    reference_square = np.array([a['tf_square_sum'] for a in reference_analyses], dtype=np.float64)
+    student_norm_square = unique_weight * student_square[:, None] - (unique_weight - 1) * student_shared_square
+    reference_norm_square = unique_weight * reference_square[None, :] - (unique_weight - 1) * reference_shared_square
+    denominator = np.sqrt(np.clip(student_norm_square * reference_norm_square, 0, None))
+
+    similarity = np.zeros_like(dot)
+    np.divide(dot, denominator, out=similarity, where=(dot > 0) & (denominator > 0))
+    return similarity
+
+
+def cohort_similarity_matrix(student_analyses, reference_analyses, stats):
+    """
+    TF-IDF cosine similarity of every student against every reference using
+    the question's cohort document frequencies instead of refitting IDF
+    """
+    vocabulary = {}
+    student_parts = _term_frequency_matrix(student_analyses, vocabulary)
+    reference_parts = _term_frequency_matrix(reference_analyses, vocabulary)
+    document_frequency = stats.document_frequency
+    terms = sorted(vocabulary, key=vocabulary.get)
+    df = np.array([document_frequency.get(term, 0) for term in terms], dtype=np.float64)
+    idf = np.log((stats.document_count + 1) / (df + 1)) + 1
+    students = _to_csr(*student_parts, len(vocabulary)).multiply(idf.reshape(1, -1)).tocsr()
+    references = _to_csr(*reference_parts, len(vocabulary)).multiply(idf.reshape(1, -1)).tocsr()
+    return sparse_cosine_similarity(students, references)
+
+
+@register_backend
+class TfidfBackend(SimilarityBackend):
+    name = 'tfidf'
+    label = 'TF-IDF cosine'
+    uses_cohort_stats = True
+
+    def similarity_matrix(self, student_texts, student_analyses, reference_entries, cohort_stats=None):
+        reference_analyses = [analysis for _, analysis in reference_entries]
+        if cohort_stats is not None:
+            return cohort_similarity_matrix(student_analyses, reference_analyses, cohort_stats)
+        return pairwise_similarity_matrix(student_analyses, reference_analyses)
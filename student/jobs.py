@@ -0,0 +1,198 @@
+"""
+Database-backed queue for OCR and grading work taken off the exam submission request.
+
+Submission stores the answers and enqueues one GradingJob per answer; any number of
+run_grading_worker processes, on one or many nodes, claim jobs under a lease, run OCR
+where needed, grade the answers per question in batches and finalize the exam once its
+last job has finished.
+"""
+from datetime import timedelta
+import logging
+import os
+import socket
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from main.models import Exam_Model, Question_DB
+from student.models import GradingJob, StuExam_DB, SubjectiveAnswer
+from student.utils import (
+    apply_image_ocr,
+    finalize_exam_results,
+    get_reference_answers_for_question,
+    grade_answers_batch,
+)
+
+logger = logging.getLogger(__name__)
+
+GRADING_JOB_LEASE_SECONDS = getattr(settings, 'GRADING_JOB_LEASE_SECONDS', 300)
+GRADING_JOB_MAX_ATTEMPTS = getattr(settings, 'GRADING_JOB_MAX_ATTEMPTS', 3)
+
+NO_REFERENCE_FEEDBACK = "Answer submitted successfully. No reference answers available for automated grading."
+GRADING_FAILED_FEEDBACK = "Automatic grading failed. Your teacher will review this answer."
+
+OUTSTANDING_STATUSES = [GradingJob.STATUS_PENDING, GradingJob.STATUS_RUNNING]
+
+
+def grading_queue_enabled():
+    """Whether exam submissions hand OCR and grading to run_grading_worker"""
+    return getattr(settings, 'GRADING_QUEUE_ENABLED', False)
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_exam_grading(stu_exam, answers):
+    """
+    Queue grading for the given answers of a submitted exam. Earlier
+    outstanding jobs for the same answers are superseded.
+    Returns: list of created GradingJob
+    """
+    answers = list(answers)
+    GradingJob.objects.filter( # type: ignore
+        answer__in=answers,
+        status=GradingJob.STATUS_PENDING
+    ).update(status=GradingJob.STATUS_FAILED, last_error='Superseded by a newer submission', finished_at=timezone.now())
+    stu_exam.is_graded = False
+    stu_exam.save()
+    return GradingJob.objects.bulk_create([ # type: ignore
+        GradingJob(student_exam=stu_exam, answer=answer, max_attempts=GRADING_JOB_MAX_ATTEMPTS)
+        for answer in answers
+    ])
+
+
+def has_outstanding_jobs(stu_exam):
+    return GradingJob.objects.filter(student_exam=stu_exam, status__in=OUTSTANDING_STATUSES).exists() # type: ignore
+
+
+def _claimable():
+    now = timezone.now()
+    return Q(status=GradingJob.STATUS_PENDING) | Q(status=GradingJob.STATUS_RUNNING, lease_expires_at__lt=now)
+
+
+def claim_jobs(worker, limit, lease_seconds=GRADING_JOB_LEASE_SECONDS):
+    """
+    Claim up to `limit` jobs for a worker. Each claim is a conditional
+    UPDATE, so concurrent workers on any database never take the same job;
+    running jobs whose lease expired (crashed worker) are claimable again.
+    Returns: list of claimed GradingJob
+    """
+    expire_exhausted_jobs()
+    candidate_ids = list(
+        GradingJob.objects.filter(_claimable()).order_by('created_at').values_list('pk', flat=True)[:limit] # type: ignore
+    )
+    claimed_ids = []
+    for job_id in candidate_ids:
+        claimed = GradingJob.objects.filter(_claimable(), pk=job_id).update( # type: ignore
+            status=GradingJob.STATUS_RUNNING,
+            worker=worker,
+            attempts=F('attempts') + 1,
+            lease_expires_at=timezone.now() + timedelta(seconds=lease_seconds),
+        )
+        if claimed:
+            claimed_ids.append(job_id)
+    return list(
+        GradingJob.objects.filter(pk__in=claimed_ids).select_related('answer', 'student_exam') # type: ignore
+    )
+
+
+def expire_exhausted_jobs():
+    """Fail running jobs whose lease expired after their last allowed attempt"""
+    exhausted = GradingJob.objects.filter( # type: ignore
+        status=GradingJob.STATUS_RUNNING,
+        lease_expires_at__lt=timezone.now(),
+        attempts__gte=F('max_attempts'),
+    )
+    for job in exhausted.select_related('answer', 'student_exam'):
+        fail_job(job, 'Lease expired after the last attempt')
+
+
+def fail_job(job, error):
+    """Record a failed attempt: retry while attempts remain, otherwise give up"""
+    job.last_error = str(error)
+    if job.attempts < job.max_attempts:
+        job.status = GradingJob.STATUS_PENDING
+        job.lease_expires_at = None
+        job.save(update_fields=['status', 'lease_expires_at', 'last_error', 'updated_at'])
+        return
+    job.status = GradingJob.STATUS_FAILED
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'last_error', 'finished_at', 'updated_at'])
+    answer = job.answer
+    answer.marks = 0
+    answer.feedback = GRADING_FAILED_FEEDBACK
+    answer.save()
+    finalize_if_complete(job.student_exam)
+
+
+def finalize_if_complete(stu_exam):
+    """Finalize the exam's results once none of its jobs are outstanding"""
+    if has_outstanding_jobs(stu_exam):
+        return False
+    finalize_exam_results(StuExam_DB.objects.get(pk=stu_exam.pk)) # type: ignore
+    return True
+
+
+def process_jobs(jobs):
+    """
+    Run claimed jobs: OCR each image answer that has no text yet, then grade
+    the answers of each question in one batch and finalize finished exams.
+    Returns: (done_count, failed_count)
+    """
+    ready = []
+    failed = 0
+    for job in jobs:
+        try:
+            answer = job.answer
+            if answer.image_answer and not answer.ocr_text:
+                apply_image_ocr(answer, answer.image_answer, on_busy='wait')
+                answer.save()
+            ready.append(job)
+        except Exception as e:
+            logger.error(f"OCR failed for grading job {job.pk}: {e}")
+            fail_job(job, e)
+            failed += 1
+
+    # Batch per question and exam, since an exam may choose its own similarity backend
+    jobs_by_question = {}
+    for job in ready:
+        jobs_by_question.setdefault((job.answer.question_id, job.student_exam.examname), []).append(job)
+
+    done = 0
+    for (question_id, exam_name), question_jobs in jobs_by_question.items():
+        answers = [job.answer for job in question_jobs]
+        try:
+            question = Question_DB.objects.get(pk=question_id) # type: ignore
+            exam = Exam_Model.objects.filter(name=exam_name).first() # type: ignore
+            reference_answers = get_reference_answers_for_question(question)
+            graded_at = timezone.now()
+            if reference_answers:
+                results = grade_answers_batch(question, answers, reference_answers=reference_answers, exam=exam)
+                for answer, (marks, feedback, best_reference) in zip(answers, results):
+                    answer.marks = marks
+                    answer.feedback = feedback
+                    answer.is_auto_graded = True
+                    answer.graded_at = graded_at
+            else:
+                for answer in answers:
+                    answer.marks = 0
+                    answer.feedback = NO_REFERENCE_FEEDBACK
+            SubjectiveAnswer.objects.bulk_update(answers, ['marks', 'feedback', 'is_auto_graded', 'graded_at']) # type: ignore
+            GradingJob.objects.filter(pk__in=[job.pk for job in question_jobs]).update( # type: ignore
+                status=GradingJob.STATUS_DONE,
+                finished_at=timezone.now(),
+                lease_expires_at=None,
+                last_error='',
+            )
+            done += len(question_jobs)
+        except Exception as e:
+            logger.error(f"Grading failed for question {question_id}: {e}")
+            for job in question_jobs:
+                fail_job(job, e)
+            failed += len(question_jobs)
+
+    for stu_exam in {job.student_exam_id: job.student_exam for job in ready}.values():
+        finalize_if_complete(stu_exam)
+    return done, failed
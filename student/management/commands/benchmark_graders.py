@@ -0,0 +1,132 @@
+"""
+Management command to compare similarity backends on teacher-graded answers
+"""
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Exam_Model, Question_DB
+from student.grading import available_backends, get_backend
+from student.models import SubjectiveAnswer
+from student.utils import (
+    get_reference_answers_for_question,
+    get_student_answer_text,
+    grade_texts,
+    load_cohort_stats,
+    load_reference_analyses,
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark grading latency, throughput and agreement with teacher marks for each similarity backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            action='append',
+            choices=available_backends(),
+            help='Backend to benchmark (repeatable, default: all)'
+        )
+        parser.add_argument('--question', type=int, action='append', help='Only this question number (repeatable)')
+        parser.add_argument('--exam', help='Only questions of the exam with this name')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per backend, the median is reported (default: 3)')
+        parser.add_argument('--json', dest='json_path', help='Also write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        workload = self.load_workload(options['question'], options['exam'])
+        n_answers = sum(len(texts) for _, _, texts, _ in workload)
+        if not n_answers:
+            raise CommandError('No teacher-graded answers with reference answers to benchmark against')
+
+        self.stdout.write(f'Benchmarking on {n_answers} teacher-graded answers across {len(workload)} questions')
+        report = []
+        for name in options['backend'] or available_backends():
+            row = self.benchmark_backend(get_backend(name), workload, max(1, options['repeat']))
+            report.append(row)
+            self.stdout.write(
+                f"{name:<12} {row['latency_ms_per_answer']:8.3f} ms/answer  "
+                f"p95 batch {row['p95_batch_ms']:8.2f} ms  "
+                f"{row['answers_per_second']:9.1f} answers/s  "
+                f"exact {row['exact_agreement']:6.1%}  "
+                f"within 1 {row['within_one_agreement']:6.1%}  "
+                f"MAE {row['mean_absolute_error']:.2f}  "
+                f"r {row['correlation']:.3f}"
+            )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as report_file:
+                json.dump({'answers': n_answers, 'questions': len(workload), 'backends': report}, report_file, indent=2)
+            self.stdout.write(f"Report written to {options['json_path']}")
+        self.stdout.write(self.style.SUCCESS('Benchmark complete!')) # type: ignore
+
+    def load_workload(self, question_ids, exam_name):
+        """
+        Collect per question the references, cohort statistics and the texts
+        and marks of its teacher-graded answers.
+        Returns: list of (reference_entries, cohort_stats, texts, teacher_marks)
+        """
+        answers = SubjectiveAnswer.objects.filter(is_teacher_graded=True) # type: ignore
+        if question_ids:
+            answers = answers.filter(question_id__in=question_ids)
+        if exam_name:
+            exam = Exam_Model.objects.filter(name=exam_name).first() # type: ignore
+            if exam is None:
+                raise CommandError(f"Exam '{exam_name}' not found")
+            answers = answers.filter(question__in=exam.question_paper.questions.all())
+
+        by_question = {}
+        for answer in answers.order_by('question_id', 'pk'):
+            text = get_student_answer_text(answer)
+            if text.strip():
+                by_question.setdefault(answer.question_id, []).append((text, answer.marks))
+
+        workload = []
+        for question in Question_DB.objects.filter(pk__in=list(by_question)): # type: ignore
+            reference_entries = load_reference_analyses(get_reference_answers_for_question(question))
+            if not reference_entries:
+                continue
+            texts, marks = zip(*by_question[question.pk])
+            workload.append((reference_entries, load_cohort_stats(question), list(texts), list(marks)))
+        return workload
+
+    def benchmark_backend(self, backend, workload, repeat):
+        """Time the backend over the whole workload (bypassing the grading cache) and score its agreement"""
+        run_totals = []
+        batch_times = []
+        predicted = []
+        for run in range(repeat):
+            run_total = 0.0
+            for reference_entries, cohort_stats, texts, _ in workload:
+                started = time.perf_counter()
+                results = grade_texts(
+                    texts,
+                    reference_entries,
+                    cohort_stats if backend.uses_cohort_stats else None,
+                    backend=backend
+                )
+                elapsed = time.perf_counter() - started
+                run_total += elapsed
+                batch_times.append(elapsed)
+                if run == 0:
+                    predicted.extend(marks for marks, _, _ in results)
+            run_totals.append(run_total)
+
+        teacher = np.array([mark for _, _, _, marks in workload for mark in marks], dtype=np.float64)
+        predicted = np.array(predicted, dtype=np.float64)
+        difference = np.abs(predicted - teacher)
+        has_variance = teacher.std() > 0 and predicted.std() > 0
+        total_seconds = float(np.median(run_totals))
+        return {
+            'backend': backend.name,
+            'label': backend.label,
+            'seconds': total_seconds,
+            'latency_ms_per_answer': 1000 * total_seconds / len(teacher),
+            'p95_batch_ms': 1000 * float(np.percentile(batch_times, 95)),
+            'answers_per_second': len(teacher) / total_seconds if total_seconds else float('inf'),
+            'exact_agreement': float(np.mean(difference == 0)),
+            'within_one_agreement': float(np.mean(difference <= 1)),
+            'mean_absolute_error': float(difference.mean()),
+            'correlation': float(np.corrcoef(predicted, teacher)[0, 1]) if has_variance else 0.0,
+        }
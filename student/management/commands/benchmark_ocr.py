@@ -0,0 +1,121 @@
+"""
+Management command to compare OCR engines on the repository's sample images
+"""
+from difflib import SequenceMatcher
+import json
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from student.management.ocr_benchmark import find_images, latency_summary, time_recognitions
+from student.ocr import OCR_CONFIGS, available_engines, get_ocr_engine, normalize_for_ocr
+from student.utils import decode_image
+
+
+class Command(BaseCommand):
+    help = 'Benchmark OCR latency and agreement for each available OCR engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='*', help='Image files or directories (default: MEDIA_ROOT/reference_answers)')
+        parser.add_argument(
+            '--engine',
+            action='append',
+            choices=['pytesseract', 'tesserocr'],
+            help='Engine to benchmark (repeatable, default: all available)'
+        )
+        parser.add_argument('--config', default=OCR_CONFIGS[0], help=f"Tesseract config (default: '{OCR_CONFIGS[0]}')")
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per image and engine (default: 3)')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds allowed per recognition (default: 30)')
+        parser.add_argument(
+            '--compare-normalization',
+            action='store_true',
+            help='Run every engine on the decoded images and on their resolution-normalized versions'
+        )
+        parser.add_argument('--json', dest='json_path', help='Also write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        paths = find_images(options['images'] or [os.path.join(settings.MEDIA_ROOT, 'reference_answers')])
+        if not paths:
+            raise CommandError('No images to benchmark')
+        engines = options['engine'] or available_engines()
+        missing = [name for name in engines if name not in available_engines()]
+        if missing:
+            raise CommandError(f"OCR engine not available: {', '.join(missing)}")
+
+        decoded = [(path, decode_image(path)) for path in paths]
+        variants = {'normalized': [(path, normalize_for_ocr(pixels)) for path, pixels in decoded]}
+        if options['compare_normalization']:
+            variants = {'original': decoded, **variants}
+        self.report_sizes(variants)
+
+        self.stdout.write(f"Benchmarking {len(engines)} engines on {len(decoded)} images with '{options['config']}'")
+        report = []
+        texts = {}
+        for name in engines:
+            for variant, images in variants.items():
+                row, texts[name, variant] = self.benchmark_engine(
+                    name, images, options['config'], max(1, options['repeat']), options['timeout']
+                )
+                row['images'] = variant
+                report.append(row)
+                self.stdout.write(
+                    f"{name:<12} {variant:<10} mean {row['mean_ms']:8.1f} ms  p50 {row['p50_ms']:8.1f} ms  "
+                    f"p95 {row['p95_ms']:8.1f} ms  {row['images_per_second']:6.2f} images/s  "
+                    f"failures {row['failures']}"
+                )
+
+        # Agreement with the first engine on the first image variant
+        baseline = (engines[0], next(iter(variants)))
+        for row in report:
+            key = (row['engine'], row['images'])
+            if key != baseline:
+                row['agreement_with_baseline'] = self.agreement(texts[baseline], texts[key])
+                self.stdout.write(
+                    f"{key[0]} ({key[1]}) vs {baseline[0]} ({baseline[1]}): "
+                    f"{row['agreement_with_baseline']:.1%} text agreement"
+                )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as report_file:
+                json.dump({'images': paths, 'config': options['config'], 'runs': report}, report_file, indent=2)
+            self.stdout.write(f"Report written to {options['json_path']}")
+        self.stdout.write(self.style.SUCCESS('Benchmark complete!')) # type: ignore
+
+    def report_sizes(self, variants):
+        for variant, images in variants.items():
+            megapixels = sum(image.shape[0] * image.shape[1] for _, image in images) / 1e6
+            self.stdout.write(f"{variant:<10} {megapixels:8.2f} megapixels in total")
+
+    def benchmark_engine(self, name, images, config, repeat, timeout):
+        """
+        Time every image `repeat` times on one engine; the first call is a
+        warm-up so engine start-up is reported separately.
+        Returns: (report row, {path: text})
+        """
+        engine = get_ocr_engine(name)
+        started = time.perf_counter()
+        try:
+            engine.recognize(images[0][1], config, timeout)
+        except Exception:
+            pass
+        warmup_ms = 1000 * (time.perf_counter() - started)
+
+        timings, per_image, failures = time_recognitions(
+            lambda image: engine.recognize(image, config, timeout),
+            images,
+            repeat,
+            lambda path, e: self.stdout.write(self.style.WARNING(f"{name} failed on {path}: {e}")) # type: ignore
+        )
+        texts = {path: result.text for path, result, _ in per_image if result is not None}
+        return {'engine': name, 'warmup_ms': warmup_ms, 'failures': failures, **latency_summary(timings)}, texts
+
+    def agreement(self, expected, actual):
+        """Mean character-level similarity of the texts both engines produced"""
+        ratios = [
+            SequenceMatcher(None, expected[path], actual[path]).ratio()
+            for path in expected if path in actual
+        ]
+        return float(np.mean(ratios)) if ratios else 0.0
@@ -0,0 +1,277 @@
+"""
+Management command to benchmark OCR strategies against a corpus of images with ground-truth transcripts
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from main.models import ReferenceAnswer
+from student.management.ocr_benchmark import (
+    image_files,
+    latency_summary,
+    peak_child_rss_mb,
+    peak_rss_mb,
+    peak_worker_rss_mb,
+    reset_peak_rss,
+    time_recognitions,
+)
+from student.ocr import OCR_CONFIGS, character_error_rate, get_ocr_engine, normalize_for_ocr
+from student.ocr.quality import edit_distance, normalize_transcript
+from student.utils import decode_image, ocr_page_pixels
+
+DEFAULT_CORPUS = os.path.join(settings.BASE_DIR, 'ocr_corpus')
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# Uploaded answers the corpus is seeded from, relative to MEDIA_ROOT
+SEED_DIRECTORIES = ['reference_answers', 'subjective_answers']
+
+PIPELINE_STRATEGY = 'pipeline'
+
+
+def config_strategy_name(config):
+    """'--psm 6 --oem 3' -> 'psm_6_oem_3'"""
+    return config.replace('--', '').strip().replace(' ', '_')
+
+
+# The full production pipeline, then each Tesseract config alone on the normalized page
+STRATEGIES = [PIPELINE_STRATEGY] + [config_strategy_name(config) for config in OCR_CONFIGS]
+STRATEGY_CONFIGS = {config_strategy_name(config): config for config in OCR_CONFIGS}
+
+
+class Command(BaseCommand):
+    help = (
+        'Run every OCR strategy over a corpus of images with ground-truth transcripts and report '
+        'latency percentiles, character error rate and peak memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=DEFAULT_CORPUS, help=f'Corpus directory holding {MANIFEST_NAME} (default: {DEFAULT_CORPUS})')
+        parser.add_argument(
+            '--seed',
+            action='store_true',
+            help='Add the answer images under MEDIA_ROOT to the corpus first (typed reference texts become transcripts)'
+        )
+        parser.add_argument(
+            '--strategy',
+            action='append',
+            choices=STRATEGIES,
+            help='Strategy to benchmark (repeatable, default: all)'
+        )
+        parser.add_argument('--limit', type=int, help='Only the first N images of the corpus')
+        parser.add_argument('--repeat', type=int, default=1, help='Runs per image and strategy (default: 1)')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds allowed per single-config recognition (default: 30)')
+        parser.add_argument('--json', dest='json_path', help='Write the report as JSON to this file')
+        parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+        parser.add_argument(
+            '--max-cer-regression',
+            type=float,
+            help='Fail when a strategy\'s character error rate rises more than this over the baseline (e.g. 0.01)'
+        )
+        parser.add_argument(
+            '--max-latency-regression',
+            type=float,
+            help='Fail when a strategy\'s p95 latency grows by more than this fraction of the baseline (e.g. 0.2)'
+        )
+
+    def handle(self, *args, **options):
+        corpus = options['corpus']
+        if options['seed']:
+            added = self.seed_corpus(corpus)
+            self.stdout.write(f"Seeded {added} new images into {corpus}")
+
+        entries = self.load_manifest(corpus)['images']
+        if options['limit']:
+            entries = entries[:options['limit']]
+        if not entries:
+            raise CommandError(f"No images in {os.path.join(corpus, MANIFEST_NAME)}, run with --seed first")
+
+        images = [(entry, decode_image(os.path.join(corpus, entry['file']))) for entry in entries]
+        scored = sum(1 for entry, _ in images if entry.get('text'))
+        self.stdout.write(f"Benchmarking on {len(images)} images, {scored} with ground-truth transcripts")
+        if scored < len(images):
+            self.stdout.write(self.style.WARNING( # type: ignore
+                f"{len(images) - scored} images have no transcript yet; add their 'text' to the manifest to score them"
+            ))
+
+        report = []
+        for name in options['strategy'] or STRATEGIES:
+            row = self.benchmark_strategy(name, images, max(1, options['repeat']), options['timeout'])
+            report.append(row)
+            cer = f"{row['cer']:6.1%}" if row['cer'] is not None else '   n/a'
+            self.stdout.write(
+                f"{name:<14} p50 {row['p50_ms']:8.1f} ms  p90 {row['p90_ms']:8.1f} ms  "
+                f"p95 {row['p95_ms']:8.1f} ms  p99 {row['p99_ms']:8.1f} ms  "
+                f"CER {cer}  peak RSS {row['peak_rss_mb']:7.1f} MB (incl. {row['pool_workers']} OCR workers)  "
+                f"failures {row['failures']}"
+            )
+
+        result = {
+            'manifest_version': MANIFEST_VERSION,
+            'engine': get_ocr_engine().name,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'images': len(images),
+            'scored_images': scored,
+            'strategies': report,
+        }
+        if options['json_path']:
+            with open(options['json_path'], 'w') as report_file:
+                json.dump(result, report_file, indent=2)
+            self.stdout.write(f"Report written to {options['json_path']}")
+
+        if options['baseline']:
+            regressions = self.compare_with_baseline(
+                result, options['baseline'], options['max_cer_regression'], options['max_latency_regression']
+            )
+            if regressions:
+                raise CommandError('OCR regressed against the baseline: ' + '; '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Benchmark complete!')) # type: ignore
+
+    def load_manifest(self, corpus):
+        path = os.path.join(corpus, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return {'version': MANIFEST_VERSION, 'images': []}
+        try:
+            with open(path) as manifest_file:
+                return json.load(manifest_file)
+        except ValueError as e:
+            raise CommandError(f"Invalid manifest {path}: {e}")
+
+    def save_manifest(self, corpus, manifest):
+        path = os.path.join(corpus, MANIFEST_NAME)
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(temporary, path)
+
+    def seed_corpus(self, corpus):
+        """
+        Copy the distinct answer images under MEDIA_ROOT into the corpus.
+        A reference answer's typed text becomes the transcript of its
+        image; other images are added without one for a person to fill in.
+        Returns: number of images added
+        """
+        manifest = self.load_manifest(corpus)
+        known = {entry['sha256'] for entry in manifest['images']}
+        os.makedirs(os.path.join(corpus, 'images'), exist_ok=True)
+
+        typed_texts = {
+            reference.image_answer.name: reference.text_answer
+            for reference in ReferenceAnswer.objects.exclude(image_answer='').exclude(image_answer=None) # type: ignore
+            if (reference.text_answer or '').strip()
+        }
+
+        added = 0
+        for directory in SEED_DIRECTORIES:
+            for path in image_files(os.path.join(settings.MEDIA_ROOT, directory)):
+                with open(path, 'rb') as image_file:
+                    sha256 = hashlib.sha256(image_file.read()).hexdigest()
+                if sha256 in known:
+                    continue
+                name = os.path.basename(path)
+                if os.path.exists(os.path.join(corpus, 'images', name)):
+                    stem, extension = os.path.splitext(name)
+                    name = f"{stem}_{sha256[:8]}{extension}"
+                shutil.copyfile(path, os.path.join(corpus, 'images', name))
+                media_name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+                manifest['images'].append({
+                    'file': f"images/{name}",
+                    'sha256': sha256,
+                    'source': media_name,
+                    'text': typed_texts.get(media_name),
+                })
+                known.add(sha256)
+                added += 1
+        self.save_manifest(corpus, manifest)
+        return added
+
+    def recognize(self, name, pixels, timeout):
+        """OCR one decoded image with a strategy; returns the text ('' when nothing was read)"""
+        if name == PIPELINE_STRATEGY:
+            return ocr_page_pixels(pixels, source='subjective_answer', use_cache=False) or ''
+        result = get_ocr_engine().recognize(normalize_for_ocr(pixels), STRATEGY_CONFIGS[name], timeout)
+        return result.text
+
+    def benchmark_strategy(self, name, images, repeat, timeout):
+        """
+        Time every image `repeat` times with one strategy and score the text
+        of its first run against the transcript. Config statistics the
+        pipeline records while benchmarking are rolled back.
+        Returns: report row
+        """
+        reset_peak_rss()
+        with transaction.atomic():
+            timings, runs, failures = time_recognitions(
+                lambda pixels: self.recognize(name, pixels, timeout),
+                images,
+                repeat,
+                lambda entry, e: self.stdout.write(self.style.WARNING(f"{name} failed on {entry['file']}: {e}")) # type: ignore
+            )
+            transaction.set_rollback(True)
+
+        per_image = []
+        for entry, text, image_timings in runs:
+            text = text or ''
+            expected = entry.get('text')
+            per_image.append({
+                'file': entry['file'],
+                'ms': 1000 * float(np.median(image_timings)) if image_timings else None,
+                'cer': character_error_rate(expected, text) if expected else None,
+                'edits': edit_distance(normalize_transcript(expected), normalize_transcript(text)) if expected else None,
+                'characters': len(normalize_transcript(expected)) if expected else None,
+            })
+        scored = [image for image in per_image if image['cer'] is not None]
+        characters = sum(image['characters'] for image in scored)
+        # The spawned OCR pool workers hold their own memory; count their peaks too
+        main_rss = peak_rss_mb()
+        worker_rss, pool_workers = peak_worker_rss_mb()
+        return {
+            'strategy': name,
+            'failures': failures,
+            **latency_summary(timings, percentiles=(50, 90, 95, 99)),
+            # Corpus CER weighs each image by its length; mean_cer weighs images equally
+            'cer': sum(image['edits'] for image in scored) / characters if characters else None,
+            'mean_cer': float(np.mean([image['cer'] for image in scored])) if scored else None,
+            'peak_rss_mb': main_rss + worker_rss,
+            'peak_main_rss_mb': main_rss,
+            'peak_worker_rss_mb': worker_rss,
+            'pool_workers': pool_workers,
+            'peak_child_rss_mb': peak_child_rss_mb(),
+            'per_image': per_image,
+        }
+
+    def compare_with_baseline(self, result, baseline_path, max_cer_regression, max_latency_regression):
+        """
+        Print each strategy's change against a baseline report.
+        Returns: list of regressions beyond the allowed thresholds
+        """
+        try:
+            with open(baseline_path) as baseline_file:
+                baseline = {row['strategy']: row for row in json.load(baseline_file)['strategies']}
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Cannot read baseline {baseline_path}: {e}")
+
+        regressions = []
+        for row in result['strategies']:
+            before = baseline.get(row['strategy'])
+            if before is None:
+                self.stdout.write(f"{row['strategy']:<14} not in baseline")
+                continue
+            latency_change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+            line = f"{row['strategy']:<14} p95 {before['p95_ms']:8.1f} -> {row['p95_ms']:8.1f} ms ({latency_change:+.1%})"
+            if row['cer'] is not None and before.get('cer') is not None:
+                cer_change = row['cer'] - before['cer']
+                line += f"  CER {before['cer']:6.1%} -> {row['cer']:6.1%} ({cer_change:+.1%})"
+                if max_cer_regression is not None and cer_change > max_cer_regression:
+                    regressions.append(f"{row['strategy']} CER {cer_change:+.1%}")
+            if max_latency_regression is not None and latency_change > max_latency_regression:
+                regressions.append(f"{row['strategy']} p95 latency {latency_change:+.1%}")
+            self.stdout.write(line)
+        return regressions
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from student.ocr_batches import OCR_BATCH_RETENTION_DAYS, delete_ocr_batches
+
+class Command(BaseCommand):
+    help = 'Delete batch OCR uploads older than the retention period together with their stored images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=OCR_BATCH_RETENTION_DAYS,
+            help=f'Delete batches created more than this many days ago (default: {OCR_BATCH_RETENTION_DAYS})'
+        )
+
+    def handle(self, *args, **options):
+        batches, images = delete_ocr_batches(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {batches} OCR batches and {images} stored images')) # type: ignore
@@ -0,0 +1,184 @@
+"""
+Management command to regrade an exam's subjective answers offline across a process pool
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, time
+import os
+import logging
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from main.models import Exam_Model
+from student.models import StuExam_DB, SubjectiveAnswer
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    """Make Django usable in a pool worker (a no-op for forked workers)"""
+    django.setup()
+
+
+def grade_chunk(question_id, answer_ids, exam_id=None):
+    """
+    Grade one chunk of answers to a single question.
+    Returns: list of (answer_id, marks, feedback)
+    """
+    from main.models import Question_DB
+    from student.utils import grade_answers_batch
+
+    question = Question_DB.objects.get(pk=question_id) # type: ignore
+    exam = Exam_Model.objects.filter(pk=exam_id).first() if exam_id else None # type: ignore
+    answers = list(SubjectiveAnswer.objects.filter(pk__in=answer_ids)) # type: ignore
+    results = grade_answers_batch(question, answers, exam=exam)
+    return [
+        (answer.pk, marks, feedback)
+        for answer, (marks, feedback, best_reference) in zip(answers, results)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Regrade the subjective answers of an exam in parallel and write the marks back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exam', help='Exam name (or id with --id)')
+        parser.add_argument('--id', action='store_true', help='Treat the exam argument as an Exam_Model id')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of grading processes (default: all cores, 1 grades inline)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Answers per grading task (default: 200)'
+        )
+        parser.add_argument('--only-ungraded', action='store_true', help='Skip answers that were already graded')
+        parser.add_argument('--since', help='Only answers submitted on or after this date/datetime (ISO 8601)')
+        parser.add_argument('--dry-run', action='store_true', help='Grade and report without writing marks')
+
+    def handle(self, *args, **options):
+        exam = self.get_exam(options['exam'], options['id'])
+        answers = self.get_answers(exam, options['only_ungraded'], options['since'])
+        chunks = self.make_chunks(answers, max(1, options['chunk_size']))
+        total = sum(len(answer_ids) for _, answer_ids in chunks)
+
+        self.stdout.write(f"Grading {total} answers for exam '{exam.name}' in {len(chunks)} chunks...")
+        if options['dry_run']:
+            self.stdout.write("DRY RUN MODE - No marks will be written")
+        if not total:
+            self.stdout.write(self.style.WARNING('No answers to grade.')) # type: ignore
+            return
+
+        started = timezone.now()
+        results = self.run_chunks(chunks, max(1, options['workers']), exam.pk)
+        elapsed = max((timezone.now() - started).total_seconds(), 1e-6)
+
+        changed = self.write_results(results, options['dry_run'])
+        if not options['dry_run']:
+            self.update_exam_scores(exam)
+
+        rate = len(results) / elapsed
+        summary = f"Graded {len(results)} answers in {elapsed:.2f}s ({rate:.1f} answers/s), {changed} marks changed"
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"DRY RUN: {summary}")) # type: ignore
+        else:
+            self.stdout.write(self.style.SUCCESS(summary)) # type: ignore
+
+    def get_exam(self, value, by_id):
+        try:
+            if by_id:
+                return Exam_Model.objects.get(pk=value) # type: ignore
+            return Exam_Model.objects.get(name=value) # type: ignore
+        except (Exam_Model.DoesNotExist, ValueError): # type: ignore
+            raise CommandError(f"Exam '{value}' not found")
+
+    def get_answers(self, exam, only_ungraded, since):
+        answers = SubjectiveAnswer.objects.filter( # type: ignore
+            question__in=exam.question_paper.questions.all(),
+            student__student_groups__in=exam.student_group.all(),
+            is_teacher_graded=False,  # Never overwrite a teacher's marks
+        ).distinct()
+        if only_ungraded:
+            answers = answers.filter(is_auto_graded=False)
+        if since:
+            answers = answers.filter(submitted_at__gte=self.parse_since(since))
+        return answers.order_by('question_id', 'pk')
+
+    def parse_since(self, value):
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f"Invalid --since value '{value}', expected an ISO 8601 date or datetime")
+            moment = datetime.combine(day, time.min)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def make_chunks(self, answers, chunk_size):
+        """Split answers into per-question chunks so each task is one batch grade"""
+        chunks = []
+        current_question = None
+        for question_id, answer_id in answers.values_list('question_id', 'pk'):
+            if question_id != current_question or len(chunks[-1][1]) >= chunk_size:
+                chunks.append((question_id, []))
+                current_question = question_id
+            chunks[-1][1].append(answer_id)
+        return chunks
+
+    def run_chunks(self, chunks, workers, exam_id):
+        if workers == 1 or len(chunks) == 1:
+            results = []
+            for question_id, answer_ids in chunks:
+                results.extend(grade_chunk(question_id, answer_ids, exam_id))
+            return results
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = {
+                executor.submit(grade_chunk, question_id, answer_ids, exam_id): question_id
+                for question_id, answer_ids in chunks
+            }
+            for future in as_completed(futures):
+                try:
+                    results.extend(future.result())
+                except Exception as e:
+                    logger.error(f"Error grading chunk for question {futures[future]}: {e}")
+                    self.stdout.write(self.style.ERROR(f"Failed to grade a chunk of Q{futures[future]}: {e}")) # type: ignore
+        return results
+
+    def write_results(self, results, dry_run):
+        answers = SubjectiveAnswer.objects.in_bulk([answer_id for answer_id, _, _ in results]) # type: ignore
+        graded_at = timezone.now()
+        changed = 0
+        updated = []
+        for answer_id, marks, feedback in results:
+            answer = answers[answer_id]
+            if answer.marks != marks:
+                changed += 1
+            answer.marks = marks
+            answer.feedback = feedback
+            answer.is_auto_graded = True
+            answer.graded_at = graded_at
+            updated.append(answer)
+        if not dry_run:
+            SubjectiveAnswer.objects.bulk_update( # type: ignore
+                updated, ['marks', 'feedback', 'is_auto_graded', 'graded_at'], batch_size=500
+            )
+        return changed
+
+    def update_exam_scores(self, exam):
+        """Recompute each completed exam's score and ExamResults record from the rewritten marks"""
+        from student.utils import finalize_exam_results
+
+        for stu_exam in StuExam_DB.objects.filter(examname=exam.name, completed=1): # type: ignore
+            finalize_exam_results(stu_exam, exam_main=exam)
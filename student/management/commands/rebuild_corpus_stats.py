@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from main.models import Question_DB
+from student.models import SubjectiveAnswer
+from student.utils import rebuild_corpus_stats
+
+class Command(BaseCommand):
+    help = 'Rebuild per-question document frequency tables used for cohort IDF from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--question', type=int, action='append', help='Only rebuild this question number (repeatable)')
+
+    def handle(self, *args, **options):
+        question_ids = SubjectiveAnswer.objects.values_list('question_id', flat=True).distinct() # type: ignore
+        if options['question']:
+            question_ids = question_ids.filter(question_id__in=options['question'])
+        questions = Question_DB.objects.filter(qno__in=list(question_ids)) # type: ignore
+
+        self.stdout.write(f'Rebuilding corpus statistics for {questions.count()} questions...')
+
+        for question in questions:
+            stats = rebuild_corpus_stats(question)
+            self.stdout.write(
+                f'  - Q{question.qno}: {stats.document_count} answers, {len(stats.document_frequency)} terms'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Corpus statistics rebuilt!')) # type: ignore
@@ -0,0 +1,96 @@
+"""
+Management command to drain the OCR/grading job queue
+"""
+from multiprocessing import Process
+import logging
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from student.jobs import (
+    GRADING_JOB_LEASE_SECONDS,
+    claim_jobs,
+    default_worker_name,
+    process_jobs,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run OCR and grading jobs queued by exam submissions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help='Number of local worker processes (default: 1)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20,
+            help='Jobs claimed per round (default: 20)'
+        )
+        parser.add_argument(
+            '--lease-seconds',
+            type=int,
+            default=GRADING_JOB_LEASE_SECONDS,
+            help=f'Seconds before a claimed job may be reclaimed (default: {GRADING_JOB_LEASE_SECONDS})'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to sleep when the queue is empty (default: 2)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        if processes == 1:
+            self.run_worker(options)
+            return
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        children = [Process(target=self.run_worker, args=(options,)) for _ in range(processes)]
+        for child in children:
+            child.start()
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+
+    def run_worker(self, options):
+        worker = default_worker_name()
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+
+        self.stdout.write(f'Grading worker {worker} started')
+        total_done = 0
+        total_failed = 0
+        while not stopping:
+            jobs = claim_jobs(worker, max(1, options['batch_size']), lease_seconds=options['lease_seconds'])
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+            done, failed = process_jobs(jobs)
+            total_done += done
+            total_failed += failed
+            self.stdout.write(f'{worker}: {done} jobs done, {failed} failed')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Grading worker {worker} stopped: {total_done} done, {total_failed} failed') # type: ignore
+        )
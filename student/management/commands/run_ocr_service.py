@@ -0,0 +1,56 @@
+"""
+Management command to run the local OCR service web workers send uploads to
+"""
+import logging
+import os
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from student.ocr_service import DEFAULT_SOCKET, OCRService, ocr_service_socket
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Serve OCR over a Unix socket with a fixed worker count and a bounded queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            help=f'Unix socket path (default: OCR_SERVICE_SOCKET or {DEFAULT_SOCKET})'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'OCR_SERVICE_WORKERS', os.cpu_count() or 1),
+            help='Images OCR\'d at the same time (default: OCR_SERVICE_WORKERS)'
+        )
+        parser.add_argument(
+            '--queue-size',
+            type=int,
+            default=getattr(settings, 'OCR_SERVICE_QUEUE_SIZE', 16),
+            help='Images waiting for a worker before clients are told the service is busy (default: OCR_SERVICE_QUEUE_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        socket_path = options['socket'] or ocr_service_socket() or DEFAULT_SOCKET
+        service = OCRService(socket_path, options['workers'], options['queue_size'])
+
+        # shutdown() waits for serve_forever() to return, so it cannot run on the serving thread
+        def stop(signum, frame):
+            threading.Thread(target=service.shutdown).start()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(
+            f"OCR service listening on {socket_path} with {service.workers} workers "
+            f"and {max(0, options['queue_size'])} queue slots"
+        )
+        service.serve_forever()
+        self.stdout.write(self.style.SUCCESS( # type: ignore
+            f"OCR service stopped: {service.stats['accepted']} accepted, {service.stats['busy']} turned away busy, "
+            f"{service.stats['failed']} failed"
+        ))
@@ -0,0 +1,129 @@
+"""
+Shared parts of the OCR benchmark commands: finding images, timing
+recognitions, latency percentiles and peak memory.
+"""
+import glob
+import multiprocessing
+import os
+import resource
+import time
+
+import numpy as np
+from django.core.management.base import CommandError
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff')
+
+
+def image_files(directory):
+    """Image files directly inside a directory, sorted by name"""
+    return sorted(
+        path for path in glob.glob(os.path.join(directory, '*'))
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def find_images(targets):
+    """Expand image files and directories of images into a list of paths"""
+    paths = []
+    for target in targets:
+        if os.path.isdir(target):
+            paths.extend(image_files(target))
+        elif os.path.isfile(target):
+            paths.append(target)
+        else:
+            raise CommandError(f"Image '{target}' not found")
+    return paths
+
+
+def time_recognitions(recognize, images, repeat, on_failure):
+    """
+    Call recognize(image) `repeat` times per image, timing each call.
+    images: list of (label, image)
+    on_failure: called with (label, exception) for each failed call
+    Returns: (all timings in seconds, [(label, first result or None, that image's timings)], failure count)
+    """
+    timings = []
+    per_image = []
+    failures = 0
+    for label, image in images:
+        first = None
+        image_timings = []
+        for run in range(repeat):
+            started = time.perf_counter()
+            try:
+                result = recognize(image)
+            except Exception as e:
+                failures += 1
+                on_failure(label, e)
+                continue
+            image_timings.append(time.perf_counter() - started)
+            if run == 0:
+                first = result
+        timings.extend(image_timings)
+        per_image.append((label, first, image_timings))
+    return timings, per_image, failures
+
+
+def latency_summary(timings, percentiles=(50, 95)):
+    """Mean, max and the given percentiles of timings (seconds) in milliseconds"""
+    timings_ms = 1000 * np.array(timings or [0.0])
+    summary = {'runs': len(timings), 'mean_ms': float(timings_ms.mean())}
+    for percentile in percentiles:
+        summary[f'p{percentile}_ms'] = float(np.percentile(timings_ms, percentile))
+    summary['max_ms'] = float(timings_ms.max())
+    total_seconds = float(sum(timings))
+    summary['images_per_second'] = len(timings) / total_seconds if total_seconds else 0.0
+    return summary
+
+
+def _live_workers():
+    """PIDs of this process's running multiprocessing children (the spawned OCR pool workers)"""
+    return [child.pid for child in multiprocessing.active_children()]
+
+
+def reset_peak_rss():
+    """
+    Reset the kernel's resident-set high-water mark for this process and its
+    live OCR pool workers (Linux only)
+    """
+    reset = True
+    for pid in ['self'] + _live_workers():
+        try:
+            with open(f'/proc/{pid}/clear_refs', 'w') as clear_refs:
+                clear_refs.write('5')
+        except OSError:
+            reset = False
+    return reset
+
+
+def _vm_hwm_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process since the last reset, in MB"""
+    peak = _vm_hwm_mb('self')
+    if peak is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak
+
+
+def peak_worker_rss_mb():
+    """
+    Summed peak resident sets of the live OCR pool workers since the last
+    reset, in MB, and how many workers were counted
+    """
+    peaks = [peak for peak in map(_vm_hwm_mb, _live_workers()) if peak is not None]
+    return sum(peaks), len(peaks)
+
+
+def peak_child_rss_mb():
+    """Largest resident set of any finished child process (e.g. a tesseract call), in MB"""
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
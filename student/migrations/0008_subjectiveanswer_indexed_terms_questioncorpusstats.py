@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_referenceanswer_analysis'),
+        ('student', '0007_alter_stuexam_db_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subjectiveanswer',
+            name='indexed_terms',
+            field=models.JSONField(blank=True, help_text="Stemmed n-grams counted in the question's corpus statistics", null=True),
+        ),
+        migrations.CreateModel(
+            name='QuestionCorpusStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_count', models.IntegerField(default=0, help_text='Number of answers counted')),
+                ('document_frequency', models.JSONField(default=dict, help_text='Number of counted answers containing each n-gram')),
+                ('analysis_version', models.IntegerField(default=0, help_text='Analyzer version the statistics were built with')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='corpus_stats', to='main.question_db')),
+            ],
+            options={
+                'verbose_name': 'Question Corpus Statistics',
+                'verbose_name_plural': 'Question Corpus Statistics',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student', '0008_subjectiveanswer_indexed_terms_questioncorpusstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0, help_text='Number of times a worker has claimed this job')),
+                ('max_attempts', models.IntegerField(default=3)),
+                ('lease_expires_at', models.DateTimeField(blank=True, help_text='Running jobs past this time may be reclaimed', null=True)),
+                ('worker', models.CharField(blank=True, help_text='Worker holding the lease', max_length=100)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('answer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grading_jobs', to='student.subjectiveanswer')),
+                ('student_exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grading_jobs', to='student.stuexam_db')),
+            ],
+            options={
+                'verbose_name': 'Grading Job',
+                'verbose_name_plural': 'Grading Jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'lease_expires_at'], name='student_gra_status_9c064a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student', '0009_gradingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRConfigStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Where the images come from, e.g. subjective_answer', max_length=50)),
+                ('preprocessing', models.CharField(default='none', help_text='Preprocessing applied before OCR', max_length=20)),
+                ('config', models.CharField(help_text='Tesseract command line options', max_length=50)),
+                ('runs', models.IntegerField(default=0)),
+                ('wins', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'OCR Config Statistic',
+                'verbose_name_plural': 'OCR Config Statistics',
+                'unique_together': {('source', 'preprocessing', 'config')},
+            },
+        ),
+    ]
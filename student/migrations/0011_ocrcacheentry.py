@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student', '0010_ocrconfigstat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_sha256', models.CharField(help_text='SHA-256 of the decoded RGB pixel data', max_length=64)),
+                ('pipeline_version', models.IntegerField(help_text='OCR preprocessing/config version the text was produced with')),
+                ('text', models.TextField()),
+                ('config', models.CharField(blank=True, help_text='Config that produced the text', max_length=80)),
+                ('mean_confidence', models.FloatField(default=0.0)),
+                ('hits', models.IntegerField(default=0, help_text='Times this entry saved an OCR run')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'OCR Cache Entry',
+                'verbose_name_plural': 'OCR Cache Entries',
+                'unique_together': {('image_sha256', 'pipeline_version')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student', '0013_ocrbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRPreprocessingStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Where the images come from, e.g. subjective_answer', max_length=50)),
+                ('bucket', models.CharField(help_text='Contrast, background, skew and noise bucket of the page', max_length=20)),
+                ('preprocessing', models.CharField(help_text='Preprocessing applied before OCR', max_length=20)),
+                ('runs', models.IntegerField(default=0)),
+                ('successes', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'OCR Preprocessing Statistic',
+                'verbose_name_plural': 'OCR Preprocessing Statistics',
+                'unique_together': {('source', 'bucket', 'preprocessing')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student', '0014_ocrpreprocessingstat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrbatchitem',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ocrbatchitem',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, help_text="A running image whose lease expired is OCR'd again", null=True),
+        ),
+    ]
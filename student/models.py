@@ -1,5 +1,9 @@
 from pickletools import int4
+import uuid
+from django.core.validators import FileExtensionValidator
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from main.models import *
 from django.contrib.auth.models import User
 
@@ -143,7 +147,13 @@ class SubjectiveAnswer(models.Model):
     question = models.ForeignKey(Question_DB, on_delete=models.CASCADE)
     student = models.ForeignKey(User, limit_choices_to={'groups__name': "Student"}, on_delete=models.CASCADE)
     text_answer = models.TextField(blank=True, null=True)
-    image_answer = models.ImageField(upload_to='subjective_answers/', blank=True, null=True)
+    image_answer = models.FileField(
+        upload_to='subjective_answers/',
+        blank=True,
+        null=True,
+        validators=[FileExtensionValidator(ANSWER_FILE_EXTENSIONS)],
+        help_text="Handwritten answer image or multi-page PDF"
+    )
     ocr_text = models.TextField(blank=True, null=True)
     marks = models.IntegerField(default=0, help_text="Marks awarded")
     max_marks = models.IntegerField(default=5, help_text="Maximum marks for this question")
@@ -154,6 +164,7 @@ class SubjectiveAnswer(models.Model):
     submitted_at = models.DateTimeField(auto_now_add=True)
     graded_at = models.DateTimeField(null=True, blank=True)
     graded_by = models.ForeignKey(User, limit_choices_to={'groups__name': "Professor"}, on_delete=models.SET_NULL, null=True, blank=True, related_name='graded_subjective_answers', help_text="Teacher who graded this answer")
+    indexed_terms = models.JSONField(blank=True, null=True, help_text="Stemmed n-grams counted in the question's corpus statistics")
     
     class Meta:
         verbose_name = "Subjective Answer"
@@ -171,5 +182,211 @@ class SubjectiveAnswer(models.Model):
         """Check if this answer meets the passing threshold"""
         return self.get_percentage() >= passing_threshold
     
+    def is_pdf_answer(self):
+        return bool(self.image_answer) and self.image_answer.name.lower().endswith('.pdf')
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._synced_text = None if self._state.adding else self._corpus_text()
+    
+    def _corpus_text(self):
+        """Text counted in the corpus statistics (typed text, then OCR text), or None when not loaded"""
+        if 'text_answer' not in self.__dict__ or 'ocr_text' not in self.__dict__:
+            return None
+        return self.text_answer or self.ocr_text or ''
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Keep the question's document frequencies in step with this answer's text;
+        # saves that only change marks or feedback skip the analysis and the lock
+        text = self._corpus_text()
+        if text is None or text != self._synced_text:
+            from student.utils import sync_corpus_stats
+            sync_corpus_stats(self)
+            self._synced_text = text
+    
     def __str__(self):
         return f'{self.student.username} - Q{self.question.qno} ({self.marks}/{self.max_marks})'
+
+
+@receiver(post_delete, sender=SubjectiveAnswer)
+def remove_deleted_answer_from_corpus(sender, instance, **kwargs):
+    from student.utils import remove_from_corpus_stats
+    remove_from_corpus_stats(instance)
+
+
+class QuestionCorpusStats(models.Model):
+    """Document frequencies of stemmed n-grams across all submitted answers to a question"""
+    question = models.OneToOneField(Question_DB, on_delete=models.CASCADE, related_name='corpus_stats')
+    document_count = models.IntegerField(default=0, help_text="Number of answers counted")
+    document_frequency = models.JSONField(default=dict, help_text="Number of counted answers containing each n-gram")
+    analysis_version = models.IntegerField(default=0, help_text="Analyzer version the statistics were built with")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Question Corpus Statistics"
+        verbose_name_plural = "Question Corpus Statistics"
+    
+    def __str__(self):
+        return f'Q{self.question_id} corpus ({self.document_count} answers)'
+
+
+class GradingJob(models.Model):
+    """Queued OCR and grading work for one submitted answer, drained by run_grading_worker"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    student_exam = models.ForeignKey(StuExam_DB, on_delete=models.CASCADE, related_name='grading_jobs')
+    answer = models.ForeignKey(SubjectiveAnswer, on_delete=models.CASCADE, related_name='grading_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    attempts = models.IntegerField(default=0, help_text="Number of times a worker has claimed this job")
+    max_attempts = models.IntegerField(default=3)
+    lease_expires_at = models.DateTimeField(null=True, blank=True, help_text="Running jobs past this time may be reclaimed")
+    worker = models.CharField(max_length=100, blank=True, help_text="Worker holding the lease")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Grading Job"
+        verbose_name_plural = "Grading Jobs"
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'lease_expires_at'])]
+    
+    def __str__(self):
+        return f'Grading job {self.pk} for answer {self.answer_id} ({self.status})'
+
+
+class OCRConfigStat(models.Model):
+    """How often an OCR config ran and won for one image source, used to order future attempts"""
+    source = models.CharField(max_length=50, help_text="Where the images come from, e.g. subjective_answer")
+    preprocessing = models.CharField(max_length=20, default='none', help_text="Preprocessing applied before OCR")
+    config = models.CharField(max_length=50, help_text="Tesseract command line options")
+    runs = models.IntegerField(default=0)
+    wins = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "OCR Config Statistic"
+        verbose_name_plural = "OCR Config Statistics"
+        unique_together = ['source', 'preprocessing', 'config']
+    
+    def win_rate(self):
+        """Smoothed share of runs this config won (0.5 before any run)"""
+        return (self.wins + 1) / (self.runs + 2)
+    
+    def __str__(self):
+        return f'{self.source}/{self.preprocessing} {self.config}: {self.wins}/{self.runs} wins'
+
+
+class OCRPreprocessingStat(models.Model):
+    """How often a preprocessing pipeline gave confident OCR text on pages of one feature bucket"""
+    source = models.CharField(max_length=50, help_text="Where the images come from, e.g. subjective_answer")
+    bucket = models.CharField(max_length=20, help_text="Contrast, background, skew and noise bucket of the page")
+    preprocessing = models.CharField(max_length=20, help_text="Preprocessing applied before OCR")
+    runs = models.IntegerField(default=0)
+    successes = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "OCR Preprocessing Statistic"
+        verbose_name_plural = "OCR Preprocessing Statistics"
+        unique_together = ['source', 'bucket', 'preprocessing']
+    
+    def success_rate(self):
+        """Smoothed share of runs that gave confident text (0.5 before any run)"""
+        return (self.successes + 1) / (self.runs + 2)
+    
+    def __str__(self):
+        return f'{self.source}/{self.bucket} {self.preprocessing}: {self.successes}/{self.runs} confident'
+
+
+class OCRCacheEntry(models.Model):
+    """OCR text of an image, keyed by a hash of its decoded pixels and the OCR pipeline version"""
+    image_sha256 = models.CharField(max_length=64, help_text="SHA-256 of the decoded RGB pixel data")
+    pipeline_version = models.IntegerField(help_text="OCR preprocessing/config version the text was produced with")
+    text = models.TextField()
+    config = models.CharField(max_length=80, blank=True, help_text="Config that produced the text")
+    mean_confidence = models.FloatField(default=0.0)
+    hits = models.IntegerField(default=0, help_text="Times this entry saved an OCR run")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "OCR Cache Entry"
+        verbose_name_plural = "OCR Cache Entries"
+        unique_together = ['image_sha256', 'pipeline_version']
+    
+    def __str__(self):
+        return f'OCR cache {self.image_sha256[:12]} v{self.pipeline_version} ({self.hits} hits)'
+
+
+class OCRBatch(models.Model):
+    """A set of images uploaded together for OCR, processed in the background and polled by job ID"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+    ]
+    
+    job_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='ocr_batches')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    version = models.IntegerField(default=0, help_text="Bumped on every item change; the status ETag")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "OCR Batch"
+        verbose_name_plural = "OCR Batches"
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f'OCR batch {self.job_id} ({self.status})'
+
+
+class OCRBatchItem(models.Model):
+    """One image of an OCRBatch and its OCR text once processed"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    batch = models.ForeignKey(OCRBatch, on_delete=models.CASCADE, related_name='items')
+    position = models.IntegerField(help_text="Order of the image in the upload")
+    image = models.FileField(upload_to='ocr_batches/')
+    original_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    text = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    lease_expires_at = models.DateTimeField(null=True, blank=True, help_text="A running image whose lease expired is OCR'd again")
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "OCR Batch Item"
+        verbose_name_plural = "OCR Batch Items"
+        ordering = ['position']
+        unique_together = ['batch', 'position']
+    
+    def __str__(self):
+        return f'OCR batch {self.batch.job_id} image {self.position} ({self.status})' # type: ignore
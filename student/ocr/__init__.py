@@ -0,0 +1,27 @@
+"""
+OCR helpers used by student.utils.extract_text_from_image.
+"""
+from .cache import OCR_PIPELINE_VERSION, get_cached_ocr, image_pixel_hash, ocr_cache_stats, store_ocr_result
+from .engines import OCREngine, available_engines, get_ocr_engine, parse_config, resolve_engine_name
+from .layout import TextBlock, segment_blocks
+from .normalize import estimate_text_height, normalize_for_ocr
+from .pdf import OCR_PDF_MAX_PAGES, is_pdf, iter_pdf_pages, pdf_page_count, pdf_support_available
+from .preprocess import (
+    ImageFeatures,
+    apply_preprocessing,
+    feature_bucket,
+    image_features,
+    ordered_preprocessing,
+    record_preprocessing_outcome,
+)
+from .pool import (
+    OCR_CONFIGS,
+    OCR_IMAGE_DEADLINE_SECONDS,
+    get_ocr_pool,
+    run_config_sweep,
+    run_regions,
+    run_tesseract_config,
+    shutdown_ocr_pool,
+)
+from .quality import OCRResult, character_error_rate, is_confident, result_quality
+from .strategy import ocr_with_early_exit, ordered_configs, recognize_image, recognize_page, record_ocr_outcome
@@ -0,0 +1,100 @@
+"""
+Persistent OCR result cache.
+
+Uploads are often byte-for-byte or pixel-for-pixel copies of earlier ones
+(re-submitted answers, reference answers saved again), so OCR text is stored
+per hash of the decoded pixels. Hashing pixels rather than file bytes makes
+re-encoded copies of the same image hit as well. Entries are tied to
+OCR_PIPELINE_VERSION so changing preprocessing or configs never serves stale
+text.
+"""
+import hashlib
+import logging
+import threading
+
+import numpy as np
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from student.models import OCRCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever preprocessing, configs or acceptance rules change
+OCR_PIPELINE_VERSION = 5
+
+_ocr_cache_counters = {'hits': 0, 'misses': 0}
+_ocr_cache_lock = threading.Lock()
+
+
+def image_pixel_hash(image):
+    """SHA-256 of an image's mode, size and decoded pixel data (PIL image or RGB/grayscale array)"""
+    if isinstance(image, np.ndarray):
+        mode = 'L' if image.ndim == 2 else 'RGB'
+        height, width = image.shape[:2]
+        data = np.ascontiguousarray(image).tobytes()
+    else:
+        mode = image.mode
+        width, height = image.size
+        data = image.tobytes()
+    digest = hashlib.sha256(f'{mode}:{width}x{height}:'.encode('ascii'))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def _count(hits, misses):
+    with _ocr_cache_lock:
+        _ocr_cache_counters['hits'] += hits
+        _ocr_cache_counters['misses'] += misses
+
+
+def get_cached_ocr(image_sha256):
+    """Return the cached OCRCacheEntry for a pixel hash under the current pipeline, or None"""
+    try:
+        entry = OCRCacheEntry.objects.filter( # type: ignore
+            image_sha256=image_sha256,
+            pipeline_version=OCR_PIPELINE_VERSION
+        ).first()
+    except Exception as e:
+        logger.error(f"Error reading OCR cache: {e}")
+        entry = None
+    if entry is None:
+        _count(0, 1)
+        return None
+    _count(1, 0)
+    OCRCacheEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_hit_at=timezone.now()) # type: ignore
+    return entry
+
+
+def store_ocr_result(image_sha256, result):
+    """Remember the OCR result for a pixel hash; only successful results are cached"""
+    if result is None or not result.text:
+        return
+    try:
+        OCRCacheEntry.objects.update_or_create( # type: ignore
+            image_sha256=image_sha256,
+            pipeline_version=OCR_PIPELINE_VERSION,
+            defaults={
+                'text': result.text,
+                'config': result.config,
+                'mean_confidence': result.mean_confidence,
+            }
+        )
+    except Exception as e:
+        logger.error(f"Error writing OCR cache: {e}")
+
+
+def ocr_cache_stats():
+    """Return OCR cache hit/miss counters for this process and the stored entry totals"""
+    with _ocr_cache_lock:
+        hits = _ocr_cache_counters['hits']
+        misses = _ocr_cache_counters['misses']
+    lookups = hits + misses
+    entries = OCRCacheEntry.objects.filter(pipeline_version=OCR_PIPELINE_VERSION) # type: ignore
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / lookups if lookups else 0.0,
+        'entries': entries.count(),
+        'stored_hits': entries.aggregate(total=Sum('hits'))['total'] or 0,
+    }
@@ -0,0 +1,130 @@
+"""
+OCR engines behind one interface.
+
+The pytesseract engine starts a tesseract executable per call, which reloads
+the language data every time. When the optional tesserocr binding is
+installed, the tesserocr engine keeps initialized Tesseract API instances for
+the lifetime of the process (one per thread and engine mode) and only swaps
+the image and page segmentation mode between calls.
+"""
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+import pytesseract
+from django.conf import settings
+from PIL import Image
+
+from .quality import OCRResult, result_from_data, text_density
+
+try:
+    import tesserocr
+except ImportError:  # optional dependency
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+# 'auto' uses tesserocr when installed and falls back to pytesseract
+OCR_ENGINE = getattr(settings, 'OCR_ENGINE', 'auto')
+OCR_LANGUAGE = getattr(settings, 'OCR_LANGUAGE', 'eng')
+
+# Configure pytesseract to use the correct Tesseract path on Windows
+if os.name == 'nt':  # Windows
+    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+
+def parse_config(config):
+    """Return (psm, oem) from a Tesseract option string; None for options not given"""
+    psm = re.search(r'--psm\s+(\d+)', config)
+    oem = re.search(r'--oem\s+(\d+)', config)
+    return (int(psm.group(1)) if psm else None, int(oem.group(1)) if oem else None)
+
+
+class OCREngine:
+    """Recognizes one image with one Tesseract config"""
+    name = None
+
+    def recognize(self, image, config, timeout):
+        """
+        OCR an image (PIL image or NumPy array) with a Tesseract option
+        string, giving up after timeout seconds.
+        Returns: OCRResult
+        """
+        raise NotImplementedError
+
+
+class PytesseractEngine(OCREngine):
+    """Runs the tesseract executable through pytesseract for every call"""
+    name = 'pytesseract'
+
+    def recognize(self, image, config, timeout):
+        data = pytesseract.image_to_data(image, config=config, timeout=timeout, output_type=pytesseract.Output.DICT)
+        return result_from_data(config, data)
+
+
+class TesserocrEngine(OCREngine):
+    """Reuses initialized Tesseract API instances through the tesserocr C API binding"""
+    name = 'tesserocr'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _api(self, oem):
+        apis = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = self._local.apis = {}
+        if oem not in apis:
+            if oem is None:
+                apis[oem] = tesserocr.PyTessBaseAPI(lang=OCR_LANGUAGE)
+            else:
+                apis[oem] = tesserocr.PyTessBaseAPI(lang=OCR_LANGUAGE, oem=oem)
+        return apis[oem]
+
+    def recognize(self, image, config, timeout):
+        psm, oem = parse_config(config)
+        api = self._api(oem)
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        api.SetPageSegMode(psm if psm is not None else tesserocr.PSM.AUTO)
+        api.SetImage(image)
+        if not api.Recognize(timeout=int(timeout * 1000)):
+            raise RuntimeError(f"Tesseract timed out after {timeout}s")
+        text = '\n'.join(line.strip() for line in api.GetUTF8Text().splitlines() if line.strip())
+        confidences = [conf for conf in api.AllWordConfidences() if conf >= 0]
+        mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+        return OCRResult(config, text, float(mean_confidence), len(confidences), text_density(text))
+
+
+_engine_classes = {
+    PytesseractEngine.name: PytesseractEngine,
+    TesserocrEngine.name: TesserocrEngine,
+}
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def available_engines():
+    """Names of the engines usable in this environment"""
+    return [name for name in _engine_classes if name != TesserocrEngine.name or tesserocr is not None]
+
+
+def resolve_engine_name(name=None):
+    """Map a configured engine name (or 'auto') to an available engine"""
+    name = name or OCR_ENGINE
+    if name == 'auto':
+        return TesserocrEngine.name if tesserocr is not None else PytesseractEngine.name
+    if name not in available_engines():
+        logger.warning(f"OCR engine '{name}' is not available, using pytesseract")
+        return PytesseractEngine.name
+    return name
+
+
+def get_ocr_engine(name=None):
+    """Return this process's long-lived instance of an engine"""
+    name = resolve_engine_name(name)
+    with _engines_lock:
+        if name not in _engines:
+            _engines[name] = _engine_classes[name]()
+        return _engines[name]
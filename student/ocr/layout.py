@@ -0,0 +1,116 @@
+"""
+Layout analysis for pages holding several answers.
+
+A page is split into text blocks with projection profiles: rows of the ink
+mask without ink separate text lines, and lines separated by a gap of more
+than BLOCK_GAP_FACTOR line heights start a new block. Each block is cropped
+to its own columns so it can be OCR'd on its own, with a config suited to
+its line count, and the block texts are reassembled top to bottom.
+"""
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+from .engines import parse_config
+from .normalize import MIN_GLYPH_HEIGHT, ink_mask
+
+# Pages with fewer blocks are OCR'd whole
+OCR_SEGMENT_MIN_BLOCKS = getattr(settings, 'OCR_SEGMENT_MIN_BLOCKS', 2)
+
+# Gap between lines, in median line heights, that separates two blocks
+BLOCK_GAP_FACTOR = 1.5
+
+# Rows with less ink than this share of a busy text row separate lines
+LINE_GAP_INK_SHARE = 0.1
+
+# Pixels kept around each block
+BLOCK_PADDING = 8
+
+# Page segmentation modes that read a single line or word
+SINGLE_LINE_PSMS = {7, 8, 13}
+
+BLOCK_CONFIG = '--psm 6'  # Uniform block of text
+LINE_CONFIG = '--psm 7'   # Single text line
+
+TextBlock = namedtuple('TextBlock', ['top', 'bottom', 'left', 'right', 'line_count'])
+
+
+def remove_rules(mask):
+    """Drop ruled lines (ink runs spanning a fifth of the page width) from an ink mask"""
+    width = max(mask.shape[1] // 5, 1)
+    rules = cv2.morphologyEx(mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (width, 1)))
+    return cv2.subtract(mask, rules)
+
+
+def _runs(flags):
+    """(start, end) of each run of True values"""
+    edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def find_text_lines(mask):
+    """(top, bottom) rows of each text line, from the horizontal projection profile"""
+    profile = np.count_nonzero(mask, axis=1)
+    if not profile.any():
+        return []
+    # Rows between handwritten lines still catch ascenders, descenders and
+    # specks, so a row counts as a gap below a share of a busy text row
+    threshold = max(2, mask.shape[1] // 200, LINE_GAP_INK_SHARE * np.percentile(profile[profile > 0], 90))
+    return [
+        (int(top), int(bottom)) for top, bottom in _runs(profile > threshold)
+        if bottom - top >= MIN_GLYPH_HEIGHT
+    ]
+
+
+def segment_blocks(gray, mask=None):
+    """
+    Split a grayscale page into text blocks in reading order.
+    Returns: list of TextBlock
+    """
+    if mask is None:
+        mask = ink_mask(gray)
+    mask = remove_rules(mask)
+    lines = find_text_lines(mask)
+    if not lines:
+        return []
+
+    max_gap = BLOCK_GAP_FACTOR * np.median([bottom - top for top, bottom in lines])
+    groups = [[lines[0]]]
+    for line in lines[1:]:
+        if line[0] - groups[-1][-1][1] > max_gap:
+            groups.append([])
+        groups[-1].append(line)
+
+    height, width = mask.shape
+    blocks = []
+    for group in groups:
+        top, bottom = group[0][0], group[-1][1]
+        columns = np.flatnonzero(np.count_nonzero(mask[top:bottom], axis=0))
+        if not len(columns):
+            continue
+        blocks.append(TextBlock(
+            max(top - BLOCK_PADDING, 0),
+            min(bottom + BLOCK_PADDING, height),
+            max(int(columns[0]) - BLOCK_PADDING, 0),
+            min(int(columns[-1]) + 1 + BLOCK_PADDING, width),
+            len(group),
+        ))
+    return blocks
+
+
+def crop_block(image, block):
+    return np.ascontiguousarray(image[block.top:block.bottom, block.left:block.right])
+
+
+def block_config(block):
+    """Tesseract config suited to a block: single-line mode for one line"""
+    return LINE_CONFIG if block.line_count == 1 else BLOCK_CONFIG
+
+
+def page_configs(configs, line_count):
+    """Drop single-line and single-word configs for a page with several lines of text"""
+    if line_count <= 1:
+        return list(configs)
+    return [config for config in configs if parse_config(config)[0] not in SINGLE_LINE_PSMS]
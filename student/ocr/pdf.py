@@ -0,0 +1,135 @@
+"""
+Multi-page PDF answers.
+
+Pages are rasterized one at a time at OCR_PDF_DPI and handed out as a
+generator, so only one page bitmap is held in memory however long the
+submission is. Oversized pages are rendered at a lower resolution so no
+bitmap exceeds OCR_PDF_MAX_PIXELS. pypdfium2 is used when installed (no system packages
+needed), otherwise pdf2image with poppler.
+"""
+import logging
+import math
+import re
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import pypdfium2
+except ImportError:  # optional dependency
+    pypdfium2 = None
+
+try:
+    import pdf2image
+except ImportError:  # optional dependency
+    pdf2image = None
+
+logger = logging.getLogger(__name__)
+
+# Rasterization resolution; 200 DPI puts handwriting near Tesseract's preferred size
+OCR_PDF_DPI = getattr(settings, 'OCR_PDF_DPI', 200)
+
+OCR_PDF_MAX_PAGES = getattr(settings, 'OCR_PDF_MAX_PAGES', 30)
+
+# Largest page bitmap (width x height) rendered; about A3 at 200 DPI
+OCR_PDF_MAX_PIXELS = getattr(settings, 'OCR_PDF_MAX_PIXELS', 8_000_000)
+
+POINTS_PER_INCH = 72
+
+PDF_MAGIC = b'%PDF-'
+
+
+def pdf_support_available():
+    return pypdfium2 is not None or pdf2image is not None
+
+
+def is_pdf(upload):
+    """Whether an uploaded file (or path) is a PDF, judged by its first bytes"""
+    if isinstance(upload, str):
+        with open(upload, 'rb') as pdf_file:
+            return pdf_file.read(len(PDF_MAGIC)) == PDF_MAGIC
+    upload.seek(0)
+    header = upload.read(len(PDF_MAGIC))
+    upload.seek(0)
+    return header == PDF_MAGIC
+
+
+def _read(upload):
+    if isinstance(upload, str):
+        with open(upload, 'rb') as pdf_file:
+            return pdf_file.read()
+    upload.seek(0)
+    data = upload.read()
+    upload.seek(0)
+    return data
+
+
+def _require_pdf_support():
+    if not pdf_support_available():
+        raise RuntimeError("PDF answers need pypdfium2 or pdf2image installed on the server")
+
+
+def pdf_page_count(upload):
+    _require_pdf_support()
+    data = _read(upload)
+    if pypdfium2 is not None:
+        document = pypdfium2.PdfDocument(data)
+        try:
+            return len(document)
+        finally:
+            document.close()
+    return pdf2image.pdfinfo_from_bytes(data)['Pages']
+
+
+def page_dpi(width_points, height_points, dpi=OCR_PDF_DPI, max_pixels=OCR_PDF_MAX_PIXELS):
+    """Resolution to render a page of this size (in points) at, lowered so width x height stays within max_pixels"""
+    width = width_points / POINTS_PER_INCH
+    height = height_points / POINTS_PER_INCH
+    if width <= 0 or height <= 0:
+        return dpi
+    # Largest r with (width*r + 1) * (height*r + 1) <= max_pixels, since renderers round sizes up
+    area, perimeter = width * height, width + height
+    limit = (math.sqrt(perimeter ** 2 + 4 * area * (max_pixels - 1)) - perimeter) / (2 * area)
+    return min(dpi, limit)
+
+
+def _poppler_page_size(data, number):
+    """Size in points of one page as reported by pdfinfo, or None"""
+    info = pdf2image.pdfinfo_from_bytes(data, first_page=number, last_page=number)
+    for key, value in info.items():
+        if key.startswith('Page') and key.endswith('size'):
+            match = re.match(r'\s*([\d.]+) x ([\d.]+)', str(value))
+            if match:
+                return float(match.group(1)), float(match.group(2))
+    return None
+
+
+def iter_pdf_pages(upload, dpi=OCR_PDF_DPI, max_pages=OCR_PDF_MAX_PAGES, max_pixels=OCR_PDF_MAX_PIXELS):
+    """
+    Rasterize a PDF lazily, one page per iteration, at `dpi` or lower for
+    pages that would exceed `max_pixels`.
+    Yields: RGB NumPy array of each page, in page order
+    """
+    _require_pdf_support()
+    data = _read(upload)
+    if pypdfium2 is not None:
+        document = pypdfium2.PdfDocument(data)
+        try:
+            for index in range(min(len(document), max_pages)):
+                page = document[index]
+                try:
+                    width, height = page.get_size()
+                    bitmap = page.render(scale=page_dpi(width, height, dpi, max_pixels) / POINTS_PER_INCH)
+                    yield np.asarray(bitmap.to_pil().convert('RGB'))
+                finally:
+                    page.close()
+        finally:
+            document.close()
+        return
+
+    page_count = min(pdf2image.pdfinfo_from_bytes(data)['Pages'], max_pages)
+    for number in range(1, page_count + 1):
+        size = _poppler_page_size(data, number)
+        page_resolution = page_dpi(*size, dpi, max_pixels) if size else dpi
+        page = pdf2image.convert_from_bytes(data, dpi=page_resolution, first_page=number, last_page=number)[0]
+        yield np.asarray(page.convert('RGB'))
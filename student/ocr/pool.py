@@ -0,0 +1,242 @@
+"""
+Bounded, reusable process pool for Tesseract config sweeps.
+
+Every Tesseract call is a separate process, so trying several page
+segmentation modes one after another costs several full OCR runs of wall
+time. The sweep hands configs of an image to a shared pool, gives the
+image one deadline and stops once a confident result arrives. A config is
+only submitted when a pool worker is idle, so nothing waits in the pool's
+queue: configs not started when a result wins are simply never run, and
+other pages and requests find workers free. The text blocks of a
+segmented page are spread over the same pool the same way.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+import django
+from django.conf import settings
+
+from .engines import get_ocr_engine
+from .quality import is_confident
+
+logger = logging.getLogger(__name__)
+
+# Worker processes shared by all OCR requests of this process (0 runs configs inline)
+OCR_POOL_WORKERS = getattr(settings, 'OCR_POOL_WORKERS', min(5, os.cpu_count() or 1))
+
+# Wall-time budget for all OCR attempts on one image
+OCR_IMAGE_DEADLINE_SECONDS = getattr(settings, 'OCR_IMAGE_DEADLINE_SECONDS', 30)
+
+OCR_CONFIGS = [
+    '--psm 6',  # Assume uniform block of text
+    '--psm 8',  # Single word
+    '--psm 13', # Raw line
+    '--psm 6 --oem 3',  # Default OCR Engine Mode
+    '--psm 8 --oem 3',  # Single word with default engine
+]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# One slot per pool worker, held from submitting a run until it finishes
+_idle_workers = threading.BoundedSemaphore(max(1, OCR_POOL_WORKERS))
+
+
+def get_ocr_pool():
+    """
+    Return the process-wide OCR pool, creating it on first use. Workers are
+    spawned rather than forked so a threaded web server is never forked.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=OCR_POOL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup
+            )
+        return _pool
+
+
+def shutdown_ocr_pool():
+    """Stop the OCR pool; queued configs are dropped"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_ocr_pool)
+
+
+def run_tesseract_config(image, config, timeout):
+    """
+    OCR an image with one config on this process's OCR engine, keeping word
+    confidences; Tesseract gives up after timeout seconds.
+    Returns: OCRResult
+    """
+    return get_ocr_engine().recognize(image, config, timeout)
+
+
+def _acquire_worker(deadline, wait_for_one):
+    """Take an idle worker slot, waiting until the deadline only when wait_for_one is set"""
+    if not wait_for_one:
+        return _idle_workers.acquire(blocking=False)
+    return _idle_workers.acquire(timeout=max(0, deadline - time.monotonic()))
+
+
+def _submit_on_idle_worker(pool, runner, image, config, deadline):
+    """Submit one run on a worker slot already taken; the slot is freed when the run ends"""
+    try:
+        future = pool.submit(runner, image, config, max(1, int(deadline - time.monotonic())))
+    except Exception:
+        _idle_workers.release()
+        raise
+    future.add_done_callback(lambda _: _idle_workers.release())
+    return future
+
+
+def _report(result):
+    logger.debug(f"OCR result with {result.config} (confidence {result.mean_confidence:.0f}): '{result.text[:100]}...'")
+
+
+def run_config_sweep(image, configs=OCR_CONFIGS, deadline=None, runner=run_tesseract_config):
+    """
+    OCR an image with the given configs concurrently, in order, each on the
+    next idle pool worker. The sweep stops at the deadline (a
+    time.monotonic() value) or as soon as a result is confident; configs
+    not started by then are never submitted and running ones are bounded by
+    the Tesseract timeout.
+    Returns: list of OCRResult in completion order
+    """
+    if deadline is None:
+        deadline = time.monotonic() + OCR_IMAGE_DEADLINE_SECONDS
+    if not configs:
+        return []
+    if OCR_POOL_WORKERS <= 0:
+        return _run_inline(image, configs, deadline, runner)
+
+    queued = list(configs)
+    futures = {}
+    pending = set()
+    completed = []
+    while queued or pending:
+        if deadline - time.monotonic() <= 0:
+            logger.warning(f"OCR deadline reached with {len(queued) + len(pending)} configs unfinished")
+            break
+        # Wait for a worker only while none of this image's configs is running
+        while queued and _acquire_worker(deadline, wait_for_one=not pending):
+            if any(future.done() for future in pending):
+                # A run already finished (and may have won): look at it before starting another
+                _idle_workers.release()
+                break
+            try:
+                future = _submit_on_idle_worker(get_ocr_pool(), runner, image, queued[0], deadline)
+            except BrokenProcessPool:
+                logger.error("OCR pool is broken, restarting it and running the rest of this image inline")
+                shutdown_ocr_pool()
+                return completed + _run_inline(image, queued, deadline, runner)
+            futures[future] = queued.pop(0)
+            pending.add(future)
+        if not pending:
+            continue
+        done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.warning(f"OCR failed with {futures[future]}: {e}")
+                continue
+            _report(result)
+            completed.append(result)
+        if any(is_confident(result) for result in completed):
+            break
+    return completed
+
+
+def _run_inline(image, configs, deadline, runner):
+    """Sequential sweep in this process with the same deadline and early exit"""
+    completed = []
+    for config in configs:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.warning("OCR deadline reached before all configs ran")
+            break
+        try:
+            result = runner(image, config, max(1, int(remaining)))
+        except Exception as e:
+            logger.warning(f"OCR failed with {config}: {e}")
+            continue
+        _report(result)
+        completed.append(result)
+        if is_confident(result):
+            break
+    return completed
+
+
+def run_regions(regions, deadline=None, runner=run_tesseract_config):
+    """
+    OCR independent regions of a page concurrently, each with its own
+    config and submitted as pool workers become idle; every region is
+    needed, so there is no early exit.
+    regions: list of (image, config)
+    Returns: list of OCRResult, or None for a region that failed or missed the deadline, in input order
+    """
+    if deadline is None:
+        deadline = time.monotonic() + OCR_IMAGE_DEADLINE_SECONDS
+    if OCR_POOL_WORKERS <= 0:
+        return _run_regions_inline(regions, deadline, runner)
+
+    results = [None] * len(regions)
+    next_index = 0
+    futures = {}
+    pending = set()
+    while next_index < len(regions) or pending:
+        if deadline - time.monotonic() <= 0:
+            logger.warning(f"OCR deadline reached with {len(regions) - next_index + len(pending)} regions unfinished")
+            break
+        while next_index < len(regions) and _acquire_worker(deadline, wait_for_one=not pending):
+            image, config = regions[next_index]
+            try:
+                future = _submit_on_idle_worker(get_ocr_pool(), runner, image, config, deadline)
+            except BrokenProcessPool:
+                logger.error("OCR pool is broken, restarting it and running the rest of this page inline")
+                shutdown_ocr_pool()
+                results[next_index:] = _run_regions_inline(regions[next_index:], deadline, runner)
+                return results
+            futures[future] = next_index
+            pending.add(future)
+            next_index += 1
+        if not pending:
+            continue
+        done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                logger.warning(f"OCR failed for region {index + 1}: {e}")
+    return results
+
+
+def _run_regions_inline(regions, deadline, runner):
+    results = []
+    for index, (image, config) in enumerate(regions):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.warning("OCR deadline reached before all regions ran")
+            results.extend([None] * (len(regions) - index))
+            break
+        try:
+            results.append(runner(image, config, max(1, int(remaining))))
+        except Exception as e:
+            logger.warning(f"OCR failed for region {index + 1}: {e}")
+            results.append(None)
+    return results
@@ -0,0 +1,154 @@
+"""
+Adaptive choice of the preprocessing applied before OCR.
+
+A few cheap statistics of the normalized page (contrast, how even the paper
+background is, skew and noise) put it into a feature bucket. Per source and
+bucket, OCRPreprocessingStat counts how often each preprocessing led to a
+confident result, and the pipelines are tried best first: most pages then
+need a single preprocessing + OCR pass instead of the whole fallback ladder.
+"""
+from collections import namedtuple
+import logging
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+from student.models import OCRPreprocessingStat
+
+from .normalize import ink_mask
+
+logger = logging.getLogger(__name__)
+
+# Preprocessing pipelines tried on one page at most, best first
+OCR_PREPROCESSING_MAX_PASSES = getattr(settings, 'OCR_PREPROCESSING_MAX_PASSES', 2)
+
+# Order of pipelines without outcome history: the page as is, then adaptive
+# thresholding (CamScanner photos), then Otsu binarization
+DEFAULT_PREPROCESSING = ['none', 'camscanner', 'otsu']
+
+# Features are computed on a copy no longer than this
+FEATURE_MAX_DIMENSION = 600
+
+# Bucket edges of each feature
+CONTRAST_EDGES = (0.35, 0.7)
+UNIFORMITY_EDGES = (0.75,)
+SKEW_EDGES = (2.0,)
+NOISE_EDGES = (0.02, 0.05)
+
+ImageFeatures = namedtuple('ImageFeatures', ['contrast', 'uniformity', 'skew', 'noise'])
+
+
+def _otsu(gray):
+    """Otsu binarization, dilated to connect strokes and median-blurred to drop speckles"""
+    gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    gray = cv2.dilate(gray, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)), iterations=1)
+    return cv2.medianBlur(gray, 3)
+
+
+def _camscanner(gray):
+    """Adaptive thresholding for unevenly lit photos, closed and lightly blurred"""
+    gray = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    gray = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2)))
+    return cv2.GaussianBlur(gray, (1, 1), 0)
+
+
+PREPROCESSORS = {
+    'none': lambda gray: gray,
+    'camscanner': _camscanner,
+    'otsu': _otsu,
+}
+
+
+def apply_preprocessing(name, gray):
+    """Run one named pipeline on an 8-bit grayscale page"""
+    return PREPROCESSORS[name](gray)
+
+
+def image_features(gray):
+    """
+    Cheap statistics of a grayscale page, on a downscaled copy:
+    contrast (median paper minus median ink brightness, 0-1),
+    uniformity (1 when the paper is equally bright in every region),
+    skew (degrees the ink is rotated from horizontal) and
+    noise (mean difference from a 3x3 median filter, 0-1)
+    """
+    # Subsample rather than average, which would smooth the noise away
+    scale = FEATURE_MAX_DIMENSION / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+
+    mask = ink_mask(gray)
+    ink = gray[mask > 0]
+    paper = gray[mask == 0]
+    high = float(np.median(paper)) if paper.size else 255.0
+    contrast = (high - float(np.median(ink))) / 255 if ink.size and paper.size else 0.0
+
+    # Paper brightness per tile of a 4x4 grid
+    tiles = [
+        np.percentile(tile, 90)
+        for row in np.array_split(gray, 4, axis=0)
+        for tile in np.array_split(row, 4, axis=1)
+        if tile.size
+    ]
+    uniformity = 1.0 - float(max(tiles) - min(tiles)) / max(high, 1.0)
+
+    skew = 0.0
+    points = cv2.findNonZero(mask)
+    if points is not None and len(points) >= 50:
+        angle = cv2.minAreaRect(points)[-1]
+        if angle > 45:
+            angle -= 90
+        elif angle < -45:
+            angle += 90
+        skew = abs(float(angle))
+
+    noise = float(np.mean(cv2.absdiff(gray, cv2.medianBlur(gray, 3)))) / 255
+    return ImageFeatures(contrast, max(0.0, uniformity), skew, noise)
+
+
+def feature_bucket(features):
+    """Discretize features into a short bucket key, e.g. 'c2u1s0n0'"""
+    return (
+        f"c{int(np.searchsorted(CONTRAST_EDGES, features.contrast))}"
+        f"u{int(np.searchsorted(UNIFORMITY_EDGES, features.uniformity))}"
+        f"s{int(np.searchsorted(SKEW_EDGES, features.skew))}"
+        f"n{int(np.searchsorted(NOISE_EDGES, features.noise))}"
+    )
+
+
+def ordered_preprocessing(source, bucket, max_passes=None):
+    """
+    Pipelines for a page, most likely to give a confident result first;
+    pipelines without history keep their default position
+    """
+    if max_passes is None:
+        max_passes = OCR_PREPROCESSING_MAX_PASSES
+    try:
+        stats = {
+            stat.preprocessing: stat
+            for stat in OCRPreprocessingStat.objects.filter(source=source, bucket=bucket) # type: ignore
+        }
+    except Exception as e:
+        logger.error(f"Error loading OCR preprocessing statistics: {e}")
+        stats = {}
+    default_rate = OCRPreprocessingStat().success_rate()
+    ordered = sorted(
+        DEFAULT_PREPROCESSING,
+        key=lambda name: -(stats[name].success_rate() if name in stats else default_rate)
+    )
+    return ordered[:max(1, max_passes)]
+
+
+def record_preprocessing_outcome(source, bucket, preprocessing, success):
+    """Count a pass of a pipeline on a page of this bucket, and whether it gave confident text"""
+    try:
+        OCRPreprocessingStat.objects.get_or_create(source=source, bucket=bucket, preprocessing=preprocessing) # type: ignore
+        OCRPreprocessingStat.objects.filter( # type: ignore
+            source=source,
+            bucket=bucket,
+            preprocessing=preprocessing
+        ).update(runs=F('runs') + 1, successes=F('successes') + int(success))
+    except Exception as e:
+        logger.error(f"Error recording OCR preprocessing statistics: {e}")
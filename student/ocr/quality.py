@@ -0,0 +1,93 @@
+"""
+OCR results and the confidence rules deciding when a result is good enough.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+
+# Mean Tesseract word confidence (0-100) a result needs to end the search
+OCR_MIN_MEAN_CONFIDENCE = getattr(settings, 'OCR_MIN_MEAN_CONFIDENCE', 70)
+
+# Share of non-space characters that must be letters or digits
+OCR_MIN_TEXT_DENSITY = getattr(settings, 'OCR_MIN_TEXT_DENSITY', 0.6)
+
+OCRResult = namedtuple('OCRResult', ['config', 'text', 'mean_confidence', 'word_count', 'density'])
+
+
+def text_density(text):
+    """Share of non-space characters that are letters or digits; noise is mostly punctuation"""
+    characters = [c for c in text if not c.isspace()]
+    if not characters:
+        return 0.0
+    return sum(c.isalnum() for c in characters) / len(characters)
+
+
+def result_from_data(config, data):
+    """
+    Build an OCRResult from pytesseract.image_to_data output (Output.DICT):
+    words are joined per line, lines per block, and confidences of
+    recognized words are averaged
+    """
+    lines = {}
+    confidences = []
+    for index, word in enumerate(data['text']):
+        word = (word or '').strip()
+        if not word:
+            continue
+        key = (data['block_num'][index], data['par_num'][index], data['line_num'][index])
+        lines.setdefault(key, []).append(word)
+        confidence = float(data['conf'][index])
+        if confidence >= 0:
+            confidences.append(confidence)
+    text = '\n'.join(' '.join(words) for key, words in sorted(lines.items()))
+    mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return OCRResult(config, text, mean_confidence, len(confidences), text_density(text))
+
+
+def is_confident(result):
+    """Whether a result passes both thresholds and needs no further OCR attempts"""
+    return (
+        result.word_count > 0
+        and result.mean_confidence >= OCR_MIN_MEAN_CONFIDENCE
+        and result.density >= OCR_MIN_TEXT_DENSITY
+    )
+
+
+def result_quality(result):
+    """Sort key for picking the best result: confident first, then confidence weighted by density"""
+    return (is_confident(result), result.mean_confidence * result.density, len(result.text))
+
+
+def normalize_transcript(text):
+    """Collapse whitespace so line breaks and indentation do not count as errors"""
+    return ' '.join((text or '').split())
+
+
+def edit_distance(expected, actual):
+    """Levenshtein distance between two strings (one DP row at a time)"""
+    if len(expected) < len(actual):
+        expected, actual = actual, expected
+    previous = list(range(len(actual) + 1))
+    for i, expected_char in enumerate(expected, start=1):
+        current = [i]
+        for j, actual_char in enumerate(actual, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (expected_char != actual_char),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def character_error_rate(expected, actual):
+    """
+    Character error rate of OCR text against a ground-truth transcript:
+    edits needed to turn one into the other per ground-truth character
+    (0 is perfect; can exceed 1 when the OCR adds a lot of noise)
+    """
+    expected = normalize_transcript(expected)
+    actual = normalize_transcript(actual)
+    if not expected:
+        return 0.0 if not actual else 1.0
+    return edit_distance(expected, actual) / len(expected)
@@ -0,0 +1,127 @@
+"""
+Confidence-driven OCR: try configs in the order they have won before and
+stop at the first confident result. Pages with several text blocks are
+first OCR'd block by block.
+"""
+import logging
+
+from django.db.models import F
+
+from student.models import OCRConfigStat
+
+from .layout import OCR_SEGMENT_MIN_BLOCKS, block_config, crop_block, page_configs, segment_blocks
+from .pool import OCR_CONFIGS, run_config_sweep, run_regions, run_tesseract_config
+from .quality import OCRResult, is_confident, result_quality, text_density
+
+logger = logging.getLogger(__name__)
+
+
+def ordered_configs(source, preprocessing='none', configs=OCR_CONFIGS):
+    """
+    Order configs by how often they won for this source and preprocessing;
+    configs without history keep their default position
+    """
+    try:
+        stats = {
+            stat.config: stat
+            for stat in OCRConfigStat.objects.filter(source=source, preprocessing=preprocessing) # type: ignore
+        }
+    except Exception as e:
+        logger.error(f"Error loading OCR config statistics: {e}")
+        return list(configs)
+    default_rate = OCRConfigStat().win_rate()
+    return sorted(
+        configs,
+        key=lambda config: -(stats[config].win_rate() if config in stats else default_rate)
+    )
+
+
+def record_ocr_outcome(source, preprocessing, completed, winner):
+    """Count a run for every config that finished and a win for the chosen one"""
+    try:
+        for result in completed:
+            OCRConfigStat.objects.get_or_create(source=source, preprocessing=preprocessing, config=result.config) # type: ignore
+            OCRConfigStat.objects.filter( # type: ignore
+                source=source,
+                preprocessing=preprocessing,
+                config=result.config
+            ).update(runs=F('runs') + 1, wins=F('wins') + int(result is winner))
+    except Exception as e:
+        logger.error(f"Error recording OCR config statistics: {e}")
+
+
+def ocr_with_early_exit(image, configs, deadline, runner=run_tesseract_config):
+    """
+    Run the most promising config alone; only when its result is not
+    confident are the remaining configs swept concurrently.
+    Returns: (best OCRResult or None, list of completed OCRResult)
+    """
+    completed = run_config_sweep(image, configs[:1], deadline=deadline, runner=runner)
+    if not any(is_confident(result) for result in completed):
+        completed += run_config_sweep(image, configs[1:], deadline=deadline, runner=runner)
+    with_text = [result for result in completed if result.text]
+    if not with_text:
+        return None, completed
+    return max(with_text, key=result_quality), completed
+
+
+def recognize_image(image, source, preprocessing, deadline, runner=run_tesseract_config):
+    """
+    OCR one image for a source with adaptive config order and record which
+    config won.
+    Returns: best OCRResult or None
+    """
+    best, completed = ocr_with_early_exit(image, ordered_configs(source, preprocessing), deadline, runner=runner)
+    record_ocr_outcome(source, preprocessing, completed, best)
+    return best
+
+
+def combine_region_results(results):
+    """
+    Join block results in reading order into one page result; confidence is
+    averaged over the words of all blocks.
+    Returns: OCRResult, or None when no block produced text
+    """
+    with_text = [result for result in results if result is not None and result.text]
+    if not with_text:
+        return None
+    word_count = sum(result.word_count for result in with_text)
+    confidence = sum(result.mean_confidence * result.word_count for result in with_text)
+    text = '\n'.join(result.text for result in with_text)
+    return OCRResult(
+        f"blocks:{len(results)}",
+        text,
+        confidence / word_count if word_count else 0.0,
+        word_count,
+        text_density(text),
+    )
+
+
+def ocr_segmented(image, blocks, deadline, runner=run_tesseract_config):
+    """OCR the blocks of a page concurrently and reassemble them top to bottom"""
+    regions = [(crop_block(image, block), block_config(block)) for block in blocks]
+    return combine_region_results(run_regions(regions, deadline=deadline, runner=runner))
+
+
+def recognize_page(image, source, preprocessing, deadline, runner=run_tesseract_config):
+    """
+    OCR a grayscale page. A page with several text blocks is OCR'd block by
+    block; when that is not confident (or the page is a single block) the
+    whole page goes through the adaptive config search, without single-line
+    configs for multi-line pages.
+    Returns: best OCRResult or None
+    """
+    blocks = segment_blocks(image)
+    segmented = None
+    if len(blocks) >= OCR_SEGMENT_MIN_BLOCKS:
+        logger.debug(f"Page split into {len(blocks)} text blocks")
+        segmented = ocr_segmented(image, blocks, deadline, runner=runner)
+        if segmented is not None and is_confident(segmented):
+            return segmented
+
+    line_count = sum(block.line_count for block in blocks)
+    configs = page_configs(ordered_configs(source, preprocessing), line_count)
+    best, completed = ocr_with_early_exit(image, configs, deadline, runner=runner)
+    record_ocr_outcome(source, preprocessing, completed, best)
+    candidates = [result for result in (segmented, best) if result is not None]
+    return max(candidates, key=result_quality) if candidates else None
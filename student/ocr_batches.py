@@ -0,0 +1,205 @@
+"""
+Batch OCR for clients uploading the answer images of a whole paper at once.
+
+The upload request only stores the images and returns the batch's job ID;
+the images are OCR'd concurrently on a thread pool in the web process (the
+Tesseract work itself runs in the shared OCR process pool) and clients poll
+the batch status. Every item change bumps OCRBatch.version, which is the
+status ETag, so an unchanged poll costs one indexed row lookup.
+
+Images are claimed under a lease like GradingJob. When a batch has made no
+progress for a lease period (its process restarted or a thread hung), the
+next status poll hands its pending and expired images to the threads again.
+cleanup_ocr_batches deletes old batches and their stored images.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.http import parse_etags
+
+from student.models import OCRBatch, OCRBatchItem
+from student.utils import extract_text_from_image
+
+logger = logging.getLogger(__name__)
+
+OCR_BATCH_MAX_IMAGES = getattr(settings, 'OCR_BATCH_MAX_IMAGES', 40)
+OCR_BATCH_LEASE_SECONDS = getattr(settings, 'OCR_BATCH_LEASE_SECONDS', 300)
+OCR_BATCH_MAX_ATTEMPTS = getattr(settings, 'OCR_BATCH_MAX_ATTEMPTS', 3)
+OCR_BATCH_RETENTION_DAYS = getattr(settings, 'OCR_BATCH_RETENTION_DAYS', 7)
+
+OUTSTANDING_STATUSES = [OCRBatchItem.STATUS_PENDING, OCRBatchItem.STATUS_RUNNING]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def ocr_batch_threads():
+    """Images of all batches OCR'd at the same time by this process (0 processes them in the request)"""
+    return getattr(settings, 'OCR_BATCH_THREADS', 4)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ocr_batch_threads(), thread_name_prefix='ocr-batch')
+        return _executor
+
+
+def create_ocr_batch(image_files, user=None):
+    """
+    Store uploaded images as a new batch, in upload order.
+    Returns: OCRBatch
+    """
+    batch = OCRBatch.objects.create(user=user) # type: ignore
+    for position, image_file in enumerate(image_files):
+        OCRBatchItem.objects.create(batch=batch, position=position, image=image_file, original_name=image_file.name) # type: ignore
+    return batch
+
+
+def _claimable():
+    now = timezone.now()
+    return Q(status=OCRBatchItem.STATUS_PENDING) | Q(status=OCRBatchItem.STATUS_RUNNING, lease_expires_at__lt=now)
+
+
+def start_ocr_batch(batch):
+    """Hand every pending image of a batch, and every image whose lease expired, to the background threads"""
+    item_ids = list(batch.items.filter(_claimable()).values_list('pk', flat=True))
+    if ocr_batch_threads() <= 0:
+        for item_id in item_ids:
+            process_ocr_batch_item(item_id)
+        return
+    executor = _get_executor()
+    for item_id in item_ids:
+        executor.submit(_run_in_thread, item_id)
+
+
+def _run_in_thread(item_id):
+    try:
+        process_ocr_batch_item(item_id)
+    except Exception as e:
+        logger.error(f"OCR batch item {item_id} crashed: {e}")
+    finally:
+        # Threads outside the request cycle must release their own connections
+        close_old_connections()
+
+
+def _touch_batch(batch_id, **fields):
+    OCRBatch.objects.filter(pk=batch_id).update( # type: ignore
+        version=F('version') + 1,
+        updated_at=timezone.now(),
+        **fields
+    )
+
+
+def process_ocr_batch_item(item_id, lease_seconds=OCR_BATCH_LEASE_SECONDS):
+    """OCR one image of a batch and record its text, finishing the batch after its last image"""
+    claimed = OCRBatchItem.objects.filter(_claimable(), pk=item_id, attempts__lt=OCR_BATCH_MAX_ATTEMPTS).update( # type: ignore
+        status=OCRBatchItem.STATUS_RUNNING,
+        attempts=F('attempts') + 1,
+        lease_expires_at=timezone.now() + timedelta(seconds=lease_seconds),
+    )
+    if not claimed:
+        return
+    item = OCRBatchItem.objects.get(pk=item_id) # type: ignore
+    _touch_batch(item.batch_id, status=OCRBatch.STATUS_RUNNING)
+
+    try:
+        ocr_text, ocr_error = extract_text_from_image(item.image, source='ocr_api', on_busy='wait')
+    except Exception as e:
+        ocr_text, ocr_error = None, str(e)
+    _finish_item(item, ocr_text, '' if ocr_text else (ocr_error or "OCR failed to extract any text from the image"))
+
+
+def _finish_item(item, text, error):
+    item.status = OCRBatchItem.STATUS_DONE if text else OCRBatchItem.STATUS_FAILED
+    item.text = text or ''
+    item.error = error
+    item.lease_expires_at = None
+    item.finished_at = timezone.now()
+    item.save(update_fields=['status', 'text', 'error', 'lease_expires_at', 'finished_at'])
+    _finish_batch_if_complete(item.batch_id)
+
+
+def _finish_batch_if_complete(batch_id):
+    outstanding = OCRBatchItem.objects.filter(batch_id=batch_id, status__in=OUTSTANDING_STATUSES).exists() # type: ignore
+    if outstanding:
+        _touch_batch(batch_id)
+    else:
+        _touch_batch(batch_id, status=OCRBatch.STATUS_DONE, finished_at=timezone.now())
+
+
+def is_stalled(status, updated_at, lease_seconds=OCR_BATCH_LEASE_SECONDS):
+    """Whether an unfinished batch has made no progress for a whole lease period"""
+    return status != OCRBatch.STATUS_DONE and updated_at < timezone.now() - timedelta(seconds=lease_seconds)
+
+
+def resume_ocr_batch(batch):
+    """
+    Recover a stalled batch: fail images whose lease expired after their last
+    attempt, and hand the remaining pending and expired images to the threads
+    """
+    exhausted = batch.items.filter(
+        status=OCRBatchItem.STATUS_RUNNING,
+        lease_expires_at__lt=timezone.now(),
+        attempts__gte=OCR_BATCH_MAX_ATTEMPTS,
+    )
+    for item in exhausted:
+        _finish_item(item, None, f"OCR did not finish after {item.attempts} attempts")
+    # Restart the stall clock without changing the ETag, so only one poll per lease resumes the batch
+    OCRBatch.objects.filter(pk=batch.pk).update(updated_at=timezone.now()) # type: ignore
+    start_ocr_batch(batch)
+
+
+def delete_ocr_batches(older_than_days=None):
+    """
+    Delete batches created more than `older_than_days` ago (default
+    OCR_BATCH_RETENTION_DAYS) together with their stored images.
+    Returns: (batch_count, image_count)
+    """
+    if older_than_days is None:
+        older_than_days = OCR_BATCH_RETENTION_DAYS
+    batches = OCRBatch.objects.filter(created_at__lt=timezone.now() - timedelta(days=older_than_days)) # type: ignore
+    images = 0
+    for item in OCRBatchItem.objects.filter(batch__in=batches).exclude(image=''): # type: ignore
+        item.image.delete(save=False)
+        images += 1
+    deleted, per_model = batches.delete()
+    return per_model.get(OCRBatch._meta.label, 0), images
+
+
+def batch_etag(job_id, version):
+    return f'"{job_id}-{version}"'
+
+
+def etag_matches(etag, if_none_match):
+    """Whether an If-None-Match header lists this exact ETag (weak comparison) or is '*'"""
+    tags = parse_etags(if_none_match or '')
+    return '*' in tags or etag in (tag.removeprefix('W/') for tag in tags)
+
+
+def batch_status(batch):
+    """Status payload of a batch with the text of every finished image"""
+    items = list(batch.items.all())
+    return {
+        'job_id': str(batch.job_id),
+        'status': batch.status,
+        'total': len(items),
+        'completed': sum(item.status in (OCRBatchItem.STATUS_DONE, OCRBatchItem.STATUS_FAILED) for item in items),
+        'items': [
+            {
+                'index': item.position,
+                'name': item.original_name,
+                'status': item.status,
+                'text': item.text if item.status == OCRBatchItem.STATUS_DONE else None,
+                'error': item.error or None,
+            }
+            for item in items
+        ],
+    }
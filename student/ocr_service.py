@@ -0,0 +1,249 @@
+"""
+Out-of-process OCR over a Unix socket.
+
+run_ocr_service starts a local daemon with a fixed number of OCR worker
+threads (Tesseract itself runs in the daemon's OCR process pool) and a
+bounded queue. When OCR_SERVICE_SOCKET is set, web workers hand image
+uploads to it instead of OCR'ing in the request, so OCR capacity is sized
+per node independently of gunicorn workers.
+
+Protocol, one request per connection, each message a JSON line:
+the client sends a header {"name", "source", "length"}; the daemon answers
+{"status": "accepted"} or, when every worker is busy and the queue is
+full, {"status": "busy"} at once, before any image bytes are sent. After
+an accept the client sends `length` bytes of the upload and reads
+{"status": "ok", "text", "error"} (or {"status": "error", "error"}).
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Socket run_ocr_service listens on when OCR_SERVICE_SOCKET is unset
+DEFAULT_SOCKET = getattr(settings, 'OCR_SERVICE_DEFAULT_SOCKET', os.path.join(settings.BASE_DIR, 'ocr_service.sock'))
+
+# Largest upload accepted (the PDF answer limit) and longest header line
+OCR_SERVICE_MAX_BYTES = 20 * 1024 * 1024
+MAX_HEADER_BYTES = 4096
+
+CONNECT_TIMEOUT_SECONDS = 2
+
+# Retry-After sent to API clients turned away while the service is busy
+OCR_SERVICE_RETRY_AFTER_SECONDS = 5
+
+
+class OCRServiceBusy(Exception):
+    """The OCR service has no free worker or queue slot"""
+
+
+class OCRServiceUnavailable(Exception):
+    """The OCR service socket is missing or not accepting connections"""
+
+
+def ocr_service_socket():
+    """Unix socket of the local OCR service web workers send uploads to (None: OCR in-process)"""
+    return getattr(settings, 'OCR_SERVICE_SOCKET', None)
+
+
+def ocr_service_timeout():
+    """Seconds a client waits for the text of an accepted upload"""
+    return getattr(settings, 'OCR_SERVICE_TIMEOUT', 120)
+
+
+def _send_message(stream, message):
+    stream.write(json.dumps(message).encode('utf-8') + b'\n')
+    stream.flush()
+
+
+def _read_message(stream):
+    line = stream.readline(MAX_HEADER_BYTES + 1)
+    if not line or len(line) > MAX_HEADER_BYTES:
+        raise ValueError('Missing or oversized message')
+    return json.loads(line)
+
+
+def _local_recognize(name, payload, source):
+    """OCR one upload in this process, with the same validation as a web upload"""
+    from student.utils import extract_text_locally, ingest_image
+
+    ingested, error = ingest_image(SimpleUploadedFile(name, payload))
+    if ingested is None:
+        return None, error
+    return extract_text_locally(ingested, source)
+
+
+class _Job:
+    def __init__(self, name, source, payload):
+        self.name = name
+        self.source = source
+        self.payload = payload
+        self.result = None
+        self.done = threading.Event()
+
+
+class OCRService:
+    """
+    The daemon: a Unix socket server whose connection threads only admit,
+    read and answer requests, and `workers` threads that run the OCR.
+    At most `workers + queue_size` requests are admitted at once; any
+    further request is told it is busy.
+    """
+
+    def __init__(self, socket_path, workers, queue_size, recognize=_local_recognize):
+        self.socket_path = socket_path
+        self.workers = max(1, workers)
+        self.recognize = recognize
+        self.slots = threading.BoundedSemaphore(self.workers + max(0, queue_size))
+        self.jobs = queue.Queue()
+        self.server = None
+        self.stats = {'accepted': 0, 'busy': 0, 'failed': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            try:
+                job.result = self.recognize(job.name, job.payload, job.source)
+            except Exception as e:
+                logger.error(f"OCR service failed on {job.name}: {e}")
+                self._count('failed')
+                job.result = (None, str(e))
+            finally:
+                close_old_connections()
+                job.done.set()
+
+    def handle(self, rfile, wfile):
+        """Serve one connection: admit or refuse, then read the upload and reply with its text"""
+        try:
+            header = _read_message(rfile)
+            length = int(header['length'])
+        except (ValueError, KeyError, TypeError) as e:
+            _send_message(wfile, {'status': 'error', 'error': f'Invalid request: {e}'})
+            return
+        if length > OCR_SERVICE_MAX_BYTES:
+            _send_message(wfile, {'status': 'error', 'error': 'File size too large.'})
+            return
+        if not self.slots.acquire(blocking=False):
+            self._count('busy')
+            _send_message(wfile, {'status': 'busy'})
+            return
+        try:
+            self._count('accepted')
+            _send_message(wfile, {'status': 'accepted'})
+            payload = rfile.read(length)
+            if len(payload) != length:
+                return
+            job = _Job(os.path.basename(str(header.get('name') or 'upload')), header.get('source') or 'upload', payload)
+            self.jobs.put(job)
+            job.done.wait()
+            text, error = job.result
+            _send_message(wfile, {'status': 'ok', 'text': text, 'error': error})
+        finally:
+            self.slots.release()
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    service.handle(self.rfile, self.wfile)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self.server.daemon_threads = True
+        os.chmod(self.socket_path, 0o660)
+        threads = [
+            threading.Thread(target=self._work, name=f'ocr-service-{index}', daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            for _ in threads:
+                self.jobs.put(None)
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+
+def recognize_via_service(file, source='upload', socket_path=None, timeout=None):
+    """
+    OCR an uploaded or stored file in the OCR service.
+    Returns: (text, error) like extract_text_from_image
+    Raises: OCRServiceBusy at once when the service is saturated,
+    OCRServiceUnavailable when it cannot be reached
+    """
+    socket_path = socket_path or ocr_service_socket()
+    file.seek(0)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.settimeout(CONNECT_TIMEOUT_SECONDS)
+        connection.connect(socket_path)
+    except OSError as e:
+        connection.close()
+        raise OCRServiceUnavailable(f"OCR service at {socket_path} unavailable: {e}")
+
+    with connection, connection.makefile('rb') as rfile, connection.makefile('wb') as wfile:
+        try:
+            _send_message(wfile, {'name': file.name, 'source': source, 'length': file.size})
+            reply = _read_message(rfile)
+            if reply.get('status') == 'busy':
+                raise OCRServiceBusy('OCR service is busy')
+            if reply.get('status') != 'accepted':
+                return None, reply.get('error') or 'OCR service rejected the upload'
+
+            for chunk in file.chunks():
+                wfile.write(chunk)
+            wfile.flush()
+            connection.settimeout(timeout or ocr_service_timeout())
+            reply = _read_message(rfile)
+        except (OSError, ValueError) as e:
+            raise OCRServiceUnavailable(f"OCR service at {socket_path} failed: {e}")
+        finally:
+            file.seek(0)
+    if reply.get('status') != 'ok':
+        return None, reply.get('error') or 'OCR service failed'
+    return reply.get('text'), reply.get('error')
+
+
+def recognize_via_service_waiting(file, source='upload', wait_seconds=None):
+    """
+    Like recognize_via_service, but while the service is busy keep retrying
+    with backoff for up to `wait_seconds` (for background work that may wait)
+    """
+    deadline = time.monotonic() + (wait_seconds if wait_seconds is not None else ocr_service_timeout())
+    delay = 0.1
+    while True:
+        try:
+            return recognize_via_service(file, source)
+        except OCRServiceBusy:
+            if time.monotonic() + delay > deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
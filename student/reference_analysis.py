@@ -0,0 +1,76 @@
+"""
+Background OCR and vectorization of reference answers.
+
+With REFERENCE_ANALYSIS_ASYNC, ReferenceAnswer.save() stores the reference
+as "pending analysis" and returns; the OCR and TF-IDF work for whatever
+changed runs here on a small thread pool once the save has committed.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_ANALYSIS_THREADS = 2
+
+ANALYSIS_FIELDS = ['ocr_text', 'image_sha256', 'text_sha256', 'tfidf_vector', 'analysis', 'analysis_status']
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def reference_analysis_async():
+    """Whether reference answer saves defer OCR and vectorization to the background"""
+    return getattr(settings, 'REFERENCE_ANALYSIS_ASYNC', False)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=REFERENCE_ANALYSIS_THREADS, thread_name_prefix='reference-analysis')
+        return _executor
+
+
+def schedule_reference_analysis(ref_id):
+    """Analyze a reference in the background once the current transaction commits"""
+    transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, ref_id))
+
+
+def _run_in_thread(ref_id):
+    try:
+        run_reference_analysis(ref_id)
+    finally:
+        # Threads outside the request cycle must release their own connections
+        close_old_connections()
+
+
+def run_reference_analysis(ref_id):
+    """
+    Bring a pending reference up to date and mark it ready, or failed when
+    the work raised. Only the derived fields are written, so edits made to
+    the reference meanwhile are kept; updated_at is bumped because grading
+    cache keys depend on it.
+    """
+    from main.models import ReferenceAnswer
+
+    ref_answer = ReferenceAnswer.objects.filter(pk=ref_id).first() # type: ignore
+    if ref_answer is None:
+        return
+    try:
+        ref_answer.refresh_analysis()
+    except Exception as e:
+        logger.error(f"Background analysis of reference answer {ref_id} failed: {e}")
+        ReferenceAnswer.objects.filter(pk=ref_id).update( # type: ignore
+            analysis_status=ReferenceAnswer.ANALYSIS_FAILED,
+            updated_at=timezone.now()
+        )
+        return
+    ReferenceAnswer.objects.filter(pk=ref_id).update( # type: ignore
+        updated_at=timezone.now(),
+        **{field: getattr(ref_answer, field) for field in ANALYSIS_FIELDS}
+    )
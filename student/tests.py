@@ -1,3 +1,1449 @@
-from django.test import TestCase
+"""
+Unit tests for student app grading utilities
+"""
+from datetime import timedelta
+from io import BytesIO, StringIO
+import json
+import shutil
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+import cv2
+import numpy as np
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from unittest import skipUnless
+
+from main.models import Exam_Model, Question_DB, Question_Paper, ReferenceAnswer
+from main.models.group import Special_Students
+from student.grading import available_backends, get_backend, resolve_backend_name
+from student.jobs import claim_jobs, enqueue_exam_grading
+from student.ocr_batches import create_ocr_batch
+from student.ocr_service import OCRService, OCRServiceBusy, recognize_via_service
+from student.reference_analysis import run_reference_analysis
+from PIL import Image
+from student.ocr import (
+    OCR_CONFIGS,
+    OCRResult,
+    available_engines,
+    estimate_text_height,
+    get_cached_ocr,
+    get_ocr_engine,
+    is_pdf,
+    iter_pdf_pages,
+    image_pixel_hash,
+    ocr_cache_stats,
+    store_ocr_result,
+    is_confident,
+    normalize_for_ocr,
+    ocr_with_early_exit,
+    ordered_configs,
+    parse_config,
+    pdf_support_available,
+    recognize_page,
+    record_ocr_outcome,
+    resolve_engine_name,
+    run_config_sweep,
+    segment_blocks,
+)
+from student.ocr.layout import page_configs
+from student.ocr.normalize import ink_mask, normalization_scale
+from student.ocr.preprocess import feature_bucket, image_features, ordered_preprocessing, record_preprocessing_outcome
+from student.ocr import pool
+from student.ocr.pool import _run_inline
+from student.ocr.quality import character_error_rate, result_from_data, text_density
+from student.models import ExamResults, GradingJob, OCRBatch, OCRBatchItem, OCRCacheEntry, OCRConfigStat, OCRPreprocessingStat, QuestionCorpusStats, Stu_Question, StuExam_DB, SubjectiveAnswer
+from student.utils import (
+    ANALYSIS_VERSION,
+    analyze_text,
+    apply_image_ocr,
+    build_tfidf_matrix,
+    calculate_similarity_score,
+    cohort_similarity_matrix,
+    compile_keyword_automaton,
+    compile_text_analysis,
+    extract_keywords,
+    decode_image,
+    extract_text_from_image,
+    preprocess_camscanner_image,
+    grade_answer,
+    grade_answers_batch,
+    grading_cache_stats,
+    ingest_image,
+    is_analysis_current,
+    load_reference_analyses,
+    manual_cosine_similarity,
+    manual_tfidf_vectorizer,
+    pairwise_similarity_matrix,
+    similarity_from_analyses,
+    sparse_cosine_similarity,
+    stem_cache_info,
+    stem_word,
+    stemmed_token_stream,
+    validate_image_file,
+)
+
+
+REFERENCE_TEXT = (
+    "Photosynthesis is the process by which green plants use sunlight, water and "
+    "carbon dioxide to produce glucose and oxygen. It takes place in the chloroplasts."
+)
+
+STUDENT_TEXTS = [
+    REFERENCE_TEXT,
+    "Plants use sunlight and water and carbon dioxide to make glucose. Oxygen is released.",
+    "Photosynthesis happens in chloroplasts where light energy is converted into chemical energy.",
+    "The mitochondria is the powerhouse of the cell.",
+    "the of and is",
+    "",
+]
+
+
+FAKE_OCR_OUTPUT = {
+    '--psm 6': ("Photosynthesis makes glucose", 60.0),
+    '--psm 8': ("Photosynthesis", 90.0),
+    '--psm 13': ("Photosynthesis makes glucose and oxygen", 85.0),
+    '--psm 6 --oem 3': ("~~ |_ ;; Photo", 95.0),
+}
+
+
+def fake_tesseract(image, config, timeout):
+    """Stand-in for a Tesseract run (module level so pool workers can import it)"""
+    if image == 'slow':
+        time.sleep(min(timeout, 1.5))
+    text, confidence = FAKE_OCR_OUTPUT.get(config, ("", 0.0))
+    return OCRResult(config, text, confidence, len(text.split()), text_density(text))
+
+
+def recording_tesseract(image, config, timeout):
+    """fake_tesseract that first appends the config it was started with to the file named by image"""
+    with open(image, 'a') as runs:
+        runs.write(f"{config}\n")
+    return fake_tesseract('image', config, timeout)
+
+
+def fake_block_tesseract(image, config, timeout):
+    """Stand-in for Tesseract on one page block: reports the block height and config"""
+    text = f"block of {image.shape[0]} rows read with {config}"
+    return OCRResult(config, text, 90.0, len(text.split()), text_density(text))
+
+
+def reference_similarity(student_text, reference_text):
+    """Score a pair with the original dict-based implementation"""
+    if not student_text or not reference_text:
+        return 0.0
+    vectors, vocab = manual_tfidf_vectorizer([student_text, reference_text], ngram_range=(1, 2))
+    return manual_cosine_similarity(vectors[0], vectors[1], vocab)
+
+
+class SparseSimilarityEngineTest(SimpleTestCase):
+    """Regression tests for the sparse TF-IDF similarity engine"""
+
+    def test_scores_match_manual_implementation(self):
+        """Test sparse scores match the manual TF-IDF cosine for every pair"""
+        for student_text in STUDENT_TEXTS:
+            with self.subTest(student_text=student_text[:30]):
+                self.assertAlmostEqual(
+                    calculate_similarity_score(student_text, REFERENCE_TEXT),
+                    reference_similarity(student_text, REFERENCE_TEXT),
+                    places=9
+                )
+
+    def test_identical_texts_score_one(self):
+        """Test identical answers have similarity 1.0"""
+        self.assertAlmostEqual(calculate_similarity_score(REFERENCE_TEXT, REFERENCE_TEXT), 1.0, places=9)
+
+    def test_empty_text_scores_zero(self):
+        """Test empty or stopword-only answers score 0.0"""
+        self.assertEqual(calculate_similarity_score("", REFERENCE_TEXT), 0.0)
+        self.assertEqual(calculate_similarity_score("the of and", "is a the"), 0.0)
+
+    def test_matrix_idf_matches_manual_vectorizer(self):
+        """Test the CSR matrix holds the same TF-IDF weights as the manual vectorizer"""
+        texts = STUDENT_TEXTS[:4]
+        matrix, vocabulary = build_tfidf_matrix(texts)
+        vectors, vocab = manual_tfidf_vectorizer(texts)
+        self.assertEqual(set(vocabulary), set(vocab))
+        for row, vector in enumerate(vectors):
+            for term, column in vocabulary.items():
+                self.assertAlmostEqual(matrix[row, column], vector[term], places=12)
+
+    def test_pairwise_matrix_shape(self):
+        """Test cosine similarity of two matrices yields one score per row pair"""
+        matrix, _ = build_tfidf_matrix(STUDENT_TEXTS[:3] + [REFERENCE_TEXT])
+        scores = sparse_cosine_similarity(matrix[:3], matrix[3:])
+        self.assertEqual(scores.shape, (3, 1))
+        self.assertAlmostEqual(scores[0, 0], 1.0, places=9)
+
+
+class TextAnalyzerTest(SimpleTestCase):
+    """Test cases for the single-pass analyzer and shared stem cache"""
+
+    def test_ngrams_and_keywords_from_one_pass(self):
+        """Test n-grams drop stopwords while keywords only drop short words"""
+        ngrams, keywords = analyze_text("The cats are running")
+        self.assertEqual(ngrams, ['cat', 'run', 'cat run'])
+        self.assertEqual(keywords, {'the', 'cat', 'are', 'run'})
+
+    def test_repeated_words_hit_stem_cache(self):
+        """Test stemming the same word again is served from the cache"""
+        stem_word('chloroplasts')
+        hits_before = stem_cache_info().hits
+        analyze_text("chloroplasts chloroplasts")
+        self.assertEqual(stem_cache_info().hits, hits_before + 2)
+
+    def test_stem_cache_is_bounded(self):
+        """Test the stem cache has a size cap"""
+        self.assertIsNotNone(stem_cache_info().maxsize)
+
+
+class KeywordAutomatonTest(SimpleTestCase):
+    """Test cases for the Aho-Corasick keyword and key phrase matcher"""
+
+    def test_keywords_match_set_intersection(self):
+        """Test the automaton finds the same keywords as intersecting keyword sets"""
+        automaton = compile_keyword_automaton(tuple(sorted(extract_keywords(REFERENCE_TEXT))))
+        for student_text in STUDENT_TEXTS:
+            with self.subTest(student_text=student_text[:30]):
+                matched, phrases = automaton.match(stemmed_token_stream(student_text))
+                self.assertEqual(matched, extract_keywords(REFERENCE_TEXT) & extract_keywords(student_text))
+                self.assertEqual(phrases, [])
+
+    def test_overlapping_phrases_and_positions(self):
+        """Test overlapping key phrases are all found at their token positions"""
+        automaton = compile_keyword_automaton((), ('carbon dioxide', 'dioxide and water', 'light energy'))
+        stream = stemmed_token_stream("Plants take carbon dioxide and water; light energy drives it.")
+        starts = {automaton.patterns[index][0]: start for index, start in automaton.scan(stream)}
+        self.assertEqual(starts, {'carbon dioxide': 2, 'dioxide and water': 3, 'light energy': 6})
+        self.assertEqual(automaton.match(stream)[1], ['carbon dioxide', 'dioxide and water', 'light energy'])
+
+    def test_phrases_match_inflected_words(self):
+        """Test key phrases are matched on stems, not exact spelling"""
+        automaton = compile_keyword_automaton((), ('produces glucose',))
+        self.assertEqual(automaton.match(stemmed_token_stream("they produce glucose"))[1], ['produces glucose'])
+
+    def test_automaton_is_cached_by_content(self):
+        """Test the same keywords and phrases reuse one compiled automaton"""
+        self.assertIs(compile_keyword_automaton(('a',), ('b c',)), compile_keyword_automaton(('a',), ('b c',)))
+
+
+class OCRConfigSweepTest(TestCase):
+    """Test cases for the confidence-driven, concurrent OCR config sweep"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Start the pool workers outside the timed tests
+        run_config_sweep('image', runner=fake_tesseract)
+
+    def test_confident_first_config_runs_alone(self):
+        """Test a confident result from the first config ends the search after one run"""
+        best, completed = ocr_with_early_exit('image', ['--psm 13', '--psm 6', '--psm 8'], time.monotonic() + 5, fake_tesseract)
+        self.assertEqual(best.config, '--psm 13')
+        self.assertEqual(len(completed), 1)
+
+    def test_unconfident_first_config_sweeps_the_rest(self):
+        """Test the remaining configs run when the first is not confident, and noise never wins"""
+        best, completed = ocr_with_early_exit('image', ['--psm 6', '--psm 6 --oem 3', '--psm 13'], time.monotonic() + 5, fake_tesseract)
+        self.assertEqual(best.config, '--psm 13')
+        self.assertGreaterEqual(len(completed), 2)
+
+    def test_pool_and_inline_sweeps_agree(self):
+        """Test the pooled sweep finds the same confident result as a sequential one"""
+        configs = ['--psm 6', '--psm 13']
+        pooled = run_config_sweep('image', configs, runner=fake_tesseract)
+        inline = _run_inline('image', configs, time.monotonic() + 5, fake_tesseract)
+        self.assertIn(inline[-1], pooled)
+
+    def test_configs_only_start_on_idle_workers(self):
+        """Test configs beyond the idle workers are not submitted, so a confident winner leaves them unrun"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        runs_path = f'{directory}/runs.txt'
+        configs = ['--psm 13', '--psm 6', '--psm 8', '--psm 6 --oem 3', '--psm 8 --oem 3', '--psm 11']
+        completed = run_config_sweep(runs_path, configs, runner=recording_tesseract)
+        self.assertEqual(completed[0].config, '--psm 13')
+        with open(runs_path) as runs:
+            started = runs.read().split('\n')[:-1]
+        self.assertLessEqual(len(started), max(1, pool.OCR_POOL_WORKERS))
+        self.assertLess(len(started), len(configs))
+
+    def test_deadline_bounds_the_sweep(self):
+        """Test the sweep gives up at the image deadline"""
+        started = time.monotonic()
+        self.assertEqual(run_config_sweep('slow', deadline=time.monotonic() + 0.5, runner=fake_tesseract), [])
+        self.assertLess(time.monotonic() - started, 1.2)
+
+    def test_config_order_follows_wins(self):
+        """Test configs that won before for a source are tried first"""
+        self.assertEqual(ordered_configs('subjective_answer'), OCR_CONFIGS)
+        winner = fake_tesseract('image', '--psm 13', 1)
+        for _ in range(3):
+            record_ocr_outcome('subjective_answer', 'none', [fake_tesseract('image', '--psm 6', 1), winner], winner)
+        self.assertEqual(ordered_configs('subjective_answer')[0], '--psm 13')
+        self.assertEqual(ordered_configs('reference_answer'), OCR_CONFIGS)
+        stat = OCRConfigStat.objects.get(source='subjective_answer', config='--psm 6')
+        self.assertEqual((stat.runs, stat.wins), (3, 0))
+
+    def test_result_from_tesseract_data(self):
+        """Test words are regrouped into lines and confidences averaged"""
+        data = {
+            'text': ['', 'Green', 'plants', '', 'grow'],
+            'conf': ['-1', '90', '80', '-1', '70'],
+            'block_num': [1, 1, 1, 1, 1],
+            'par_num': [1, 1, 1, 1, 1],
+            'line_num': [0, 1, 1, 2, 2],
+        }
+        result = result_from_data('--psm 6', data)
+        self.assertEqual(result.text, "Green plants\ngrow")
+        self.assertEqual((result.mean_confidence, result.word_count, result.density), (80.0, 3, 1.0))
+        self.assertTrue(is_confident(result))
+
+
+class OCREngineTest(SimpleTestCase):
+    """Test cases for OCR engine selection"""
+
+    def test_parse_config(self):
+        """Page segmentation and engine modes are read from the option string"""
+        self.assertEqual(parse_config('--psm 6 --oem 1'), (6, 1))
+        self.assertEqual(parse_config('--oem 3'), (None, 3))
+        self.assertEqual(parse_config(''), (None, None))
+
+    def test_pytesseract_is_always_available(self):
+        """The subprocess engine is the fallback for any unavailable engine"""
+        self.assertIn('pytesseract', available_engines())
+        self.assertIn(resolve_engine_name('auto'), available_engines())
+        self.assertEqual(resolve_engine_name('no-such-engine'), 'pytesseract')
+
+    def test_engine_instances_are_reused(self):
+        """Each process keeps one instance per engine"""
+        self.assertIs(get_ocr_engine('pytesseract'), get_ocr_engine('pytesseract'))
+        self.assertEqual(get_ocr_engine('pytesseract').name, 'pytesseract')
+
+    def test_benchmark_rejects_missing_images(self):
+        """benchmark_ocr fails cleanly when there is nothing to read"""
+        with self.assertRaises(CommandError):
+            call_command('benchmark_ocr', '/nonexistent/image.png', stdout=StringIO())
+
+
+def text_page(font_scale, size=(1200, 2400)):
+    """A white RGB page with two lines of large printed text in the middle"""
+    page = np.full(size + (3,), 255, dtype=np.uint8)
+    for row, line in enumerate(['THE WATER CYCLE MOVES', 'WATER AROUND THE EARTH']):
+        cv2.putText(page, line, (300, 450 + row * 200), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), 6)
+    return page
+
+
+class OCRNormalizationTest(SimpleTestCase):
+    """Test cases for resolution normalization ahead of OCR"""
+
+    def test_large_text_is_scaled_down(self):
+        """Oversized letters are brought to the target height and margins are cropped"""
+        page = text_page(font_scale=3)
+        normalized = normalize_for_ocr(page, target=30)
+        self.assertEqual(normalized.ndim, 2)
+        self.assertEqual(normalized.dtype, np.uint8)
+        self.assertLess(normalized.size, page.shape[0] * page.shape[1] / 10)
+        self.assertAlmostEqual(estimate_text_height(ink_mask(normalized)), 30, delta=5)
+
+    def test_blank_page_is_not_rescaled(self):
+        """Without glyphs there is no text height, and small pages keep their size"""
+        page = np.full((300, 400, 3), 255, dtype=np.uint8)
+        self.assertIsNone(estimate_text_height(ink_mask(page[:, :, 0])))
+        self.assertEqual(normalize_for_ocr(page).shape, (300, 400))
+
+    def test_scale_limits(self):
+        """Small text is enlarged, but never past the maximum page dimension"""
+        self.assertEqual(normalization_scale(30, (1000, 1000), target=30), 1.0)
+        self.assertEqual(normalization_scale(10, (500, 500), target=30, max_dimension=5000), 2.0)
+        self.assertEqual(normalization_scale(10, (2000, 2000), target=30, max_dimension=2500), 1.25)
+        self.assertEqual(normalization_scale(None, (5000, 1000), max_dimension=2500), 0.5)
+
+
+class OCRPreprocessingSelectionTest(TestCase):
+    """Test cases for choosing preprocessing from page features and past outcomes"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.page = cv2.cvtColor(text_page(font_scale=3), cv2.COLOR_RGB2GRAY)
+
+    def test_features_describe_the_page(self):
+        """Uneven lighting, rotation and noise each move the page to another bucket"""
+        clean = image_features(self.page)
+        self.assertGreater(clean.contrast, 0.9)
+        self.assertEqual(feature_bucket(clean), 'c2u1s0n0')
+
+        shaded = (self.page * np.linspace(0.35, 1, self.page.shape[1])[None, :]).astype(np.uint8)
+        self.assertLess(image_features(shaded).uniformity, 0.75)
+
+        height, width = self.page.shape
+        rotation = cv2.getRotationMatrix2D((width / 2, height / 2), 8, 1)
+        rotated = cv2.warpAffine(self.page, rotation, (width, height), borderValue=255)
+        self.assertAlmostEqual(image_features(rotated).skew, 8, delta=1)
+
+        noise = np.random.default_rng(0).normal(0, 40, self.page.shape)
+        noisy = np.clip(self.page + noise, 0, 255).astype(np.uint8)
+        self.assertGreater(image_features(noisy).noise, image_features(self.page).noise * 10)
+
+    def test_order_follows_outcomes_per_bucket(self):
+        """A pipeline that keeps succeeding on a bucket is tried first there, and only there"""
+        self.assertEqual(ordered_preprocessing('subjective_answer', 'c0u0s0n2', max_passes=3), ['none', 'camscanner', 'otsu'])
+        for _ in range(3):
+            record_preprocessing_outcome('subjective_answer', 'c0u0s0n2', 'none', False)
+            record_preprocessing_outcome('subjective_answer', 'c0u0s0n2', 'otsu', True)
+        self.assertEqual(ordered_preprocessing('subjective_answer', 'c0u0s0n2', max_passes=2), ['otsu', 'camscanner'])
+        self.assertEqual(ordered_preprocessing('subjective_answer', 'c2u1s0n0', max_passes=1), ['none'])
+        stat = OCRPreprocessingStat.objects.get(bucket='c0u0s0n2', preprocessing='otsu')
+        self.assertEqual((stat.runs, stat.successes), (3, 3))
+
+
+def answer_sheet():
+    """A grayscale page with a one-line answer, a wide gap and a two-line answer"""
+    page = np.full((900, 1200), 255, dtype=np.uint8)
+    lines = [(150, 'Q1 WATER EVAPORATES'), (500, 'Q2 PLANTS MAKE GLUCOSE'), (570, 'FROM SUNLIGHT AND WATER')]
+    for y, line in lines:
+        cv2.putText(page, line, (100, y), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 0, 3)
+    return page
+
+
+class OCRLayoutTest(TestCase):
+    """Test cases for splitting answer sheets into text blocks"""
+
+    def test_blocks_in_reading_order(self):
+        """Answers separated by a wide gap become separate blocks, top to bottom"""
+        blocks = segment_blocks(answer_sheet())
+        self.assertEqual([block.line_count for block in blocks], [1, 2])
+        self.assertLess(blocks[0].bottom, blocks[1].top)
+        self.assertTrue(all(block.right - block.left < 1200 for block in blocks))
+
+    def test_blocks_are_read_concurrently_and_reassembled(self):
+        """Each block gets a config for its line count and the texts keep page order"""
+        result = recognize_page(answer_sheet(), 'subjective_answer', 'none', time.monotonic() + 10, fake_block_tesseract)
+        self.assertEqual(result.config, 'blocks:2')
+        first, second = result.text.split('\n')
+        self.assertTrue(first.endswith('--psm 7'))
+        self.assertTrue(second.endswith('--psm 6'))
+        self.assertEqual(result.word_count, 16)
+
+    def test_single_line_configs_skipped_for_multi_line_pages(self):
+        """Single word and raw line modes only run on pages with one line"""
+        self.assertEqual(page_configs(OCR_CONFIGS, 1), OCR_CONFIGS)
+        self.assertEqual(page_configs(OCR_CONFIGS, 3), ['--psm 6', '--psm 6 --oem 3'])
+
+
+def make_upload(name, image_format, color=(200, 30, 30)):
+    """An in-memory image upload; the same color gives the same pixels in any lossless format"""
+    buffer = BytesIO()
+    Image.new('RGB', (40, 20), color).save(buffer, format=image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class OCRCacheTest(TestCase):
+    """Test cases for the OCR result cache keyed by decoded pixels"""
+
+    def setUp(self):
+        """Set up test data"""
+        upload = make_upload('answer.png', 'PNG')
+        self.pixel_hash = image_pixel_hash(Image.open(upload).convert('RGB'))
+        store_ocr_result(self.pixel_hash, OCRResult('--psm 6', "Cached answer text", 91.0, 3, 1.0))
+
+    def test_identical_pixels_skip_tesseract(self):
+        """Test an upload whose pixels were OCR'd before returns the cached text, whatever its encoding"""
+        before = ocr_cache_stats()
+        for upload in (make_upload('answer.png', 'PNG'), make_upload('copy.bmp', 'BMP')):
+            self.assertEqual(extract_text_from_image(upload), ("Cached answer text", None))
+        after = ocr_cache_stats()
+        self.assertEqual(after['hits'], before['hits'] + 2)
+        self.assertEqual(OCRCacheEntry.objects.get(image_sha256=self.pixel_hash).hits, 2)
+
+    def test_different_pixels_miss(self):
+        """Test a different image is not served from the cache"""
+        other = image_pixel_hash(Image.open(make_upload('other.png', 'PNG', color=(0, 0, 0))))
+        self.assertNotEqual(other, self.pixel_hash)
+        self.assertIsNone(get_cached_ocr(other))
+
+    def test_decoded_array_hashes_like_pil_image(self):
+        """Test the in-memory array and the PIL image of an upload share one cache key"""
+        pixels = decode_image(make_upload('answer.png', 'PNG'))
+        self.assertEqual(pixels.shape, (20, 40, 3))
+        self.assertEqual(image_pixel_hash(pixels), self.pixel_hash)
+
+    def test_preprocessing_works_on_arrays(self):
+        """Test CamScanner preprocessing takes the decoded array without a file round trip"""
+        processed = preprocess_camscanner_image(decode_image(make_upload('answer.png', 'PNG')))
+        self.assertEqual(processed.shape, (20, 40))
+
+    def test_pipeline_version_change_misses(self):
+        """Test entries from another OCR pipeline version are ignored"""
+        OCRCacheEntry.objects.update(pipeline_version=0)
+        self.assertIsNone(get_cached_ocr(self.pixel_hash))
+
+    def test_failed_ocr_is_not_cached(self):
+        """Test empty results are never stored"""
+        store_ocr_result('0' * 64, None)
+        store_ocr_result('1' * 64, OCRResult('--psm 6', "", 0.0, 0, 0.0))
+        self.assertEqual(OCRCacheEntry.objects.count(), 1)
+
+
+class ImageIngestionTest(TestCase):
+    """Test cases for validating and decoding an upload in one pass"""
+
+    def test_upload_decoded_once_for_ocr(self):
+        """Test the ingested pixels and their hash are what OCR looks up"""
+        pixel_hash = image_pixel_hash(decode_image(make_upload('answer.png', 'PNG')))
+        store_ocr_result(pixel_hash, OCRResult('--psm 6', "Cached answer text", 91.0, 3, 1.0))
+        ingested, error = ingest_image(make_upload('answer.png', 'PNG'))
+        self.assertIsNone(error)
+        self.assertEqual((ingested.format, ingested.width, ingested.height), ('PNG', 40, 20))
+        self.assertEqual(ingested.pixels.shape, (20, 40, 3))
+        self.assertEqual(ingested.pixel_hash, pixel_hash)
+        self.assertEqual(extract_text_from_image(ingested), ("Cached answer text", None))
+
+    def test_validation_alone_does_not_decode(self):
+        """Test validation without decode keeps no pixel buffer"""
+        ingested, error = ingest_image(make_upload('answer.png', 'PNG'), decode=False)
+        self.assertIsNone(error)
+        self.assertIsNone(ingested.pixels)
+
+    def test_oversized_and_corrupt_images_rejected(self):
+        """Test dimension limits and truncated data are caught while ingesting"""
+        buffer = BytesIO()
+        Image.new('RGB', (4001, 10)).save(buffer, format='PNG')
+        ingested, error = ingest_image(SimpleUploadedFile('wide.png', buffer.getvalue()))
+        self.assertIsNone(ingested)
+        self.assertIn('dimensions too large', error)
+
+        truncated = make_upload('answer.jpg', 'JPEG').read()[:200]
+        ingested, error = ingest_image(SimpleUploadedFile('answer.jpg', truncated))
+        self.assertIsNone(ingested)
+        self.assertIn('Invalid image file', error)
+
+    def test_phone_camera_mpo_jpeg_accepted(self):
+        """Test a .jpg saved as MPO (multi-picture JPEG) by a phone camera is a valid upload"""
+        buffer = BytesIO()
+        image = Image.new('RGB', (40, 20), (200, 30, 30))
+        image.save(buffer, format='MPO', save_all=True, append_images=[image])
+        ingested, error = ingest_image(SimpleUploadedFile('photo.jpg', buffer.getvalue()))
+        self.assertIsNone(error)
+        self.assertEqual(ingested.format, 'MPO')
+        self.assertEqual(ingested.pixels.shape, (20, 40, 3))
+        self.assertEqual(validate_image_file(SimpleUploadedFile('photo.jpg', buffer.getvalue())), (True, None))
+
+    def test_format_checked_on_content(self):
+        """Test a BMP renamed to .png is accepted by its decoded format, text renamed to .png is not"""
+        ingested, error = ingest_image(make_upload('answer.png', 'BMP'))
+        self.assertEqual(ingested.format, 'BMP')
+        self.assertFalse(ingest_image(SimpleUploadedFile('answer.png', b'not an image'))[0])
+
+
+def make_pdf(page_count):
+    """An in-memory PDF upload with one plain page per page_count"""
+    buffer = BytesIO()
+    pages = [Image.new('RGB', (300, 400), (255, 255, 255)) for _ in range(page_count)]
+    pages[0].save(buffer, format='PDF', save_all=True, append_images=pages[1:])
+    return SimpleUploadedFile('answers.pdf', buffer.getvalue(), content_type='application/pdf')
+
+
+class PDFAnswerTest(SimpleTestCase):
+    """Test cases for multi-page PDF answer uploads"""
+
+    def test_pdf_detected_by_content(self):
+        """PDFs are recognized by their header, not their name"""
+        self.assertTrue(is_pdf(make_pdf(1)))
+        self.assertFalse(is_pdf(make_upload('answer.pdf', 'PNG')))
+
+    def test_fake_pdf_rejected(self):
+        """A file named .pdf that is not a PDF fails validation"""
+        is_valid, error = validate_image_file(make_upload('answer.pdf', 'PNG'))
+        self.assertFalse(is_valid)
+        self.assertIn('Invalid PDF', error)
+
+    def test_images_still_validated(self):
+        """Image uploads keep their own checks"""
+        self.assertEqual(validate_image_file(make_upload('answer.png', 'PNG')), (True, None))
+        self.assertFalse(validate_image_file(SimpleUploadedFile('answer.txt', b'text'))[0])
+
+    @skipUnless(pdf_support_available(), 'needs pypdfium2 or pdf2image')
+    def test_pages_rasterized_one_at_a_time(self):
+        """Pages come out of a generator in order, each as an RGB array"""
+        upload = make_pdf(3)
+        self.assertEqual(validate_image_file(upload), (True, None))
+        pages = iter_pdf_pages(upload, dpi=72)
+        first = next(pages)
+        self.assertEqual(first.ndim, 3)
+        self.assertEqual(1 + sum(1 for _ in pages), 3)
+
+    @skipUnless(pdf_support_available(), 'needs pypdfium2 or pdf2image')
+    def test_oversized_page_rendered_within_pixel_cap(self):
+        """A page that would be huge at the requested DPI is rendered at a lower resolution"""
+        buffer = BytesIO()
+        # 300x400 pixels at 1 DPI is a 25x33 foot page
+        Image.new('RGB', (300, 400), (255, 255, 255)).save(buffer, format='PDF', resolution=1)
+        upload = SimpleUploadedFile('poster.pdf', buffer.getvalue(), content_type='application/pdf')
+        page = next(iter_pdf_pages(upload, dpi=200, max_pixels=1_000_000))
+        self.assertLessEqual(page.shape[0] * page.shape[1], 1_000_000)
+        self.assertGreater(page.shape[0] * page.shape[1], 900_000)
+
+
+@override_settings(OCR_BATCH_THREADS=0)
+class OCRBatchTest(TestCase):
+    """Test cases for the batch OCR endpoint and its status polling"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_override.enable()
+        for color, text in [((200, 30, 30), "First answer text"), ((30, 200, 30), "Second answer text")]:
+            pixel_hash = image_pixel_hash(Image.open(make_upload('answer.png', 'PNG', color=color)).convert('RGB'))
+            store_ocr_result(pixel_hash, OCRResult('--psm 6', text, 91.0, 3, 1.0))
+        self.user = User.objects.create_user(username='ocr_student', password='testpass123')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.media_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def submit(self, *uploads):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('student:api:ocr_batch'), {'images': list(uploads)})
+
+    def test_batch_returns_job_and_per_image_text(self):
+        """Images are accepted at once and their texts come back in upload order"""
+        response = self.submit(
+            make_upload('q1.png', 'PNG', color=(200, 30, 30)),
+            make_upload('q2.png', 'PNG', color=(30, 200, 30))
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['total'], 2)
+
+        status_response = self.client.get(response.json()['status_url'])
+        payload = status_response.json()
+        self.assertEqual(payload['status'], OCRBatch.STATUS_DONE)
+        self.assertEqual(payload['completed'], 2)
+        self.assertEqual([item['text'] for item in payload['items']], ["First answer text", "Second answer text"])
+        self.assertEqual([item['name'] for item in payload['items']], ['q1.png', 'q2.png'])
+
+    def test_unchanged_status_is_not_modified(self):
+        """A poll with the current ETag gets 304 until an item changes"""
+        response = self.submit(make_upload('q1.png', 'PNG'))
+        status_url = response.json()['status_url']
+        etag = self.client.get(status_url)['ETag']
+        self.assertEqual(self.client.get(status_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.assertEqual(self.client.get(status_url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}').status_code, 304)
+        # Only whole ETags match, not one that merely contains the current one
+        self.assertEqual(self.client.get(status_url, HTTP_IF_NONE_MATCH=f'"x{etag[1:-1]}x"').status_code, 200)
+
+        OCRBatch.objects.update(version=F('version') + 1)
+        changed = self.client.get(status_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_invalid_image_rejects_batch(self):
+        """No batch is created when any upload is invalid"""
+        response = self.submit(make_upload('q1.png', 'PNG'), SimpleUploadedFile('notes.txt', b'text'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['files'][0]['index'], 1)
+        self.assertFalse(OCRBatch.objects.exists())
+
+    def test_unknown_job_is_not_found(self):
+        """Polling an unknown job ID gives 404"""
+        response = self.client.get(reverse('student:api:ocr_batch_status', args=['00000000-0000-0000-0000-000000000000']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_batches_require_login_and_ownership(self):
+        """Anonymous uploads are refused and another user's batch is not found"""
+        status_url = self.submit(make_upload('q1.png', 'PNG')).json()['status_url']
+        self.client.logout()
+        self.assertEqual(self.submit(make_upload('q1.png', 'PNG')).status_code, 403)
+        self.assertEqual(self.client.get(status_url).status_code, 403)
+
+        self.client.force_login(User.objects.create_user(username='other_student', password='testpass123'))
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+
+    def test_stalled_batch_resumes_on_poll(self):
+        """Images stuck pending or running past their lease are OCR'd again, up to the attempt limit"""
+        batch = create_ocr_batch([
+            make_upload('q1.png', 'PNG', color=(200, 30, 30)),
+            make_upload('q2.png', 'PNG', color=(30, 200, 30))
+        ], user=self.user)
+        expired = timezone.now() - timedelta(seconds=1)
+        batch.items.filter(position=0).update(status=OCRBatchItem.STATUS_RUNNING, attempts=1, lease_expires_at=expired)
+        batch.items.filter(position=1).update(status=OCRBatchItem.STATUS_RUNNING, attempts=3, lease_expires_at=expired)
+        OCRBatch.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+        payload = self.client.get(reverse('student:api:ocr_batch_status', args=[batch.job_id])).json()
+        self.assertEqual(payload['status'], OCRBatch.STATUS_DONE)
+        self.assertEqual([item['status'] for item in payload['items']], [OCRBatchItem.STATUS_DONE, OCRBatchItem.STATUS_FAILED])
+        self.assertEqual(payload['items'][0]['text'], "First answer text")
+
+    def test_cleanup_deletes_old_batches_and_images(self):
+        """cleanup_ocr_batches removes batches past the retention period with their stored files"""
+        self.submit(make_upload('old.png', 'PNG'))
+        old_batch = OCRBatch.objects.get()
+        old_image = old_batch.items.get().image
+        self.assertTrue(old_image.storage.exists(old_image.name))
+        OCRBatch.objects.update(created_at=timezone.now() - timedelta(days=30))
+        self.submit(make_upload('new.png', 'PNG'))
+
+        call_command('cleanup_ocr_batches', days=7, stdout=StringIO())
+        self.assertFalse(OCRBatch.objects.filter(pk=old_batch.pk).exists())
+        self.assertFalse(old_image.storage.exists(old_image.name))
+        self.assertEqual(OCRBatch.objects.count(), 1)
+
+
+def echo_recognize(name, payload, source):
+    """Stands in for OCR in the service: reports what it was sent"""
+    return f"{name}:{len(payload)}:{source}", None
+
+
+class OCRServiceTest(TestCase):
+    """Test cases for the Unix socket OCR service and its backpressure"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = f'{self.directory}/ocr.sock'
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        if hasattr(self, 'service'):
+            self.service.shutdown()
+            self.thread.join(5)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def start_service(self, recognize, workers=1, queue_size=0):
+        self.service = OCRService(self.socket_path, workers, queue_size, recognize=recognize)
+        self.thread = threading.Thread(target=self.service.serve_forever, daemon=True)
+        self.thread.start()
+        for _ in range(100):
+            if self.service.server is not None:
+                break
+            time.sleep(0.01)
+
+    def test_upload_is_ocrd_by_the_service(self):
+        """With OCR_SERVICE_SOCKET set, the encoded upload goes to the service and its text comes back"""
+        self.start_service(echo_recognize)
+        upload = make_upload('answer.png', 'PNG')
+        with override_settings(OCR_SERVICE_SOCKET=self.socket_path):
+            self.assertEqual(extract_text_from_image(upload, source='ocr_api'), (f"answer.png:{upload.size}:ocr_api", None))
+            response = self.client.post(reverse('student:api:ocr'), {'image': make_upload('answer.png', 'PNG')})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['text'].startswith('answer.png:'))
+
+    def test_saturated_service_answers_busy_at_once(self):
+        """With every worker and queue slot taken, a request is turned away without waiting"""
+        def blocked_recognize(name, payload, source):
+            self.release.wait(10)
+            return "late text", None
+        self.start_service(blocked_recognize, workers=1, queue_size=0)
+        first = threading.Thread(target=recognize_via_service, args=(make_upload('first.png', 'PNG'), 'ocr_api', self.socket_path))
+        first.start()
+        for _ in range(100):
+            if self.service.stats['accepted']:
+                break
+            time.sleep(0.01)
+
+        started = time.monotonic()
+        with self.assertRaises(OCRServiceBusy):
+            recognize_via_service(make_upload('second.png', 'PNG'), 'ocr_api', self.socket_path)
+        with override_settings(OCR_SERVICE_SOCKET=self.socket_path):
+            response = self.client.post(reverse('student:api:ocr'), {'image': make_upload('third.png', 'PNG')})
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertEqual(self.service.stats['busy'], 2)
+        self.release.set()
+        first.join(5)
+
+    def test_busy_service_raises_unless_local_ocr_allowed(self):
+        """A busy service is only worked around locally when the caller asks for it (no grading queue)"""
+        def blocked_recognize(name, payload, source):
+            self.release.wait(10)
+            return "late text", None
+        pixel_hash = image_pixel_hash(decode_image(make_upload('answer.png', 'PNG')))
+        store_ocr_result(pixel_hash, OCRResult('--psm 6', "Cached answer text", 91.0, 3, 1.0))
+        self.start_service(blocked_recognize, workers=1, queue_size=0)
+        first = threading.Thread(target=recognize_via_service, args=(make_upload('first.png', 'PNG'), 'ocr_api', self.socket_path))
+        first.start()
+        for _ in range(100):
+            if self.service.stats['accepted']:
+                break
+            time.sleep(0.01)
+
+        answer = SubjectiveAnswer()
+        with override_settings(OCR_SERVICE_SOCKET=self.socket_path):
+            with self.assertRaises(OCRServiceBusy):
+                apply_image_ocr(answer, make_upload('answer.png', 'PNG'))
+            self.assertIsNone(answer.ocr_text)
+            self.assertEqual(apply_image_ocr(answer, make_upload('answer.png', 'PNG'), on_busy='local'), ("Cached answer text", None))
+        self.assertEqual(answer.text_answer, "Cached answer text")
+        self.release.set()
+        first.join(5)
+
+    def test_unreachable_service_falls_back_to_local_ocr(self):
+        """Without a listening service the upload is OCR'd in this process"""
+        pixel_hash = image_pixel_hash(decode_image(make_upload('answer.png', 'PNG')))
+        store_ocr_result(pixel_hash, OCRResult('--psm 6', "Cached answer text", 91.0, 3, 1.0))
+        with override_settings(OCR_SERVICE_SOCKET=self.socket_path):
+            self.assertEqual(extract_text_from_image(make_upload('answer.png', 'PNG')), ("Cached answer text", None))
+
+
+class ReferenceOCRCommandTest(TestCase):
+    """Test cases for the process_reference_ocr command"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_override.enable()
+        self.checkpoint = f'{self.media_root}/checkpoint.json'
+        professor = User.objects.create(username='test_professor')
+        question = Question_DB.objects.create(professor=professor, question="Explain photosynthesis.", question_type="SUBJECTIVE")
+        pixel_hash = image_pixel_hash(Image.open(make_upload('answer.png', 'PNG')).convert('RGB'))
+        store_ocr_result(pixel_hash, OCRResult('--psm 6', "Plants make glucose from sunlight", 91.0, 5, 1.0))
+        self.ref_answer = ReferenceAnswer.objects.create(
+            question=question,
+            professor=professor,
+            image_answer=make_upload('answer.png', 'PNG')
+        )
+        ReferenceAnswer.objects.update(ocr_text=None)
+
+    def tearDown(self):
+        self.media_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('process_reference_ocr', '--workers', '1', '--checkpoint', self.checkpoint, *args, stdout=out)
+        return out.getvalue()
+
+    def test_each_image_is_read_once(self):
+        """The command OCRs an image once and save() does not OCR it again"""
+        before = ocr_cache_stats()
+        output = self.run_command()
+        self.assertIn('Processed: 1, Failed: 0', output)
+        self.assertEqual(ocr_cache_stats()['hits'], before['hits'] + 1)
+        self.ref_answer.refresh_from_db()
+        self.assertEqual(self.ref_answer.ocr_text, "Plants make glucose from sunlight")
+        self.assertIsNotNone(self.ref_answer.analysis)
+
+    def test_unchanged_images_are_skipped(self):
+        """A later run skips images whose content hash is in the checkpoint, unless forced"""
+        self.run_command()
+        self.assertIn('Processed: 0, Failed: 0, Skipped: 1', self.run_command('--all'))
+        self.assertIn('Processed: 1, Failed: 0, Skipped: 0', self.run_command('--all', '--force'))
+
+
+class OCRCorpusBenchmarkTest(TestCase):
+    """Test cases for the ground-truth OCR benchmark command"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_override.enable()
+        self.corpus = f'{self.media_root}/corpus'
+        professor = User.objects.create(username='test_professor')
+        question = Question_DB.objects.create(professor=professor, question="Explain photosynthesis.", question_type="SUBJECTIVE")
+        pixel_hash = image_pixel_hash(decode_image(make_upload('answer.png', 'PNG')))
+        store_ocr_result(pixel_hash, OCRResult('--psm 6', "Plants make glucose", 91.0, 3, 1.0))
+        self.ref_answer = ReferenceAnswer.objects.create(
+            question=question,
+            professor=professor,
+            text_answer="Plants make glucose",
+            image_answer=make_upload('answer.png', 'PNG')
+        )
+        # The same image uploaded again as a student answer is seeded only once
+        SubjectiveAnswer.objects.create(
+            question=question,
+            student=professor,
+            image_answer=make_upload('copy.png', 'PNG')
+        )
+
+    def tearDown(self):
+        self.media_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def run_command(self, *args):
+        call_command('benchmark_ocr_corpus', '--corpus', self.corpus, '--strategy', 'pipeline', *args, stdout=StringIO())
+
+    def test_character_error_rate(self):
+        """CER counts edits per ground-truth character and ignores whitespace layout"""
+        self.assertEqual(character_error_rate("plants make\nglucose", "plants  make glucose"), 0.0)
+        self.assertAlmostEqual(character_error_rate("glucose", "glucase"), 1 / 7)
+        self.assertEqual(character_error_rate("glucose", ""), 1.0)
+
+    def test_seed_and_report(self):
+        """Seeding copies distinct media images with typed transcripts; the report has latency, CER and memory"""
+        report_path = f'{self.media_root}/report.json'
+        self.run_command('--seed', '--json', report_path)
+        with open(f'{self.corpus}/manifest.json') as manifest_file:
+            images = json.load(manifest_file)['images']
+        self.assertEqual(len(images), 1)
+        self.assertEqual(images[0]['text'], "Plants make glucose")
+
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report['scored_images'], 1)
+        row = report['strategies'][0]
+        self.assertEqual(row['strategy'], 'pipeline')
+        for key in ('p50_ms', 'p90_ms', 'p95_ms', 'p99_ms', 'cer', 'peak_rss_mb'):
+            self.assertIsNotNone(row[key])
+        # Peak memory includes the live OCR pool workers, not just this process
+        self.assertAlmostEqual(row['peak_rss_mb'], row['peak_main_rss_mb'] + row['peak_worker_rss_mb'])
+        # The benchmark bypasses the OCR cache and leaves no config statistics behind
+        self.assertFalse(OCRConfigStat.objects.exists())
+
+    def test_baseline_regression_fails(self):
+        """A CER rise beyond the allowed margin over the baseline is an error"""
+        self.run_command('--seed')
+        baseline_path = f'{self.media_root}/baseline.json'
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump({'strategies': [{'strategy': 'pipeline', 'p95_ms': 1e9, 'cer': 0.0}]}, baseline_file)
+        with self.assertRaisesMessage(CommandError, 'pipeline CER'):
+            self.run_command('--baseline', baseline_path, '--max-cer-regression', '0.01')
+
+
+class ReferenceChangeTrackingTest(TestCase):
+    """Test cases for change-aware OCR and vectorization in ReferenceAnswer.save"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_override.enable()
+        self.professor = User.objects.create(username='test_professor')
+        self.question = Question_DB.objects.create(professor=self.professor, question="Explain photosynthesis.", question_type="SUBJECTIVE")
+        for color, text in [((200, 30, 30), "Plants make glucose"), ((30, 200, 30), "Plants release oxygen")]:
+            pixel_hash = image_pixel_hash(Image.open(make_upload('answer.png', 'PNG', color=color)).convert('RGB'))
+            store_ocr_result(pixel_hash, OCRResult('--psm 6', text, 91.0, 3, 1.0))
+
+    def tearDown(self):
+        self.media_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_unchanged_text_is_not_revectorized(self):
+        """Saving without a text change keeps the vector; a text edit rebuilds it"""
+        ref_answer = ReferenceAnswer.objects.create(question=self.question, professor=self.professor, text_answer="Plants make glucose")
+        text_hash = ref_answer.text_sha256
+        ref_answer.tfidf_vector = {'kept': True}
+        ref_answer.key_phrases = "glucose"
+        ref_answer.save()
+        self.assertEqual(ref_answer.tfidf_vector, {'kept': True})
+
+        ref_answer.text_answer = "Plants make glucose from sunlight"
+        ref_answer.save()
+        self.assertNotEqual(ref_answer.text_sha256, text_hash)
+        self.assertIn('vector', ref_answer.tfidf_vector)
+
+    def test_image_is_read_only_when_its_content_changes(self):
+        """Other field edits skip OCR; a new image is OCR'd once"""
+        ref_answer = ReferenceAnswer.objects.create(
+            question=self.question,
+            professor=self.professor,
+            image_answer=make_upload('answer.png', 'PNG')
+        )
+        self.assertEqual(ref_answer.ocr_text, "Plants make glucose")
+        hits = ocr_cache_stats()['hits']
+        ref_answer.key_phrases = "glucose"
+        ref_answer.save()
+        self.assertEqual(ocr_cache_stats()['hits'], hits)
+
+        ref_answer.image_answer = make_upload('answer.png', 'PNG', color=(30, 200, 30))
+        ref_answer.save()
+        self.assertEqual(ocr_cache_stats()['hits'], hits + 1)
+        self.assertEqual(ref_answer.ocr_text, "Plants release oxygen")
+        self.assertEqual(ref_answer.analysis_status, ReferenceAnswer.ANALYSIS_READY)
+
+    @override_settings(REFERENCE_ANALYSIS_ASYNC=True)
+    def test_deferred_analysis(self):
+        """With async analysis the save returns pending and the background run completes it"""
+        ref_answer = ReferenceAnswer.objects.create(
+            question=self.question,
+            professor=self.professor,
+            image_answer=make_upload('answer.png', 'PNG')
+        )
+        ref_answer.refresh_from_db()
+        self.assertEqual(ref_answer.analysis_status, ReferenceAnswer.ANALYSIS_PENDING)
+        self.assertIsNone(ref_answer.ocr_text)
+
+        run_reference_analysis(ref_answer.pk)
+        ref_answer.refresh_from_db()
+        self.assertEqual(ref_answer.analysis_status, ReferenceAnswer.ANALYSIS_READY)
+        self.assertEqual(ref_answer.ocr_text, "Plants make glucose")
+        self.assertTrue(is_analysis_current(ref_answer.analysis))
+        self.assertFalse(ref_answer.needs_analysis())
+
+
+class ReferenceAnalysisTest(TestCase):
+    """Test cases for the compiled reference analysis used by grading"""
+
+    def setUp(self):
+        """Set up test data"""
+        professor_group = Group.objects.create(name="Professor")
+        self.professor = User.objects.create(username='test_professor')
+        self.professor.groups.add(professor_group)
+        self.student = User.objects.create(username='test_student')
+        self.question = Question_DB.objects.create(
+            professor=self.professor,
+            question="Explain photosynthesis.",
+            question_type="SUBJECTIVE"
+        )
+        self.reference = ReferenceAnswer.objects.create(
+            question=self.question,
+            professor=self.professor,
+            text_answer=REFERENCE_TEXT
+        )
+
+    def test_save_compiles_analysis(self):
+        """Test saving a reference answer stores a current analysis artifact"""
+        self.assertEqual(self.reference.analysis['version'], ANALYSIS_VERSION)
+        self.assertIn('photosynthesi', self.reference.analysis['keywords'])
+
+    def test_analysis_similarity_matches_pairwise_score(self):
+        """Test similarity from compiled artifacts matches the pairwise TF-IDF score"""
+        for student_text in STUDENT_TEXTS:
+            with self.subTest(student_text=student_text[:30]):
+                self.assertAlmostEqual(
+                    similarity_from_analyses(compile_text_analysis(student_text), self.reference.analysis),
+                    calculate_similarity_score(student_text, REFERENCE_TEXT),
+                    places=9
+                )
+
+    def test_stale_analysis_is_recompiled_and_persisted(self):
+        """Test an outdated artifact is rebuilt once and written back"""
+        ReferenceAnswer.objects.filter(pk=self.reference.pk).update(analysis={'version': 0})
+        loaded = load_reference_analyses(ReferenceAnswer.objects.filter(question=self.question))
+        self.assertEqual(loaded[0][1]['version'], ANALYSIS_VERSION)
+        self.reference.refresh_from_db()
+        self.assertEqual(self.reference.analysis['version'], ANALYSIS_VERSION)
+
+    def test_grade_answer_uses_reference_analysis(self):
+        """Test grading an identical answer awards full marks"""
+        answer = SubjectiveAnswer(question=self.question, student=self.student, text_answer=REFERENCE_TEXT)
+        marks, feedback, best_reference = grade_answer(answer, ReferenceAnswer.objects.filter(question=self.question))
+        self.assertEqual(marks, 5)
+        self.assertEqual(best_reference, self.reference)
+
+    def test_feedback_lists_covered_key_phrases(self):
+        """Test feedback names the key phrases an answer covered"""
+        self.reference.key_phrases = "green plants\ncarbon dioxide\nlight reaction"
+        self.reference.save()
+        answer = SubjectiveAnswer(question=self.question, student=self.student, text_answer=STUDENT_TEXTS[1])
+        marks, feedback, best_reference = grade_answer(answer, ReferenceAnswer.objects.filter(question=self.question))
+        self.assertIn("Key points covered (1/3): carbon dioxide.", feedback)
+
+
+def expected_marks(student_text, reference_texts):
+    """Marks from the original per-pair grading rules"""
+    best_score, best_keywords = 0.0, set()
+    for reference_text in reference_texts:
+        score = reference_similarity(student_text, reference_text)
+        if score > best_score:
+            best_score, best_keywords = score, extract_keywords(reference_text)
+    tfidf_marks = sum(best_score >= t for t in (0.2, 0.4, 0.6, 0.7, 0.85))
+    matched = len(best_keywords & extract_keywords(student_text))
+    keyword_marks = sum(matched >= t for t in (1, 3, 5, 7, 10))
+    if len(student_text.split()) < 10:
+        tfidf_marks, keyword_marks = min(tfidf_marks, 2), min(keyword_marks, 2)
+    return max(tfidf_marks, keyword_marks)
+
+
+class BatchGradingTest(TestCase):
+    """Test cases for grading a whole question's answers at once"""
+
+    REFERENCE_TEXTS = [
+        REFERENCE_TEXT,
+        "Green plants make glucose from carbon dioxide and water using light energy captured by chlorophyll.",
+    ]
+
+    def setUp(self):
+        """Set up test data"""
+        professor_group = Group.objects.create(name="Professor")
+        self.question = Question_DB.objects.create(
+            professor=User.objects.create(username='prof_a'),
+            question="Explain photosynthesis.",
+            question_type="SUBJECTIVE"
+        )
+        for index, text in enumerate(self.REFERENCE_TEXTS):
+            professor = User.objects.create(username=f'prof_{index}')
+            professor.groups.add(professor_group)
+            ReferenceAnswer.objects.create(question=self.question, professor=professor, text_answer=text)
+        self.answers = [
+            SubjectiveAnswer(
+                question=self.question,
+                student=User.objects.create(username=f'student_{index}'),
+                text_answer=text
+            )
+            for index, text in enumerate(STUDENT_TEXTS)
+        ]
+
+    def test_similarity_matrix_matches_pairwise_scores(self):
+        """Test every cell of the batch matrix equals the pairwise TF-IDF score"""
+        student_analyses = [compile_text_analysis(text) for text in STUDENT_TEXTS]
+        reference_analyses = [compile_text_analysis(text) for text in self.REFERENCE_TEXTS]
+        matrix = pairwise_similarity_matrix(student_analyses, reference_analyses)
+        self.assertEqual(matrix.shape, (len(STUDENT_TEXTS), len(self.REFERENCE_TEXTS)))
+        for i, student_text in enumerate(STUDENT_TEXTS):
+            for j, reference_text in enumerate(self.REFERENCE_TEXTS):
+                self.assertAlmostEqual(matrix[i, j], calculate_similarity_score(student_text, reference_text), places=9)
+
+    def test_batch_marks_match_original_rules(self):
+        """Test batch marks follow the original per-pair grading rules"""
+        results = grade_answers_batch(self.question, self.answers)
+        for answer, (marks, feedback, best_reference) in zip(self.answers, results):
+            if not answer.text_answer:
+                self.assertEqual((marks, feedback, best_reference), (0, "No text content found in answer", None))
+                continue
+            with self.subTest(answer=answer.text_answer[:30]):
+                self.assertEqual(marks, expected_marks(answer.text_answer, self.REFERENCE_TEXTS))
+
+    def test_batch_matches_single_grading(self):
+        """Test grading in a batch gives the same result as grading one by one"""
+        references = ReferenceAnswer.objects.filter(question=self.question)
+        batch = grade_answers_batch(self.question, self.answers)
+        single = [grade_answer(answer, references) for answer in self.answers]
+        self.assertEqual(batch, single)
+
+    def test_batch_without_references(self):
+        """Test answers to a question without references score zero"""
+        results = grade_answers_batch(self.question, self.answers[:1], reference_answers=[])
+        self.assertEqual(results[0][0], 0)
+        self.assertIsNone(results[0][2])
+
+
+class SimilarityBackendTest(TestCase):
+    """Test cases for the pluggable similarity backends"""
+
+    def setUp(self):
+        """Set up test data"""
+        professor = User.objects.create(username='test_professor')
+        self.question = Question_DB.objects.create(
+            professor=professor,
+            question="Explain photosynthesis.",
+            question_type="SUBJECTIVE"
+        )
+        self.reference = ReferenceAnswer.objects.create(question=self.question, professor=professor, text_answer=REFERENCE_TEXT)
+        self.entries = load_reference_analyses([self.reference])
+
+    def test_builtin_backends_are_registered(self):
+        """Test every built-in backend is available by name"""
+        self.assertEqual(available_backends(), ['bm25', 'char_ngram', 'minhash', 'tfidf'])
+
+    def test_model_choices_follow_the_registry(self):
+        """Test question and exam backend choices are the registered backends plus the blank default"""
+        for model in (Question_DB, Exam_Model):
+            with self.subTest(model=model.__name__):
+                choices = model._meta.get_field('similarity_backend').choices
+                self.assertEqual(choices[0], ('', 'Default'))
+                self.assertEqual([name for name, _ in choices[1:]], available_backends())
+                self.assertEqual(dict(choices)['bm25'], get_backend('bm25').label)
+
+    def test_backends_rank_identical_answer_highest(self):
+        """Test each backend scores the reference itself 1 and an unrelated answer lower"""
+        texts = [REFERENCE_TEXT, STUDENT_TEXTS[1], STUDENT_TEXTS[3]]
+        analyses = [compile_text_analysis(text) for text in texts]
+        for name in available_backends():
+            with self.subTest(backend=name):
+                similarity = get_backend(name).similarity_matrix(texts, analyses, self.entries)
+                self.assertEqual(similarity.shape, (3, 1))
+                self.assertAlmostEqual(similarity[0, 0], 1.0, places=6)
+                self.assertGreater(similarity[1, 0], similarity[2, 0])
+                self.assertTrue(((similarity >= 0) & (similarity <= 1)).all())
+
+    def test_question_choice_overrides_exam(self):
+        """Test the question's backend wins over the exam's, which wins over the default"""
+        exam = Exam_Model(similarity_backend='minhash')
+        self.assertEqual(resolve_backend_name(self.question, exam), 'minhash')
+        self.question.similarity_backend = 'bm25'
+        self.assertEqual(resolve_backend_name(self.question, exam), 'bm25')
+        self.question.similarity_backend = 'unknown'
+        self.assertEqual(resolve_backend_name(self.question, exam), 'tfidf')
+
+    def test_backend_is_part_of_cache_key(self):
+        """Test switching backend does not reuse grades cached by another backend"""
+        answer = SubjectiveAnswer(question=self.question, student=User.objects.create(username='s'), text_answer=STUDENT_TEXTS[1])
+        grade_answers_batch(self.question, [answer], backend='tfidf')
+        before = grading_cache_stats()
+        grade_answers_batch(self.question, [answer], backend='char_ngram')
+        self.assertEqual(grading_cache_stats()['misses'], before['misses'] + 1)
+
+
+class CohortStatisticsTest(TestCase):
+    """Test cases for incremental per-question document frequencies"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.question = Question_DB.objects.create(
+            professor=User.objects.create(username='test_professor'),
+            question="Explain photosynthesis.",
+            question_type="SUBJECTIVE"
+        )
+
+    def submit(self, username, text):
+        return SubjectiveAnswer.objects.create(
+            question=self.question,
+            student=User.objects.create(username=username),
+            text_answer=text
+        )
+
+    def test_answers_update_document_frequency(self):
+        """Test each saved answer increments the frequencies of its terms once"""
+        self.submit('student_a', "plants need light light")
+        self.submit('student_b', "plants need water")
+        stats = QuestionCorpusStats.objects.get(question=self.question)
+        self.assertEqual(stats.document_count, 2)
+        self.assertEqual(stats.document_frequency['plant'], 2)
+        self.assertEqual(stats.document_frequency['light'], 1)
+
+    def test_edited_answer_moves_its_terms(self):
+        """Test editing an answer removes old terms and adds new ones"""
+        answer = self.submit('student_a', "plants need light")
+        answer.text_answer = "animals need water"
+        answer.save()
+        stats = QuestionCorpusStats.objects.get(question=self.question)
+        self.assertEqual(stats.document_count, 1)
+        self.assertNotIn('plant', stats.document_frequency)
+        self.assertEqual(stats.document_frequency['anim'], 1)
+
+    def test_deleted_answers_release_their_terms(self):
+        """Test deleting answers, one by one or in bulk, decrements their terms"""
+        first = self.submit('student_a', "plants need light")
+        self.submit('student_b', "plants need water")
+        self.submit('student_c', "animals need water")
+        first.delete()
+        stats = QuestionCorpusStats.objects.get(question=self.question)
+        self.assertEqual(stats.document_count, 2)
+        self.assertEqual(stats.document_frequency['plant'], 1)
+        self.assertNotIn('light', stats.document_frequency)
+
+        SubjectiveAnswer.objects.filter(question=self.question).delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.document_count, stats.document_frequency), (0, {}))
+
+    def test_saves_without_text_changes_skip_statistics(self):
+        """Test grading an answer writes only the answer row"""
+        answer = SubjectiveAnswer.objects.get(pk=self.submit('student_a', "plants need light").pk)
+        answer.marks = 4
+        answer.feedback = "Good"
+        with self.assertNumQueries(1):
+            answer.save()
+
+    def test_rebuild_matches_incremental(self):
+        """Test the rebuild command produces the same table as incremental updates"""
+        for index, text in enumerate(STUDENT_TEXTS):
+            self.submit(f'student_{index}', text)
+        incremental = QuestionCorpusStats.objects.get(question=self.question)
+        QuestionCorpusStats.objects.all().delete()
+        call_command('rebuild_corpus_stats', stdout=StringIO())
+        rebuilt = QuestionCorpusStats.objects.get(question=self.question)
+        self.assertEqual(rebuilt.document_count, incremental.document_count)
+        self.assertEqual(rebuilt.document_frequency, incremental.document_frequency)
+
+    def test_cohort_idf_matches_refit_vectorizer(self):
+        """Test cohort similarity equals a TF-IDF fit on the cohort's answers"""
+        for index, text in enumerate(STUDENT_TEXTS[:4]):
+            self.submit(f'student_{index}', text)
+        stats = QuestionCorpusStats.objects.get(question=self.question)
+        matrix, vocabulary = build_tfidf_matrix(STUDENT_TEXTS[:4])
+        expected = sparse_cosine_similarity(matrix[1:2], matrix[0:1])[0, 0]
+        scores = cohort_similarity_matrix(
+            [compile_text_analysis(STUDENT_TEXTS[1])], [compile_text_analysis(STUDENT_TEXTS[0])], stats
+        )
+        self.assertAlmostEqual(scores[0, 0], expected, places=9)
+
+
+class GradingCacheTest(TestCase):
+    """Test cases for the content-addressed grading result cache"""
+
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        professor = User.objects.create(username='test_professor')
+        self.question = Question_DB.objects.create(
+            professor=professor,
+            question="Explain photosynthesis.",
+            question_type="SUBJECTIVE"
+        )
+        self.reference = ReferenceAnswer.objects.create(
+            question=self.question,
+            professor=professor,
+            text_answer=REFERENCE_TEXT
+        )
+        self.answer = SubjectiveAnswer(
+            question=self.question,
+            student=User.objects.create(username='test_student'),
+            text_answer=STUDENT_TEXTS[1]
+        )
+
+    def test_repeat_grading_hits_cache(self):
+        """Test grading the same text again is served from the cache"""
+        first = grade_answers_batch(self.question, [self.answer])
+        before = grading_cache_stats()
+        self.answer.text_answer = "  " + STUDENT_TEXTS[1].upper() + "  "
+        second = grade_answers_batch(self.question, [self.answer])
+        after = grading_cache_stats()
+        self.assertEqual(first, second)
+        self.assertEqual(after['hits'], before['hits'] + 1)
+        self.assertEqual(after['misses'], before['misses'])
+
+    def test_reference_change_invalidates_cache(self):
+        """Test editing the reference answer forces a fresh grade"""
+        grade_answers_batch(self.question, [self.answer])
+        self.reference.text_answer = "The mitochondria is the powerhouse of the cell."
+        self.reference.save()
+        before = grading_cache_stats()
+        grade_answers_batch(self.question, [self.answer])
+        self.assertEqual(grading_cache_stats()['misses'], before['misses'] + 1)
+
+
+    @override_settings(REFERENCE_ANALYSIS_ASYNC=True)
+    def test_pending_reference_is_graded_against_its_new_text(self):
+        """Test grades follow a reference edit while its analysis is pending and after it lands"""
+        old_marks = grade_answers_batch(self.question, [self.answer])[0][0]
+        self.reference.text_answer = "The mitochondria is the powerhouse of the cell."
+        self.reference.save()
+        self.reference.refresh_from_db()
+        self.assertEqual(self.reference.analysis_status, ReferenceAnswer.ANALYSIS_PENDING)
+        expected = expected_marks(STUDENT_TEXTS[1], [self.reference.text_answer])
+        self.assertNotEqual(old_marks, expected)
+
+        pending_marks = grade_answers_batch(self.question, [self.answer])[0][0]
+        self.assertEqual(pending_marks, expected)
+
+        run_reference_analysis(self.reference.pk)
+        self.reference.refresh_from_db()
+        self.assertEqual(self.reference.analysis_status, ReferenceAnswer.ANALYSIS_READY)
+        before = grading_cache_stats()
+        self.assertEqual(grade_answers_batch(self.question, [self.answer])[0][0], expected)
+        self.assertEqual(grading_cache_stats()['misses'], before['misses'] + 1)
+
+
+class GradeExamCommandTest(TestCase):
+    """Test cases for the grade_exam management command"""
+
+    def setUp(self):
+        """Set up test data"""
+        professor = User.objects.create(username='test_professor')
+        self.question = Question_DB.objects.create(
+            professor=professor,
+            question="Explain photosynthesis.",
+            question_type="SUBJECTIVE"
+        )
+        ReferenceAnswer.objects.create(question=self.question, professor=professor, text_answer=REFERENCE_TEXT)
+        paper = Question_Paper.objects.create(professor=professor, qPaperTitle="Biology")
+        paper.questions.add(self.question)
+        group = Special_Students.objects.create(professor=professor, category_name="Class A")
+        self.exam = Exam_Model.objects.create(
+            professor=professor, name="Biology Midterm", total_marks=5, duration=30, question_paper=paper
+        )
+        self.exam.student_group.add(group)
+        self.answers = []
+        for index, text in enumerate(STUDENT_TEXTS[:3]):
+            student = User.objects.create(username=f'student_{index}')
+            group.students.add(student)
+            self.answers.append(SubjectiveAnswer.objects.create(question=self.question, student=student, text_answer=text))
+        self.stu_exam = StuExam_DB.objects.create(student=self.answers[0].student, examname="Biology Midterm", qpaper=paper, completed=1)
+        self.stu_exam.questions.add(Stu_Question.objects.create(
+            question=self.question.question, student=self.answers[0].student, original_question=self.question
+        ))
+        self.teacher_graded = self.answers[2]
+        self.teacher_graded.is_teacher_graded = True
+        self.teacher_graded.marks = 1
+        self.teacher_graded.save()
+
+    def test_grades_and_writes_marks(self):
+        """Test answers are graded and saved, leaving teacher-graded ones alone"""
+        out = StringIO()
+        call_command('grade_exam', 'Biology Midterm', '--workers', '1', stdout=out)
+        self.assertIn('answers/s', out.getvalue())
+        self.answers[0].refresh_from_db()
+        self.assertEqual(self.answers[0].marks, 5)
+        self.assertTrue(self.answers[0].is_auto_graded)
+        self.teacher_graded.refresh_from_db()
+        self.assertEqual(self.teacher_graded.marks, 1)
+        self.assertFalse(self.teacher_graded.is_auto_graded)
+        self.stu_exam.refresh_from_db()
+        self.assertEqual(self.stu_exam.score, 5)
+        result = ExamResults.objects.get(exam=self.exam, student=self.answers[0].student)
+        self.assertEqual((result.total_score, result.questions_attempted, result.questions_correct), (5, 1, 1))
+        self.assertTrue(result.is_graded)
+
+    def test_benchmark_graders_reports_every_backend(self):
+        """Test the backend benchmark scores teacher-graded answers for each backend"""
+        out = StringIO()
+        call_command('benchmark_graders', '--repeat', '1', stdout=out)
+        for name in available_backends():
+            self.assertIn(name, out.getvalue())
+        self.assertIn('1 teacher-graded answers', out.getvalue())
+
+    def test_dry_run_writes_nothing(self):
+        """Test dry-run mode reports without saving marks"""
+        call_command('grade_exam', 'Biology Midterm', '--workers', '1', '--dry-run', stdout=StringIO())
+        self.answers[0].refresh_from_db()
+        self.assertEqual(self.answers[0].marks, 0)
+        self.assertFalse(self.answers[0].is_auto_graded)
+
+
+class GradingQueueTest(TestCase):
+    """Test cases for the background OCR/grading job queue"""
+
+    def setUp(self):
+        """Set up test data"""
+        professor = User.objects.create(username='test_professor')
+        self.question = Question_DB.objects.create(
+            professor=professor,
+            question="Explain photosynthesis.",
+            question_type="SUBJECTIVE"
+        )
+        ReferenceAnswer.objects.create(question=self.question, professor=professor, text_answer=REFERENCE_TEXT)
+        paper = Question_Paper.objects.create(professor=professor, qPaperTitle="Biology")
+        paper.questions.add(self.question)
+        Exam_Model.objects.create(
+            professor=professor, name="Biology Midterm", total_marks=5, duration=30, question_paper=paper
+        )
+        student = User.objects.create(username='test_student')
+        self.stu_exam = StuExam_DB.objects.create(student=student, examname="Biology Midterm", qpaper=paper, completed=1)
+        self.stu_exam.questions.add(Stu_Question.objects.create(
+            question=self.question.question, student=student, original_question=self.question
+        ))
+        self.answer = SubjectiveAnswer.objects.create(question=self.question, student=student, text_answer=REFERENCE_TEXT)
+
+    def test_worker_grades_and_finalizes_exam(self):
+        """Test draining the queue grades the answer and finalizes the exam results"""
+        enqueue_exam_grading(self.stu_exam, [self.answer])
+        self.assertFalse(StuExam_DB.objects.get(pk=self.stu_exam.pk).is_graded)
+        call_command('run_grading_worker', '--once', stdout=StringIO())
+        self.answer.refresh_from_db()
+        self.assertEqual(self.answer.marks, 5)
+        self.assertEqual(GradingJob.objects.get().status, GradingJob.STATUS_DONE)
+        stu_exam = StuExam_DB.objects.get(pk=self.stu_exam.pk)
+        self.assertTrue(stu_exam.is_graded)
+        self.assertEqual(stu_exam.score, 5)
+        self.assertTrue(ExamResults.objects.get(student_exam=stu_exam).is_graded)
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        """Test a leased job is invisible to other workers until the lease expires"""
+        enqueue_exam_grading(self.stu_exam, [self.answer])
+        self.assertEqual(len(claim_jobs('worker-a', 10)), 1)
+        self.assertEqual(claim_jobs('worker-b', 10), [])
+
+    def test_expired_lease_is_reclaimed(self):
+        """Test a job whose worker died is picked up again"""
+        enqueue_exam_grading(self.stu_exam, [self.answer])
+        claim_jobs('worker-a', 10, lease_seconds=-1)
+        reclaimed = claim_jobs('worker-b', 10)
+        self.assertEqual(len(reclaimed), 1)
+        self.assertEqual(reclaimed[0].attempts, 2)
@@ -1,6 +1,5 @@
 import cv2
 import numpy as np
-import pytesseract
 from PIL import Image
 import io
 import os
@@ -12,222 +11,388 @@ from scipy.sparse import csr_matrix
 import json
 import re
 from main.models.reference_answer import ReferenceAnswer
-from student.models import SubjectiveAnswer
+from student.models import SubjectiveAnswer, QuestionCorpusStats, ExamResults
+from django.utils import timezone
+from django.db import transaction
 from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
 from nltk.stem import PorterStemmer
 import math
+import hashlib
+import time
+import threading
 from collections import Counter
+from functools import lru_cache
+from django.core.cache import caches
+from student.grading import get_backend, resolve_backend_name
+from student.ocr_service import (
+    OCRServiceBusy,
+    OCRServiceUnavailable,
+    ocr_service_socket,
+    recognize_via_service,
+    recognize_via_service_waiting,
+)
+from student.ocr import (
+    OCR_IMAGE_DEADLINE_SECONDS,
+    apply_preprocessing,
+    feature_bucket,
+    image_features,
+    OCR_PDF_MAX_PAGES,
+    get_cached_ocr,
+    image_pixel_hash,
+    is_confident,
+    is_pdf,
+    iter_pdf_pages,
+    normalize_for_ocr,
+    ordered_preprocessing,
+    pdf_page_count,
+    pdf_support_available,
+    recognize_page,
+    record_preprocessing_outcome,
+    result_quality,
+    store_ocr_result,
+)
+from student.grading.tfidf import (
+    PAIR_UNIQUE_TERM_IDF,
+    cohort_similarity_matrix,
+    pairwise_similarity_matrix,
+    sparse_cosine_similarity,
+)
 
 logger = logging.getLogger(__name__)
 
-# Configure pytesseract to use the correct Tesseract path on Windows
-if os.name == 'nt':  # Windows
-    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+# Upper bound on distinct words kept in the process-wide stem cache
+STEM_CACHE_SIZE = getattr(settings, 'GRADING_STEM_CACHE_SIZE', 50000)
 
-def preprocess_image(image_path):
+# Questions with fewer counted answers fall back to pairwise IDF
+COHORT_MIN_DOCUMENTS = getattr(settings, 'GRADING_COHORT_MIN_DOCUMENTS', 5)
+
+# Cache holding grading results keyed by answer text and grading inputs
+GRADING_CACHE_ALIAS = getattr(settings, 'GRADING_CACHE_ALIAS', 'default')
+GRADING_CACHE_TIMEOUT = getattr(settings, 'GRADING_CACHE_TIMEOUT', 7 * 24 * 60 * 60)
+
+# Upper bound on compiled reference keyword automata kept per process
+AUTOMATON_CACHE_SIZE = getattr(settings, 'GRADING_AUTOMATON_CACHE_SIZE', 1024)
+
+_stemmer = PorterStemmer()
+
+def decode_image(image_file):
+    """
+    Decode an uploaded image once into an RGB NumPy array. The same buffer
+    is hashed, preprocessed with OpenCV and handed to Tesseract, so the
+    upload is never written to disk or re-encoded.
+    """
+    pil_image = Image.open(image_file)
+    logger.debug(f"Decoding {pil_image.format} image, mode {pil_image.mode}, size {pil_image.size}")
+    return _rgb_pixels(pil_image)
+
+def _rgb_pixels(pil_image):
+    # Convert to RGB if necessary
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+    return np.asarray(pil_image)
+
+# Upload limits checked on the image header, before any pixel data is decoded
+IMAGE_MAX_BYTES = 5 * 1024 * 1024  # 5MB
+IMAGE_MAX_DIMENSION = 4000
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
+# MPO is the multi-picture JPEG many phone cameras write to .jpg files
+IMAGE_FORMATS = {'JPEG', 'MPO', 'PNG', 'GIF', 'BMP'}
+
+class IngestedImage:
     """
-    Preprocess image for better OCR results
+    An upload that passed validation, decoded at most once. Carries the
+    file (to store on the answer), its metadata and, when decoded, the RGB
+    pixel buffer and its hash, so OCR neither reopens nor rehashes it.
+    PDF answers keep only the file; OCR rasterizes them page by page.
     """
+
+    def __init__(self, file, image_format, width=None, height=None, pixels=None):
+        self.file = file
+        self.name = file.name
+        self.size = file.size
+        self.format = image_format
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+        self._pixel_hash = None
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def is_pdf(self):
+        return self.format == 'PDF'
+
+    @property
+    def pixel_hash(self):
+        if self._pixel_hash is None and self.pixels is not None:
+            self._pixel_hash = image_pixel_hash(self.pixels)
+        return self._pixel_hash
+
+def ingest_image(image_file, decode=True):
+    """
+    Validate an uploaded image (or multi-page PDF answer) for security and
+    format and, with decode, decode its pixels in the same pass. Size,
+    format and dimensions are checked on the opened header before the
+    pixel data is read; decoding then doubles as the integrity check.
+    Without decode (OCR runs later elsewhere) the file is only verified.
+    Returns: (IngestedImage, None) or (None, error message)
+    """
+    if isinstance(image_file, IngestedImage):
+        return image_file, None
     try:
-        # Read image using opencv
-        img = cv2.imread(image_path)
+        file_extension = os.path.splitext(image_file.name)[1].lower()
+        if file_extension == '.pdf':
+            is_valid, error_msg = validate_pdf_file(image_file)
+            if not is_valid:
+                return None, error_msg
+            image_file.seek(0)
+            return IngestedImage(image_file, 'PDF'), None
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if image_file.size > IMAGE_MAX_BYTES:
+            return None, "File size too large. Maximum size is 5MB."
         
-        # Apply thresholding to preprocess the image
-        gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+        if file_extension not in IMAGE_EXTENSIONS:
+            return None, "Invalid file type. Only JPG, JPEG, PNG, GIF, BMP and PDF files are allowed."
         
-        # Apply dilation to connect text components
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3,3))
-        gray = cv2.dilate(gray, kernel, iterations=1)
+        # Check filename for security (no path traversal)
+        if '..' in image_file.name or '/' in image_file.name or '\\' in image_file.name:
+            return None, "Invalid filename. Please use a simple filename without special characters."
         
-        # Apply median blur to remove noise
-        gray = cv2.medianBlur(gray, 3)
+        try:
+            image_file.seek(0)
+            image = Image.open(image_file)
+            if image.format not in IMAGE_FORMATS:
+                return None, "Invalid image file. Please upload a valid image."
+            # Reject oversized images before allocating their pixels
+            if image.width > IMAGE_MAX_DIMENSION or image.height > IMAGE_MAX_DIMENSION:
+                return None, "Image dimensions too large. Maximum dimensions are 4000x4000 pixels."
+            pixels = _rgb_pixels(image) if decode else None
+            if not decode:
+                image.verify()
+        except Exception as e:
+            return None, "Invalid image file. Please upload a valid image."
+        finally:
+            image_file.seek(0)
+        
+        return IngestedImage(image_file, image.format, image.width, image.height, pixels), None
         
-        return gray
+    except Exception as e:
+        logger.error(f"Error validating image file: {e}")
+        return None, "Error validating image file"
+
+def file_sha256(file):
+    """SHA-256 of an uploaded or stored file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+def text_sha256(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+def _to_grayscale(image):
+    """Grayscale from an RGB array (as decoded by decode_image) or an image path read with OpenCV"""
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            return image
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    img = cv2.imread(image)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+def preprocess_image(image):
+    """
+    Preprocess image for better OCR results (Otsu binarization).
+    Accepts an RGB array from decode_image or an image path.
+    """
+    try:
+        return apply_preprocessing('otsu', _to_grayscale(image))
     except Exception as e:
         logger.error(f"Error preprocessing image: {e}")
         return None
 
-def preprocess_camscanner_image(image_path):
+def preprocess_camscanner_image(image):
     """
-    Preprocess CamScanner images for better OCR results
+    Preprocess CamScanner images for better OCR results.
+    Accepts an RGB array from decode_image or an image path.
     """
     try:
-        # Read image using opencv
-        img = cv2.imread(image_path)
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Apply adaptive thresholding (better for CamScanner images)
-        gray = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-        
-        # Apply morphological operations to clean up
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-        gray = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
-        
-        # Apply slight blur to reduce noise
-        gray = cv2.GaussianBlur(gray, (1, 1), 0)
-        
-        return gray
+        return apply_preprocessing('camscanner', _to_grayscale(image))
     except Exception as e:
         logger.error(f"Error preprocessing CamScanner image: {e}")
         return None
 
-def extract_text_from_image(image_file):
+def extract_text_from_image(image_file, source='upload', on_busy='local'):
     """
-    Extract text from uploaded image using OCR
+    Extract text from uploaded image using OCR. With OCR_SERVICE_SOCKET set
+    the upload is OCR'd by the run_ocr_service daemon; when that is down the
+    OCR runs here. When the service is busy, on_busy decides: 'local' OCRs
+    here anyway, 'wait' retries until the service has room and 'raise'
+    raises OCRServiceBusy for the caller to turn away the request.
+    """
+    if ocr_service_socket():
+        # The service gets the encoded upload, far smaller than decoded pixels
+        upload = image_file.file if isinstance(image_file, IngestedImage) else image_file
+        try:
+            if on_busy == 'wait':
+                return recognize_via_service_waiting(upload, source)
+            return recognize_via_service(upload, source)
+        except OCRServiceBusy:
+            if on_busy != 'local':
+                raise
+            logger.warning(f"OCR service busy, running OCR for {image_file.name} in this process")
+        except OCRServiceUnavailable as e:
+            logger.error(f"{e}; running OCR in this process")
+    return extract_text_locally(image_file, source)
+
+def extract_text_locally(image_file, source='upload'):
+    """
+    Extract text from uploaded image using OCR in this process.
+    Configs are tried in the order they have won before for this source
+    (e.g. 'subjective_answer', 'reference_answer') and the search stops at
+    the first result with confident, dense text. Pages holding several text
+    blocks are first OCR'd block by block in parallel. PDF uploads are read
+    page by page. An IngestedImage is OCR'd from its decoded pixels.
     """
     try:
-        print(f"extract_text_from_image called with: {image_file}")
-        print(f"  - File name: {image_file.name}")
-        print(f"  - File size: {image_file.size}")
-        
-        # Save uploaded file temporarily
-        temp_path = os.path.join(settings.MEDIA_ROOT, 'temp_ocr_image.jpg')
-        print(f"  - Temp path: {temp_path}")
-        
-        # Convert uploaded file to PIL Image
-        pil_image = Image.open(image_file)
-        print(f"  - PIL Image mode: {pil_image.mode}")
-        print(f"  - PIL Image size: {pil_image.size}")
-        
-        # Convert to RGB if necessary
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-            print(f"  - Converted to RGB")
-        
-        # Save temporarily
-        pil_image.save(temp_path)
-        print(f"  - Saved to temp file")
+        logger.debug(f"Extracting text from {image_file.name} ({image_file.size} bytes, source {source})")
         
-        # Try multiple OCR configurations for better results
-        ocr_configs = [
-            '--psm 6',  # Assume uniform block of text
-            '--psm 8',  # Single word
-            '--psm 13', # Raw line
-            '--psm 6 --oem 3',  # Default OCR Engine Mode
-            '--psm 8 --oem 3',  # Single word with default engine
-        ]
-        
-        best_text = ""
-        best_config = ""
-        
-        for config in ocr_configs:
-            try:
-                print(f"  - Trying OCR config: {config}")
-                text = pytesseract.image_to_string(pil_image, config=config)
-                text = text.strip()
-                
-                print(f"  - OCR result with {config}: '{text[:100]}...'")
-                
-                # Choose the result with the most text (likely the best)
-                if len(text) > len(best_text):
-                    best_text = text
-                    best_config = config
-                    
-            except Exception as e:
-                print(f"  - OCR failed with {config}: {e}")
-                continue
-        
-        # Clean up temporary file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-            print(f"  - Temp file cleaned up")
-        
-        if best_text:
-            # Clean extracted text
-            best_text = '\n'.join([line.strip() for line in best_text.split('\n') if line.strip()])
-            print(f"  - Best OCR result (config: {best_config}): '{best_text[:100]}...'")
-            return best_text, None
+        pixel_hash = None
+        if isinstance(image_file, IngestedImage):
+            if image_file.is_pdf:
+                return extract_text_from_pdf(image_file.file, source)
+            pixels = image_file.pixels
+            if pixels is None:
+                pixels = decode_image(image_file.file)
+            else:
+                pixel_hash = image_file.pixel_hash
+        elif is_pdf(image_file):
+            return extract_text_from_pdf(image_file, source)
         else:
-            print(f"  - No text extracted with regular OCR, trying CamScanner preprocessing...")
-            # Try with CamScanner preprocessing
-            processed_img = preprocess_camscanner_image(temp_path)
-            
-            if processed_img is not None:
-                print(f"  - CamScanner preprocessing successful")
-                # Try OCR with preprocessed image
-                for config in ocr_configs:
-                    try:
-                        print(f"  - Trying preprocessed OCR config: {config}")
-                        text = pytesseract.image_to_string(processed_img, config=config)
-                        text = text.strip()
-                        
-                        print(f"  - Preprocessed OCR result with {config}: '{text[:100]}...'")
-                        
-                        if len(text) > len(best_text):
-                            best_text = text
-                            best_config = f"preprocessed_{config}"
-                            
-                    except Exception as e:
-                        print(f"  - Preprocessed OCR failed with {config}: {e}")
-                        continue
-                
-                if best_text:
-                    best_text = '\n'.join([line.strip() for line in best_text.split('\n') if line.strip()])
-                    print(f"  - Best preprocessed OCR result (config: {best_config}): '{best_text[:100]}...'")
-                    return best_text, None
-            
-            print(f"  - No text extracted with any OCR configuration")
+            # Decode once; every later stage works on this in-memory array
+            pixels = decode_image(image_file)
+        text = ocr_page_pixels(pixels, source, pixel_hash)
+        if text is None:
+            logger.warning(f"No text extracted from {image_file.name} with any OCR configuration")
             return None, "OCR failed to extract any text from the image"
+        return text, None
         
     except Exception as e:
-        print(f"  - Exception in extract_text_from_image: {e}")
         logger.error(f"Error extracting text from image: {e}")
-        # Clean up temporary file if it exists
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.remove(temp_path)
         return None, str(e)
 
+def extract_text_from_pdf(pdf_file, source='upload'):
+    """
+    OCR a multi-page PDF as a stream: each page is rasterized only when the
+    previous one is done, and the page texts are joined with blank lines.
+    Returns: (text, error)
+    """
+    page_texts = []
+    for number, pixels in enumerate(iter_pdf_pages(pdf_file), start=1):
+        logger.debug(f"PDF page {number}: {pixels.shape[1]}x{pixels.shape[0]}")
+        text = ocr_page_pixels(pixels, source)
+        if text:
+            page_texts.append(text)
+    if not page_texts:
+        logger.warning("No text extracted from any PDF page")
+        return None, "OCR failed to extract any text from the PDF"
+    return '\n\n'.join(page_texts), None
+
+def ocr_page_pixels(pixels, source='upload', pixel_hash=None, use_cache=True):
+    """
+    OCR one decoded page (RGB array), reusing cached text for identical
+    pixels and caching new results (unless use_cache is off, as when
+    benchmarking the pipeline itself).
+    Returns: cleaned text, or None when nothing was recognized
+    """
+    # Identical pixels were OCR'd before: reuse the text without running Tesseract
+    if use_cache:
+        if pixel_hash is None:
+            pixel_hash = image_pixel_hash(pixels)
+        cached = get_cached_ocr(pixel_hash)
+        if cached is not None:
+            logger.debug(f"OCR cache hit ({pixel_hash[:12]}, config: {cached.config})")
+            return cached.text
+    
+    # Grayscale once, crop empty margins and scale letters to the size Tesseract reads best
+    gray = normalize_for_ocr(pixels)
+    logger.debug(f"Normalized for OCR: {pixels.shape[1]}x{pixels.shape[0]} -> {gray.shape[1]}x{gray.shape[0]}")
+    
+    # Try the preprocessing most likely to succeed on pages like this one first
+    features = image_features(gray)
+    bucket = feature_bucket(features)
+    pipelines = ordered_preprocessing(source, bucket)
+    logger.debug(f"Page features {bucket} (contrast {features.contrast:.2f}, uniformity {features.uniformity:.2f}, "
+                 f"skew {features.skew:.1f}, noise {features.noise:.3f}), preprocessing order: {pipelines}")
+    
+    # One deadline covers every OCR attempt on this page
+    deadline = time.monotonic() + OCR_IMAGE_DEADLINE_SECONDS
+    best = None
+    for preprocessing in pipelines:
+        if time.monotonic() >= deadline:
+            break
+        image = gray if preprocessing == 'none' else apply_preprocessing(preprocessing, gray)
+        result = recognize_page(image, source, preprocessing, deadline)
+        record_preprocessing_outcome(source, bucket, preprocessing, result is not None and is_confident(result))
+        if result is not None and preprocessing != 'none':
+            result = result._replace(config=f"preprocessed_{preprocessing}_{result.config}")
+        if result is not None and (best is None or result_quality(result) > result_quality(best)):
+            best = result
+        if best is not None and is_confident(best):
+            break
+        logger.debug(f"No confident text with '{preprocessing}' preprocessing")
+    
+    if best is None:
+        return None
+    
+    # Clean extracted text
+    best_text = '\n'.join([line.strip() for line in best.text.split('\n') if line.strip()])
+    logger.debug(f"Best OCR result (config: {best.config}, confidence {best.mean_confidence:.0f}): '{best_text[:100]}...'")
+    if use_cache:
+        store_ocr_result(pixel_hash, best._replace(text=best_text))
+    return best_text
+
 def validate_image_file(image_file):
     """
-    Validate uploaded image file for security and format
+    Validate uploaded image file (or multi-page PDF answer) for security and
+    format without decoding its pixels; use ingest_image when the upload is
+    OCR'd right away
+    """
+    ingested, error_msg = ingest_image(image_file, decode=False)
+    return ingested is not None, error_msg
+
+def validate_pdf_file(pdf_file):
+    """
+    Validate an uploaded multi-page PDF answer: size, filename, PDF header
+    and page count
     """
     try:
-        # Check file size (5MB limit)
-        max_size = 5 * 1024 * 1024  # 5MB in bytes
-        if image_file.size > max_size:
-            return False, "File size too large. Maximum size is 5MB."
+        max_size = 20 * 1024 * 1024  # 20MB in bytes
+        if pdf_file.size > max_size:
+            return False, "File size too large. Maximum size for PDF files is 20MB."
         
-        # Check file extension
-        allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
-        file_extension = os.path.splitext(image_file.name)[1].lower()
-        if file_extension not in allowed_extensions:
-            return False, "Invalid file type. Only JPG, JPEG, PNG, GIF, and BMP files are allowed."
-        
-        # Check filename for security (no path traversal)
-        if '..' in image_file.name or '/' in image_file.name or '\\' in image_file.name:
+        if '..' in pdf_file.name or '/' in pdf_file.name or '\\' in pdf_file.name:
             return False, "Invalid filename. Please use a simple filename without special characters."
         
-        # Try to open the image with PIL to validate it's a real image
+        if not is_pdf(pdf_file):
+            return False, "Invalid PDF file. Please upload a valid PDF."
+        
+        if not pdf_support_available():
+            return False, "PDF answers are not supported on this server. Please upload images instead."
+        
         try:
-            from PIL import Image
-            image = Image.open(image_file)
-            image.verify()  # Verify it's a valid image
-            
-            # Reset file pointer after verification
-            image_file.seek(0)
-            
-            # Check image dimensions (prevent extremely large images)
-            image_file.seek(0)
-            img = Image.open(image_file)
-            if img.width > 4000 or img.height > 4000:
-                return False, "Image dimensions too large. Maximum dimensions are 4000x4000 pixels."
-            
-            # Reset file pointer again
-            image_file.seek(0)
-            
+            page_count = pdf_page_count(pdf_file)
         except Exception as e:
-            return False, "Invalid image file. Please upload a valid image."
+            return False, "Invalid PDF file. Please upload a valid PDF."
+        if page_count > OCR_PDF_MAX_PAGES:
+            return False, f"Too many pages. PDF answers may have at most {OCR_PDF_MAX_PAGES} pages."
         
         return True, None
         
     except Exception as e:
-        logger.error(f"Error validating image file: {e}")
-        return False, "Error validating image file"
+        logger.error(f"Error validating PDF file: {e}")
+        return False, "Error validating PDF file"
 
 def preprocess_text_for_tfidf(text):
     """
@@ -302,15 +467,47 @@ def generate_tfidf_vector(text):
         logger.error(f"Error generating TF-IDF vector: {e}")
         return None
 
-def preprocess_text(text, ngram_range=(1,2)):
-    # Lowercase, remove punctuation, split into words, remove stopwords, apply stemming
-    ps = PorterStemmer()
-    tokens = re.findall(r'\b\w+\b', text.lower())
-    tokens = [ps.stem(t) for t in tokens if t not in ENGLISH_STOP_WORDS]
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem_word(word):
+    """
+    Stem a single lowercase word. Results are kept in a bounded LRU cache
+    shared by the whole process, so vocabulary repeated across a cohort of
+    answers is only stemmed once.
+    """
+    return _stemmer.stem(word)
+
+def stem_cache_info():
+    """Return hit/miss counters and size of the shared stem cache"""
+    return stem_word.cache_info()
+
+def analyze_text(text, ngram_range=(1,2)):
+    """
+    Tokenize a text once and derive both grading views from it:
+    - n-grams of stemmed tokens with stopwords removed (for TF-IDF)
+    - the set of stemmed tokens longer than two characters (for keywords)
+    Returns: (ngrams, keywords)
+    """
+    stems = []
+    keywords = set()
+    for token in re.findall(r'\b\w+\b', (text or "").lower()):
+        is_content = token not in ENGLISH_STOP_WORDS
+        is_keyword = len(token) > 2
+        if not (is_content or is_keyword):
+            continue
+        stem = stem_word(token)
+        if is_content:
+            stems.append(stem)
+        if is_keyword:
+            keywords.add(stem)
     ngrams = []
     min_n, max_n = ngram_range
     for n in range(min_n, max_n+1):
-        ngrams += [' '.join(tokens[i:i+n]) for i in range(len(tokens)-n+1)]
+        ngrams += [' '.join(stems[i:i+n]) for i in range(len(stems)-n+1)]
+    return ngrams, keywords
+
+def preprocess_text(text, ngram_range=(1,2)):
+    # Lowercase, remove punctuation, split into words, remove stopwords, apply stemming
+    ngrams, _ = analyze_text(text, ngram_range)
     return ngrams
 
 def manual_tfidf_vectorizer(texts, ngram_range=(1,2)):
@@ -338,15 +535,46 @@ def manual_cosine_similarity(vec1, vec2, vocab):
         return 0.0
     return dot / (norm1 * norm2)
 
+def build_tfidf_matrix(texts, ngram_range=(1,2)):
+    """
+    Build a sparse CSR TF-IDF matrix (one row per text) with the same
+    tokenization, stemming, n-gram and smoothed-IDF semantics as
+    manual_tfidf_vectorizer.
+    Returns: (matrix, vocabulary) where vocabulary maps term -> column index
+    """
+    vocabulary = {}
+    indptr = [0]
+    indices = []
+    data = []
+    for text in texts:
+        tokens = preprocess_text(text, ngram_range)
+        total = len(tokens)
+        for term, count in Counter(tokens).items():
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            data.append(count / total)
+        indptr.append(len(indices))
+    tf_matrix = csr_matrix(
+        (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(texts), len(vocabulary))
+    )
+    # Each term appears at most once per row, so column counts are document frequencies
+    n_docs = len(texts)
+    document_frequency = np.bincount(tf_matrix.indices, minlength=len(vocabulary))
+    idf = np.log((n_docs + 1) / (document_frequency + 1)) + 1
+    tfidf_matrix = tf_matrix.multiply(idf.reshape(1, -1)).tocsr()
+    return tfidf_matrix, vocabulary
+
 def calculate_similarity_score(student_text, reference_text):
     """
-    Calculate similarity score between student answer and reference answer using manual TF-IDF with n-grams
+    Calculate similarity score between student answer and reference answer using sparse TF-IDF with n-grams
     """
     try:
         if not student_text or not reference_text:
             return 0.0
-        tfidf_vectors, vocab = manual_tfidf_vectorizer([student_text, reference_text], ngram_range=(1,2))
-        similarity = manual_cosine_similarity(tfidf_vectors[0], tfidf_vectors[1], vocab)
+        tfidf_matrix, vocabulary = build_tfidf_matrix([student_text, reference_text], ngram_range=(1,2))
+        if not vocabulary:
+            return 0.0
+        similarity = sparse_cosine_similarity(tfidf_matrix[0], tfidf_matrix[1])[0, 0]
         return float(similarity)
     except Exception as e:
         logger.error(f"Error calculating similarity score: {e}")
@@ -357,111 +585,540 @@ def extract_keywords(text):
     Extract keywords from a text for keyword matching.
     Uses simple tokenization and removes stopwords.
     """
-    ps = PorterStemmer()
-    tokens = re.findall(r'\b\w+\b', text.lower())
     # Only remove short words, not stopwords
-    keywords = [ps.stem(t) for t in tokens if len(t) > 2]
-    print(f"[DEBUG] Extracted (stemmed, no stopwords) keywords from: '{text[:60]}...': {set(keywords)}")
-    return set(keywords)
+    _, keywords = analyze_text(text)
+    print(f"[DEBUG] Extracted (stemmed, no stopwords) keywords from: '{text[:60]}...': {keywords}")
+    return keywords
 
-def grade_answer(student_answer, reference_answers):
+def stemmed_token_stream(text):
     """
-    Grade student answer against reference answers using TF-IDF similarity and keyword matching
-    Returns: (marks, feedback, best_match_reference) where marks is 0-5
+    Stem every word of a text, in order, for keyword and key phrase matching.
+    Returns: list of (stem, is_keyword) where is_keyword follows the keyword
+    rule of analyze_text (words longer than two characters)
     """
-    try:
-        if not student_answer:
-            return 0, "No answer provided", None
-        student_text = ""
-        if hasattr(student_answer, 'text_answer') and student_answer.text_answer:
-            student_text = student_answer.text_answer
-        elif hasattr(student_answer, 'ocr_text') and student_answer.ocr_text:
-            student_text = student_answer.ocr_text
-        else:
-            return 0, "No text content found in answer", None
-        if not student_text.strip():
-            return 0, "No text content found in answer", None
-        best_score = 0.0
-        best_feedback = ""
-        best_reference = None
-        best_keywords = set()
-        for ref_answer in reference_answers:
-            ref_text = ""
-            if ref_answer.text_answer:
-                ref_text = ref_answer.text_answer
-            elif ref_answer.ocr_text:
-                ref_text = ref_answer.ocr_text
-            if not ref_text.strip():
-                continue
-            similarity_score = calculate_similarity_score(student_text, ref_text)
-            ref_keywords = extract_keywords(ref_text)
-            if similarity_score > best_score:
-                best_score = similarity_score
-                best_reference = ref_answer
-                best_keywords = ref_keywords
-                if similarity_score >= 0.9:
-                    best_feedback = "Outstanding! Your answer matches the reference almost perfectly."
-                elif similarity_score >= 0.7:
-                    best_feedback = "Great job! Your answer is very similar to the reference."
-                elif similarity_score >= 0.5:
-                    best_feedback = "Good effort! Your answer covers many key points."
-                elif similarity_score >= 0.3:
-                    best_feedback = "Some relevant content, but more detail is needed."
-                else:
-                    best_feedback = "Your answer needs significant improvement. Please review the topic."
-        # TF-IDF based marks
-        if best_score >= 0.85:
-            tfidf_marks = 5
-        elif best_score >= 0.7:
-            tfidf_marks = 4
-        elif best_score >= 0.6:
-            tfidf_marks = 3
-        elif best_score >= 0.4:
-            tfidf_marks = 2
-        elif best_score >= 0.2:
-            tfidf_marks = 1
-        else:
-            tfidf_marks = 0
-        # Cap TF-IDF score if answer is too short
-        if len(student_text.split()) < 8:
-            tfidf_marks = min(tfidf_marks, 2)
-        
-        # Absolute matched keyword based marks
-        student_keywords = extract_keywords(student_text)
+    return [(stem_word(token), len(token) > 2) for token in re.findall(r'\b\w+\b', (text or "").lower())]
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over stemmed tokens. The patterns are a reference
+    answer's keywords (single stems) and its key phrases (stem sequences), so
+    a single left-to-right pass over an answer's token stream finds every
+    occurrence of every pattern together with its position.
+    """
+
+    def __init__(self, keywords, key_phrases=()):
+        # pattern index -> (label, length in tokens, is_phrase)
+        self.patterns = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for keyword in keywords:
+            self._add_pattern((keyword,), keyword, is_phrase=False)
+        seen_phrases = set()
+        for phrase, stems in key_phrases:
+            if stems and stems not in seen_phrases:
+                seen_phrases.add(stems)
+                self._add_pattern(stems, phrase, is_phrase=True)
+        self.phrase_count = len(seen_phrases)
+        self._link_failures()
+
+    def _add_pattern(self, stems, label, is_phrase):
+        state = 0
+        for stem in stems:
+            next_state = self._goto[state].get(stem)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][stem] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(len(self.patterns))
+        self.patterns.append((label, len(stems), is_phrase))
+
+    def _link_failures(self):
+        """Breadth-first pass setting each state's failure link and merged outputs"""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for stem, next_state in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and stem not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(stem, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+                queue.append(next_state)
+
+    def scan(self, stream):
+        """
+        Find all pattern occurrences in a stemmed token stream. Keywords only
+        match words that count as keywords; key phrases match any words.
+        Returns: list of (pattern_index, start_position) in order of their end
+        """
+        matches = []
+        state = 0
+        for position, (stem, is_keyword) in enumerate(stream):
+            while state and stem not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(stem, 0)
+            for pattern_index in self._output[state]:
+                label, length, is_phrase = self.patterns[pattern_index]
+                if is_phrase or is_keyword:
+                    matches.append((pattern_index, position - length + 1))
+        return matches
+
+    def match(self, stream):
+        """
+        Summarize a scan of the stream.
+        Returns: (matched_keywords, covered_phrases) - the set of keywords
+        found and the key phrases found, ordered by first occurrence
+        """
         matched_keywords = set()
-        keyword_marks = 0
-        if best_keywords:
-            matched_keywords = best_keywords & student_keywords
-            print(f"[DEBUG] Reference keywords: {best_keywords}")
-            print(f"[DEBUG] Student keywords: {student_keywords}")
-            print(f"[DEBUG] Matched keywords: {matched_keywords}")
-            print(f"[DEBUG] Matched keyword count: {len(matched_keywords)}")
-            if len(matched_keywords) >= 10:
-                keyword_marks = 5
-            elif len(matched_keywords) >= 7:
-                keyword_marks = 4
-            elif len(matched_keywords) >= 5:
-                keyword_marks = 3
-            elif len(matched_keywords) >= 3:
-                keyword_marks = 2
-            elif len(matched_keywords) >= 1:
-                keyword_marks = 1
+        first_seen = {}
+        for pattern_index, start in self.scan(stream):
+            label, length, is_phrase = self.patterns[pattern_index]
+            if is_phrase:
+                first_seen[label] = min(start, first_seen.get(label, start))
             else:
-                keyword_marks = 0
-        if len(student_text.split()) < 10:
-            tfidf_marks = min(tfidf_marks, 2)
-            keyword_marks = min(keyword_marks, 2)
-        # Use the higher of the two
-        marks = max(tfidf_marks, keyword_marks)
-        if not best_feedback:
-            if best_score == 0.0:
-                best_feedback = "No reference answers available for comparison, or answer content does not match expected format."
+                matched_keywords.add(label)
+        return matched_keywords, sorted(first_seen, key=first_seen.get)
+
+@lru_cache(maxsize=AUTOMATON_CACHE_SIZE)
+def compile_keyword_automaton(keywords, key_phrases=()):
+    """
+    Compile (and cache) the automaton for a reference's keywords and key
+    phrases. The cache is keyed by content, so an edited reference simply
+    compiles a new automaton and unchanged ones are shared across batches.
+    """
+    phrases = [
+        (phrase, tuple(stem for stem, _ in stemmed_token_stream(phrase)))
+        for phrase in key_phrases
+    ]
+    return KeywordAutomaton(keywords, phrases)
+
+def get_reference_automaton(ref_answer, analysis):
+    """Return the cached keyword automaton of a loaded reference answer"""
+    get_key_phrases = getattr(ref_answer, 'get_key_phrases', None)
+    key_phrases = tuple(get_key_phrases()) if get_key_phrases else ()
+    return compile_keyword_automaton(tuple(analysis['keywords']), key_phrases)
+
+# Bump whenever tokenization, stemming or the artifact layout changes so
+# stored reference analyses are recompiled on next use
+ANALYSIS_VERSION = 1
+
+def compile_text_analysis(text, ngram_range=(1,2)):
+    """
+    Compile the grading artifact for a text: stemmed n-gram counts, the
+    keyword set and the sum of squared term frequencies (the squared TF norm)
+    """
+    tokens, keywords = analyze_text(text, ngram_range)
+    counts = Counter(tokens)
+    total = len(tokens)
+    tf_square_sum = sum((count / total) ** 2 for count in counts.values()) if total else 0.0
+    return {
+        'version': ANALYSIS_VERSION,
+        'ngram_counts': dict(counts),
+        'ngram_total': total,
+        'tf_square_sum': tf_square_sum,
+        'keywords': sorted(keywords),
+    }
+
+def is_analysis_current(analysis):
+    """Check a stored analysis artifact was compiled by this grader version"""
+    return isinstance(analysis, dict) and analysis.get('version') == ANALYSIS_VERSION
+
+def load_reference_analyses(reference_answers):
+    """
+    Load the compiled analysis of every usable reference answer.
+    Missing or stale artifacts are recompiled once and persisted without
+    re-running ReferenceAnswer.save() (which would repeat OCR). A reference
+    whose analysis is not ready yet (pending or failed) still holds the
+    analysis of its old text, so it is compiled from the current text and
+    left for the background analysis to store.
+    Returns: list of (reference_answer, analysis)
+    """
+    loaded = []
+    for ref_answer in reference_answers:
+        ref_text = ref_answer.get_reference_text()
+        if not ref_text.strip():
+            continue
+        analysis = ref_answer.analysis
+        if ref_answer.analysis_status != ReferenceAnswer.ANALYSIS_READY:
+            analysis = compile_text_analysis(ref_text)
+        elif not is_analysis_current(analysis):
+            analysis = compile_text_analysis(ref_text)
+            ref_answer.analysis = analysis
+            ReferenceAnswer.objects.filter(pk=ref_answer.pk).update(analysis=analysis) # type: ignore
+        loaded.append((ref_answer, analysis))
+    return loaded
+
+def get_answer_terms(student_answer):
+    """Return the distinct stemmed n-grams an answer contributes to its question's corpus"""
+    ngrams, _ = analyze_text(get_student_answer_text(student_answer))
+    return sorted(set(ngrams))
+
+def _move_corpus_terms(question_id, previous_terms, terms, create=True):
+    """
+    Replace one answer's counted terms in its question's document frequencies,
+    under a row lock. With create False, missing statistics are left alone.
+    Returns: False when there are no statistics or they are from an older analyzer
+    """
+    stats_rows = QuestionCorpusStats.objects.select_for_update() # type: ignore
+    if create:
+        stats, _ = stats_rows.get_or_create(question_id=question_id, defaults={'analysis_version': ANALYSIS_VERSION})
+    else:
+        stats = stats_rows.filter(question_id=question_id).first()
+    if stats is None or stats.analysis_version != ANALYSIS_VERSION:
+        return False
+    document_frequency = stats.document_frequency
+    for term in set(previous_terms).difference(terms):
+        remaining = document_frequency.get(term, 0) - 1
+        if remaining > 0:
+            document_frequency[term] = remaining
+        else:
+            document_frequency.pop(term, None)
+    for term in set(terms).difference(previous_terms):
+        document_frequency[term] = document_frequency.get(term, 0) + 1
+    # An answer counts as a document while it contributes any terms
+    stats.document_count = max(0, stats.document_count + bool(terms) - bool(previous_terms))
+    stats.save(update_fields=['document_count', 'document_frequency', 'updated_at'])
+    return True
+
+def sync_corpus_stats(student_answer):
+    """
+    Incrementally update the document frequencies of the answer's question
+    after the answer's text was saved: terms it no longer contains are
+    decremented and new ones incremented, so the cost is O(answer length).
+    Statistics built by an older analyzer are left for rebuild_corpus_stats.
+    """
+    try:
+        terms = get_answer_terms(student_answer)
+        previous_terms = student_answer.indexed_terms or []
+        if terms == previous_terms:
+            return
+        with transaction.atomic():
+            if _move_corpus_terms(student_answer.question_id, previous_terms, terms):
+                student_answer.indexed_terms = terms or None
+                SubjectiveAnswer.objects.filter(pk=student_answer.pk).update(indexed_terms=student_answer.indexed_terms) # type: ignore
+    except Exception as e:
+        logger.error(f"Error updating corpus statistics for answer {student_answer.pk}: {e}")
+
+def remove_from_corpus_stats(student_answer):
+    """Decrement the document frequencies of a deleted answer's counted terms"""
+    if not student_answer.indexed_terms:
+        return
+    try:
+        with transaction.atomic():
+            # A question being deleted takes its statistics with it; never recreate them
+            _move_corpus_terms(student_answer.question_id, student_answer.indexed_terms, [], create=False)
+    except Exception as e:
+        logger.error(f"Error removing answer {student_answer.pk} from corpus statistics: {e}")
+
+def rebuild_corpus_stats(question):
+    """
+    Rebuild a question's document frequencies from scratch over all of its
+    answers and re-stamp every answer's counted terms.
+    Returns: the rebuilt QuestionCorpusStats
+    """
+    answers = list(SubjectiveAnswer.objects.filter(question=question)) # type: ignore
+    document_frequency = Counter()
+    document_count = 0
+    for answer in answers:
+        terms = get_answer_terms(answer)
+        answer.indexed_terms = terms or None
+        if terms:
+            document_frequency.update(terms)
+            document_count += 1
+    with transaction.atomic():
+        SubjectiveAnswer.objects.bulk_update(answers, ['indexed_terms'], batch_size=500) # type: ignore
+        stats, _ = QuestionCorpusStats.objects.update_or_create( # type: ignore
+            question=question,
+            defaults={
+                'document_count': document_count,
+                'document_frequency': dict(document_frequency),
+                'analysis_version': ANALYSIS_VERSION,
+            }
+        )
+    return stats
+
+def load_cohort_stats(question):
+    """
+    Return the question's corpus statistics when they are current and cover
+    enough answers for cohort IDF to be meaningful, otherwise None
+    """
+    question_id = getattr(question, 'pk', question)
+    if not isinstance(question_id, int):
+        return None
+    stats = QuestionCorpusStats.objects.filter(question_id=question_id).first() # type: ignore
+    if stats is None or stats.analysis_version != ANALYSIS_VERSION:
+        return None
+    if stats.document_count < COHORT_MIN_DOCUMENTS:
+        return None
+    return stats
+
+def similarity_from_analyses(student_analysis, reference_analysis):
+    """
+    Pairwise TF-IDF cosine similarity computed from two compiled analyses.
+    Gives the same score as calculate_similarity_score: in a two-document
+    corpus shared terms have IDF 1 and every other term has the same IDF,
+    so only the shared terms need to be visited.
+    """
+    student_counts = student_analysis['ngram_counts']
+    reference_counts = reference_analysis['ngram_counts']
+    student_total = student_analysis['ngram_total']
+    reference_total = reference_analysis['ngram_total']
+    if not student_total or not reference_total:
+        return 0.0
+    if len(student_counts) > len(reference_counts):
+        shared_terms = [t for t in reference_counts if t in student_counts]
+    else:
+        shared_terms = [t for t in student_counts if t in reference_counts]
+    if not shared_terms:
+        return 0.0
+    dot = 0.0
+    student_shared_square = 0.0
+    reference_shared_square = 0.0
+    for term in shared_terms:
+        student_tf = student_counts[term] / student_total
+        reference_tf = reference_counts[term] / reference_total
+        dot += student_tf * reference_tf
+        student_shared_square += student_tf ** 2
+        reference_shared_square += reference_tf ** 2
+    unique_weight = PAIR_UNIQUE_TERM_IDF ** 2
+    student_norm_square = unique_weight * student_analysis['tf_square_sum'] - (unique_weight - 1) * student_shared_square
+    reference_norm_square = unique_weight * reference_analysis['tf_square_sum'] - (unique_weight - 1) * reference_shared_square
+    if student_norm_square <= 0 or reference_norm_square <= 0:
+        return 0.0
+    return dot / math.sqrt(student_norm_square * reference_norm_square)
+
+# Similarity thresholds -> TF-IDF marks (0-5)
+TFIDF_MARK_THRESHOLDS = np.array([0.2, 0.4, 0.6, 0.7, 0.85])
+
+# Matched keyword counts -> keyword marks (0-5)
+KEYWORD_MARK_THRESHOLDS = np.array([1, 3, 5, 7, 10])
+
+# Similarity thresholds -> index into SIMILARITY_FEEDBACK
+FEEDBACK_THRESHOLDS = np.array([0.3, 0.5, 0.7, 0.9])
+
+SIMILARITY_FEEDBACK = [
+    "Your answer needs significant improvement. Please review the topic.",
+    "Some relevant content, but more detail is needed.",
+    "Good effort! Your answer covers many key points.",
+    "Great job! Your answer is very similar to the reference.",
+    "Outstanding! Your answer matches the reference almost perfectly.",
+]
+
+NO_MATCH_FEEDBACK = "No reference answers available for comparison, or answer content does not match expected format."
+
+# Answers shorter than this many words are capped at SHORT_ANSWER_MARK_CAP
+SHORT_ANSWER_WORDS = 10
+SHORT_ANSWER_MARK_CAP = 2
+
+def get_student_answer_text(student_answer):
+    """Return the gradable text of a student answer: typed text first, then OCR text"""
+    if hasattr(student_answer, 'text_answer') and student_answer.text_answer:
+        return student_answer.text_answer
+    if hasattr(student_answer, 'ocr_text') and student_answer.ocr_text:
+        return student_answer.ocr_text
+    return ""
+
+def grade_texts(student_texts, reference_entries, cohort_stats=None, backend=None):
+    """
+    Grade already-extracted student texts against loaded reference analyses
+    (see load_reference_analyses) with a similarity backend (the default
+    backend when None), without the grading cache. Cohort statistics are
+    only passed to backends that weight terms with them.
+    Returns: list of (marks, feedback, best_match_reference), one per text
+    """
+    student_analyses = [compile_text_analysis(text) for text in student_texts]
+    n_students = len(student_analyses)
+    if not reference_entries:
+        return [(0, NO_MATCH_FEEDBACK, None)] * n_students
+
+    references = [ref_answer for ref_answer, _ in reference_entries]
+    backend = backend or get_backend()
+    similarity = backend.similarity_matrix(
+        student_texts,
+        student_analyses,
+        reference_entries,
+        cohort_stats if backend.uses_cohort_stats else None
+    )
+
+    # Best reference per student; argmax keeps the first of equal scores
+    best_index = similarity.argmax(axis=1)
+    rows = np.arange(n_students)
+    best_score = similarity[rows, best_index]
+    has_match = best_score > 0
+
+    # One automaton scan per answer against its best reference counts the
+    # distinct keywords plus key phrases found; keywords only count against
+    # a reference that actually matched
+    matched_keywords = np.zeros(n_students, dtype=np.int64)
+    covered_phrases = [None] * n_students
+    for i in np.flatnonzero(has_match):
+        ref_answer, reference_analysis = reference_entries[best_index[i]]
+        automaton = get_reference_automaton(ref_answer, reference_analysis)
+        keywords_found, phrases_found = automaton.match(stemmed_token_stream(student_texts[i]))
+        matched_keywords[i] = len(keywords_found) + len(phrases_found)
+        if automaton.phrase_count:
+            covered_phrases[i] = (phrases_found, automaton.phrase_count)
+
+    tfidf_marks = np.digitize(best_score, TFIDF_MARK_THRESHOLDS)
+    keyword_marks = np.digitize(matched_keywords, KEYWORD_MARK_THRESHOLDS)
+    word_counts = np.array([len(text.split()) for text in student_texts])
+    is_short = word_counts < SHORT_ANSWER_WORDS
+    tfidf_marks = np.where(is_short, np.minimum(tfidf_marks, SHORT_ANSWER_MARK_CAP), tfidf_marks)
+    keyword_marks = np.where(is_short, np.minimum(keyword_marks, SHORT_ANSWER_MARK_CAP), keyword_marks)
+    # Use the higher of the two
+    marks = np.maximum(tfidf_marks, keyword_marks)
+    feedback_index = np.digitize(best_score, FEEDBACK_THRESHOLDS)
+
+    results = []
+    for i in range(n_students):
+        feedback = SIMILARITY_FEEDBACK[feedback_index[i]] if has_match[i] else NO_MATCH_FEEDBACK
+        if covered_phrases[i] is not None:
+            feedback = f"{feedback} {key_points_feedback(*covered_phrases[i])}"
+        results.append((int(marks[i]), feedback, references[best_index[i]] if has_match[i] else None))
+    return results
+
+def key_points_feedback(phrases_found, phrase_count):
+    """Feedback sentence listing the reference's key phrases an answer covered"""
+    if not phrases_found:
+        return f"Key points covered: none of {phrase_count}."
+    return f"Key points covered ({len(phrases_found)}/{phrase_count}): {', '.join(phrases_found)}."
+
+# Bump whenever marks or feedback rules change so cached grades are not reused
+GRADER_VERSION = 2
+
+_grading_cache_counters = {'hits': 0, 'misses': 0}
+_grading_cache_lock = threading.Lock()
+
+def grading_cache_stats():
+    """Return grading cache hit/miss counters for this process"""
+    with _grading_cache_lock:
+        hits = _grading_cache_counters['hits']
+        misses = _grading_cache_counters['misses']
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / lookups if lookups else 0.0,
+    }
+
+def _count_grading_cache(hits, misses):
+    with _grading_cache_lock:
+        _grading_cache_counters['hits'] += hits
+        _grading_cache_counters['misses'] += misses
+
+def normalize_answer_text(text):
+    """Normalize answer text for cache keys: case and whitespace do not affect grading"""
+    return ' '.join(text.lower().split())
+
+def grading_inputs_version(reference_entries, cohort_stats, backend_name=None):
+    """
+    Fingerprint everything besides the student's text that a grade depends
+    on: the reference set and the text each reference is graded against
+    (with its analysis status), the similarity backend, the analyzer and
+    grader versions and, when used, the cohort statistics
+    """
+    parts = [f'grader:{GRADER_VERSION}', f'analysis:{ANALYSIS_VERSION}', f'backend:{backend_name or get_backend().name}']
+    for ref_answer, analysis in reference_entries:
+        parts.append(
+            f'ref:{ref_answer.pk}:{ref_answer.updated_at.isoformat() if ref_answer.updated_at else ""}'
+            f':{text_sha256(ref_answer.get_reference_text())}:{ref_answer.analysis_status}'
+        )
+    if cohort_stats is not None:
+        parts.append(f'cohort:{cohort_stats.pk}:{cohort_stats.document_count}:{cohort_stats.updated_at.isoformat()}')
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+def grading_cache_key(student_text, inputs_version):
+    """Content-addressed cache key for one answer text under one set of grading inputs"""
+    digest = hashlib.sha256(normalize_answer_text(student_text).encode('utf-8')).hexdigest()
+    return f'grading:{inputs_version}:{digest}'
+
+def _grade_with_cache(student_texts, reference_entries, cohort_stats, backend):
+    """
+    Grade texts through the grading cache: identical texts are graded once
+    and previously graded texts skip the similarity pipeline entirely
+    """
+    references_by_pk = {ref_answer.pk: ref_answer for ref_answer, _ in reference_entries}
+    inputs_version = grading_inputs_version(reference_entries, cohort_stats, backend.name)
+    keys = [grading_cache_key(text, inputs_version) for text in student_texts]
+    cache = caches[GRADING_CACHE_ALIAS]
+    try:
+        cached = cache.get_many(set(keys))
+    except Exception as e:
+        logger.error(f"Error reading grading cache: {e}")
+        cached = {}
+
+    missing_keys = []
+    missing_texts = []
+    for key, text in zip(keys, student_texts):
+        if key not in cached and key not in missing_keys:
+            missing_keys.append(key)
+            missing_texts.append(text)
+    _count_grading_cache(len(keys) - len(missing_keys), len(missing_keys))
+
+    if missing_texts:
+        graded = grade_texts(missing_texts, reference_entries, cohort_stats=cohort_stats, backend=backend)
+        fresh = {
+            key: (marks, feedback, best_reference.pk if best_reference else None)
+            for key, (marks, feedback, best_reference) in zip(missing_keys, graded)
+        }
+        try:
+            cache.set_many(fresh, timeout=GRADING_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error writing grading cache: {e}")
+        cached.update(fresh)
+
+    results = []
+    for key in keys:
+        marks, feedback, reference_pk = cached[key]
+        results.append((marks, feedback, references_by_pk.get(reference_pk)))
+    return results
+
+def grade_answers_batch(question, answers, reference_answers=None, exam=None, backend=None):
+    """
+    Grade all student answers to one question in a single pass: the
+    references are loaded once, all pairs are scored by one similarity
+    backend call and marks/feedback are mapped with vectorized thresholds.
+    The backend name defaults to the question's, then the exam's choice.
+    Returns: list of (marks, feedback, best_match_reference), one per answer
+    """
+    answers = list(answers)
+    try:
+        if reference_answers is None:
+            reference_answers = get_reference_answers_for_question(question)
+        results = [None] * len(answers)
+        gradable_positions = []
+        gradable_texts = []
+        for position, answer in enumerate(answers):
+            student_text = get_student_answer_text(answer) if answer else ""
+            if not answer:
+                results[position] = (0, "No answer provided", None)
+            elif not student_text.strip():
+                results[position] = (0, "No text content found in answer", None)
             else:
-                best_feedback = "Answer has been processed and graded based on available reference material."
-        return marks, best_feedback, best_reference
+                gradable_positions.append(position)
+                gradable_texts.append(student_text)
+        if gradable_texts:
+            similarity_backend = get_backend(backend or resolve_backend_name(question, exam))
+            reference_entries = load_reference_analyses(reference_answers)
+            cohort_stats = load_cohort_stats(question) if similarity_backend.uses_cohort_stats else None
+            graded = _grade_with_cache(gradable_texts, reference_entries, cohort_stats, similarity_backend)
+            for position, result in zip(gradable_positions, graded):
+                results[position] = result
+        return results
     except Exception as e:
-        logger.error(f"Error grading answer: {e}")
-        return 0, f"Error during grading: {str(e)}", None
+        logger.error(f"Error grading answers for question {getattr(question, 'pk', question)}: {e}")
+        return [(0, f"Error during grading: {str(e)}", None)] * len(answers)
+
+def grade_answer(student_answer, reference_answers):
+    """
+    Grade student answer against reference answers using TF-IDF similarity and keyword matching
+    Returns: (marks, feedback, best_match_reference) where marks is 0-5
+    """
+    question = student_answer.question if getattr(student_answer, 'question_id', None) else None
+    return grade_answers_batch(question, [student_answer], reference_answers=reference_answers)[0]
 
 def calculate_total_marks(student, exam):
     """
@@ -487,6 +1144,86 @@ def calculate_total_marks(student, exam):
         logger.error(f"Error calculating total marks: {e}")
         return 0, 0
 
+OCR_FAILED_TEXT = "OCR processing failed. Please check image quality."
+
+def apply_image_ocr(subj_answer, image_file, on_busy='raise'):
+    """
+    Run OCR on an answer image (a file or an IngestedImage) and copy the
+    text into the answer's ocr_text and text_answer fields (not saved).
+    A busy OCR service raises OCRServiceBusy by default; run_grading_worker
+    passes on_busy='wait', and the exam view passes on_busy='local' only
+    when the grading queue is disabled and no worker could OCR it later.
+    Returns: (ocr_text, error)
+    """
+    ocr_text, ocr_error = extract_text_from_image(image_file, source='subjective_answer', on_busy=on_busy)
+    if ocr_text:
+        subj_answer.ocr_text = ocr_text
+        # Auto-populate text_answer field with OCR text
+        subj_answer.text_answer = ocr_text
+    elif ocr_error:
+        subj_answer.ocr_text = OCR_FAILED_TEXT
+        subj_answer.text_answer = OCR_FAILED_TEXT
+    return ocr_text, ocr_error
+
+def finalize_exam_results(stu_exam, exam_main=None):
+    """
+    Recompute a student's exam score from the stored answer marks, mark the
+    exam graded and create or update its ExamResults record
+    """
+    from main.models import Exam_Model
+    
+    if exam_main is None:
+        exam_main = Exam_Model.objects.get(name=stu_exam.examname) # type: ignore
+    student = stu_exam.student
+    
+    stu_questions = list(stu_exam.questions.all())
+    question_ids = [q.original_question_id for q in stu_questions if q.original_question_id]
+    answers = SubjectiveAnswer.objects.filter(student=student, question_id__in=question_ids) # type: ignore
+    
+    total_questions = len(stu_questions)
+    questions_attempted = 0
+    questions_correct = 0
+    questions_partial = 0
+    questions_incorrect = 0
+    total_score = 0
+    for answer in answers:
+        questions_attempted += 1
+        total_score += answer.marks
+        # Categorize question performance
+        if answer.marks >= 4:  # Assuming 5 is max marks
+            questions_correct += 1
+        elif answer.marks >= 2:
+            questions_partial += 1
+        else:
+            questions_incorrect += 1
+    
+    max_possible_score = total_questions * 5  # Assuming 5 marks per question
+    graded_at = timezone.now()
+    stu_exam.score = int(total_score)
+    stu_exam.total_marks_possible = max_possible_score
+    stu_exam.is_graded = True
+    stu_exam.save()
+    
+    ExamResults.objects.update_or_create( # type: ignore
+        exam=exam_main,
+        student=student,
+        defaults={
+            'student_exam': stu_exam,
+            'total_questions': total_questions,
+            'questions_attempted': questions_attempted,
+            'questions_correct': questions_correct,
+            'questions_partial': questions_partial,
+            'questions_incorrect': questions_incorrect,
+            'total_score': stu_exam.score,
+            'max_possible_score': max_possible_score,
+            'is_completed': True,
+            'is_graded': True,
+            'completed_at': stu_exam.completed_at or graded_at,
+            'graded_at': graded_at,
+        }
+    )
+    return stu_exam
+
 def get_reference_answers_for_question(question):
     """
     Get all reference answers for a given question
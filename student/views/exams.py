@@ -10,7 +10,9 @@ from main.models import Question_DB
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from main.models.group import Special_Students
-from ..utils import validate_image_file, extract_text_from_image, grade_answer, get_reference_answers_for_question
+from ..utils import ingest_image, apply_image_ocr, grade_answers_batch, get_reference_answers_for_question, finalize_exam_results
+from ..jobs import enqueue_exam_grading, grading_queue_enabled
+from ..ocr_service import ocr_service_socket
 
 
 def exams(request):
@@ -104,6 +106,7 @@ def exams(request):
 
         # Check if student actually submitted answers
         submitted_answers = False
+        grading_pending = False
         print(f"Processing exam submission for {paper}")
         print(f"Total questions: {stuExam.questions.count()}")
         
@@ -141,23 +144,23 @@ def exams(request):
                         print(f"[DEBUG] Saved text answer.")
                     elif image_file:
                         print(f"[DEBUG] Received image file: {image_file}")
-                        # Validate and process image
-                        is_valid, error_msg = validate_image_file(image_file)
-                        print(f"[DEBUG] Image validation: {is_valid}, {error_msg}")
-                        if is_valid:
-                            subj_answer.image_answer = image_file
-                            # Extract OCR text
-                            ocr_text, ocr_error = extract_text_from_image(image_file)
-                            print(f"[DEBUG] OCR result: '{ocr_text}', Error: {ocr_error}")
-                            if ocr_text:
-                                subj_answer.ocr_text = ocr_text
-                                # Auto-populate text_answer field with OCR text
-                                subj_answer.text_answer = ocr_text
-                                print(f"[DEBUG] Saved OCR text and auto-populated text_answer field.")
-                            elif ocr_error:
-                                subj_answer.ocr_text = "OCR processing failed. Please check image quality."
-                                subj_answer.text_answer = "OCR processing failed. Please check image quality."
-                                print(f"[DEBUG] OCR failed: {ocr_error}")
+                        # Validate the image, decoding it only when OCR runs in this request
+                        queued = grading_queue_enabled()
+                        ingested, error_msg = ingest_image(image_file, decode=not (queued or ocr_service_socket()))
+                        print(f"[DEBUG] Image validation: {ingested is not None}, {error_msg}")
+                        if ingested is not None:
+                            subj_answer.image_answer = ingested.file
+                            if queued:
+                                # OCR runs with grading in the background worker
+                                subj_answer.ocr_text = None
+                                subj_answer.text_answer = None
+                                print(f"[DEBUG] Stored image, OCR queued.")
+                            else:
+                                # Extract OCR text and auto-populate text_answer field. Without the
+                                # grading queue no worker could OCR the answer later, and a timed-out
+                                # exam cannot be sent again, so a busy OCR service means OCR'ing here
+                                ocr_text, ocr_error = apply_image_ocr(subj_answer, ingested, on_busy='local')
+                                print(f"[DEBUG] OCR result: '{ocr_text}', Error: {ocr_error}")
                         else:
                             messages.error(request, f"Image error for question {question.pk}: {error_msg}")
                             print(f"[DEBUG] Image validation failed: {error_msg}")
@@ -174,14 +177,8 @@ def exams(request):
         if submitted_answers:
             # Student submitted answers - grade them using TF-IDF
             
-            total_score = 0
-            graded_questions = 0
-            questions_attempted = 0
-            questions_correct = 0
-            questions_partial = 0
-            questions_incorrect = 0
-            total_questions = stuExam.questions.count()
-            
+            # Collect the student's answers per question so each question is graded in one batch
+            answers_by_question = {}
             for question in stuExam.questions.all():
                 # Get student's answer for this question
                 original_question = question.original_question
@@ -194,92 +191,49 @@ def exams(request):
                 ).first()
                 
                 if student_answer:
-                    questions_attempted += 1
-                    
+                    answers_by_question.setdefault(original_question, []).append(student_answer)
+            
+            # Mark as completed and set completion time
+            stuExam.completed = 1
+            stuExam.completed_at = timezone.now()
+            stuExam.total_marks_possible = stuExam.questions.count() * 5  # Assuming 5 marks per question
+            
+            if grading_queue_enabled():
+                # OCR and grading run in run_grading_worker; results are finalized when the last job finishes
+                stuExam.score = 0
+                submitted = [answer for question_answers in answers_by_question.values() for answer in question_answers]
+                enqueue_exam_grading(stuExam, submitted)
+                grading_pending = True
+                print(f"Exam {paper} submitted, {len(submitted)} answers queued for grading")
+            else:
+                graded_answers = []
+                graded_at = timezone.now()
+                for original_question, question_answers in answers_by_question.items():
                     # Get reference answers for this question
                     reference_answers = get_reference_answers_for_question(original_question)
                     
-                    if reference_answers:
-                        # Grade the answer using TF-IDF
-                        score, feedback, best_reference = grade_answer(student_answer, reference_answers)
-                        total_score += score
-                        graded_questions += 1
-                        
+                    if not reference_answers:
+                        print(f"No reference answers found for question {original_question.pk}")
+                        continue
+                    
+                    # Grade the answers using TF-IDF
+                    results = grade_answers_batch(original_question, question_answers, reference_answers=reference_answers, exam=examMain)
+                    for student_answer, (score, feedback, best_reference) in zip(question_answers, results):
                         # Store the grade and feedback
                         student_answer.marks = score
                         student_answer.feedback = feedback
                         student_answer.is_auto_graded = True
-                        student_answer.graded_at = timezone.now()
-                        student_answer.save()
+                        student_answer.graded_at = graded_at
+                        graded_answers.append(student_answer)
                         
-                        # Categorize question performance
-                        if score >= 4:  # Assuming 5 is max marks
-                            questions_correct += 1
-                        elif score >= 2:
-                            questions_partial += 1
-                        else:
-                            questions_incorrect += 1
-                        
-                        print(f"Question {question.pk}: Score = {score:.1f}%, Feedback = {feedback}")
-                    else:
-                        print(f"No reference answers found for question {question.pk}")
-                        questions_incorrect += 1
-            
-            # Calculate total marks and update exam
-            max_possible_score = total_questions * 5  # Assuming 5 marks per question
-            
-            if graded_questions > 0:
-                stuExam.score = int(total_score)
-                stuExam.total_marks_possible = max_possible_score
-                print(f"Total marks: {total_score} (out of {max_possible_score})")
-            else:
-                stuExam.score = 0
-                stuExam.total_marks_possible = max_possible_score
-                print("No questions were graded")
-            
-            # Mark as completed and set completion time
-            stuExam.completed = 1
-            stuExam.is_graded = True
-            stuExam.completed_at = timezone.now()
-            stuExam.save()
-            
-            # Create or update ExamResults record
-            exam_results, created = ExamResults.objects.get_or_create(
-                exam=examMain,
-                student=student,
-                defaults={
-                    'student_exam': stuExam,
-                    'total_questions': total_questions,
-                    'questions_attempted': questions_attempted,
-                    'questions_correct': questions_correct,
-                    'questions_partial': questions_partial,
-                    'questions_incorrect': questions_incorrect,
-                    'total_score': stuExam.score,
-                    'max_possible_score': max_possible_score,
-                    'is_completed': True,
-                    'is_graded': True,
-                    'completed_at': timezone.now(),
-                    'graded_at': timezone.now(),
-                }
-            )
-            
-            if not created:
-                # Update existing record
-                exam_results.total_questions = total_questions
-                exam_results.questions_attempted = questions_attempted
-                exam_results.questions_correct = questions_correct
-                exam_results.questions_partial = questions_partial
-                exam_results.questions_incorrect = questions_incorrect
-                exam_results.total_score = stuExam.score
-                exam_results.max_possible_score = max_possible_score
-                exam_results.is_completed = True
-                exam_results.is_graded = True
-                exam_results.completed_at = timezone.now()
-                exam_results.graded_at = timezone.now()
-                exam_results.save()
-            
-            print(f"Exam {paper} marked as completed with total marks: {stuExam.score}")
-            print(f"ExamResults created/updated for student {student.username}")
+                        print(f"Question {original_question.pk}: Score = {score}/5, Feedback = {feedback}")
+                
+                SubjectiveAnswer.objects.bulk_update(graded_answers, ['marks', 'feedback', 'is_auto_graded', 'graded_at']) #type: ignore
+                
+                # Score the exam and create or update its ExamResults record
+                finalize_exam_results(stuExam, examMain)
+                print(f"Exam {paper} marked as completed with total marks: {stuExam.score}")
+                print(f"ExamResults created/updated for student {student.username}")
         else:
             # No answers submitted: automatically mark exam completed with score 0
             total_questions = stuExam.questions.count()
@@ -294,7 +248,8 @@ def exams(request):
             messages.info(request, "No answers were submitted. The exam has been marked as 0.")
 
         return render(request, 'student/result/result.html', {
-            'Title': title, 'Score': f'{stuExam.score}', 'student': student
+            'Title': title, 'Score': 'Pending Review' if grading_pending else f'{stuExam.score}', 'student': student,
+            'grading_pending': grading_pending
         })
 
     return render(request, 'student/exam/viewexam.html', {
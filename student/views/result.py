@@ -4,7 +4,7 @@ from django.db import models
 from main.models import *
 from django.contrib.auth.models import User
 from student.models import *
-from student.utils import grade_answer, get_reference_answers_for_question
+from student.utils import grade_answers_batch, get_reference_answers_for_question
 
 
 def results(request):
@@ -79,7 +79,7 @@ def auto_grade_exam(exam, student):
     """
     Automatically grade any ungraded answers in an exam
     """
-    from student.models import SubjectiveAnswer
+    from student.models import SubjectiveAnswer, GradingJob
     
     print(f"Auto-grading exam {exam.examname} for student {student.username}")
     
@@ -87,6 +87,13 @@ def auto_grade_exam(exam, student):
     graded_questions = 0
     updated_answers = False
     
+    # Answers still queued for the grading worker are left to it
+    queued_answer_ids = set(GradingJob.objects.filter( # type: ignore
+        student_exam=exam,
+        status__in=[GradingJob.STATUS_PENDING, GradingJob.STATUS_RUNNING]
+    ).values_list('answer_id', flat=True))
+    
+    ungraded_by_question = {}
     for question in exam.questions.all():
         # Get student's answer for this question
         original_question = question.original_question
@@ -98,37 +105,42 @@ def auto_grade_exam(exam, student):
             student=student
         ).first()
         
-        if student_answer and (student_answer.marks == 0 or not student_answer.feedback):
-            # Answer exists but not graded yet - try to grade it
-            reference_answers = get_reference_answers_for_question(original_question)
-            
-            if reference_answers:
-                # Grade the answer using TF-IDF
-                score, feedback, best_reference = grade_answer(student_answer, reference_answers)
-                
+        if student_answer and student_answer.pk in queued_answer_ids:
+            print(f"Question {question.pk} is queued for grading")
+        elif student_answer and (student_answer.marks == 0 or not student_answer.feedback):
+            # Answer exists but not graded yet - grade it with the rest of its question's batch
+            ungraded_by_question.setdefault(original_question, []).append(student_answer)
+        elif student_answer:
+            # Answer already graded
+            total_score += student_answer.marks
+            graded_questions += 1
+            print(f"Question {question.pk} already graded: {student_answer.marks}/5")
+    
+    exam_main = Exam_Model.objects.filter(name=exam.examname).first() # type: ignore
+    for original_question, question_answers in ungraded_by_question.items():
+        reference_answers = get_reference_answers_for_question(original_question)
+        
+        if reference_answers:
+            # Grade the answers using TF-IDF
+            results = grade_answers_batch(original_question, question_answers, reference_answers=reference_answers, exam=exam_main)
+            for student_answer, (score, feedback, best_reference) in zip(question_answers, results):
                 # Update the answer with grade and feedback
                 student_answer.marks = score
                 student_answer.feedback = feedback
-                student_answer.save()
                 
                 total_score += score
                 graded_questions += 1
-                updated_answers = True
                 
-                print(f"Auto-graded Question {question.pk}: Score = {score}/5, Feedback = {feedback}")
-            else:
-                # No reference answers - provide default feedback
+                print(f"Auto-graded Question {original_question.pk}: Score = {score}/5, Feedback = {feedback}")
+        else:
+            # No reference answers - provide default feedback
+            for student_answer in question_answers:
                 student_answer.marks = 0
                 student_answer.feedback = "Answer submitted successfully. No reference answers available for automated grading."
-                student_answer.save()
-                
-                updated_answers = True
-                print(f"Question {question.pk}: No reference answers - provided default feedback")
-        elif student_answer:
-            # Answer already graded
-            total_score += student_answer.marks
-            graded_questions += 1
-            print(f"Question {question.pk} already graded: {student_answer.marks}/5")
+            print(f"Question {original_question.pk}: No reference answers - provided default feedback")
+        
+        SubjectiveAnswer.objects.bulk_update(question_answers, ['marks', 'feedback']) # type: ignore
+        updated_answers = True
     
     # Update exam score if we graded any new answers
     if updated_answers and graded_questions > 0: